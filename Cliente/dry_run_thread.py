@@ -0,0 +1,25 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+
+
+class DryRunThread(QThread):
+    """
+    Ejecuta la prueba de viabilidad (/experiment/dry_run) fuera del hilo de la interfaz:
+    el servidor puede tardar hasta 2 minutos. Emite la respuesta (dict) al terminar.
+    """
+    result_ready = pyqtSignal(dict)
+
+    def __init__(self, client, duration, interval, camera_ids=None, options=None):
+        super().__init__()
+        self.client = client
+        self.duration = duration
+        self.interval = interval
+        self.camera_ids = camera_ids
+        self.options = options
+
+    def run(self):
+        try:
+            resp = self.client.dry_run_experiment(self.duration, self.interval,
+                                                  camera_ids=self.camera_ids, options=self.options)
+        except Exception as e:
+            resp = {"status": "error", "message": str(e)}
+        self.result_ready.emit(resp)
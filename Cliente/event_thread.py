@@ -0,0 +1,75 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+import requests
+import json
+import time
+
+
+class EventThread(QThread):
+    """
+    Lee el stream /events (server-sent events) y emite cada evento como dict
+    {'id', 'type', 'time', 'data'}. Si la conexión se corta, reconecta pasando
+    Last-Event-ID para no perder eventos.
+    """
+    event_received = pyqtSignal(dict)
+    connection_changed = pyqtSignal(bool)
+
+    def __init__(self, url, retry_s=3.0):
+        super().__init__()
+        self.url = url
+        self.retry_s = retry_s
+        self.last_id = None
+        self._run_flag = True
+        self._response = None
+
+    def run(self):
+        while self._run_flag:
+            headers = {"Last-Event-ID": str(self.last_id)} if self.last_id else {}
+            try:
+                # Timeout de lectura de 60 s: el servidor manda un keepalive cada 15 s, así
+                # que un silencio más largo es una conexión muerta y se reconecta
+                self._response = requests.get(self.url, stream=True, headers=headers, timeout=(5, 60))
+                if self._response.status_code != 200:
+                    print(f"EventThread: el servidor respondió {self._response.status_code} para {self.url}")
+                else:
+                    self.connection_changed.emit(True)
+                    self._read(self._response)
+            except Exception as e:
+                if self._run_flag:
+                    print(f"EventThread error: {e}")
+            finally:
+                self._response = None
+            if self._run_flag:
+                self.connection_changed.emit(False)
+                time.sleep(self.retry_s)
+
+    def _read(self, response):
+        data_lines = []
+        for line in response.iter_lines(decode_unicode=True):
+            if not self._run_flag:
+                break
+            if line is None:
+                continue
+            if line == "":
+                # Línea vacía: fin del evento
+                if data_lines:
+                    try:
+                        event = json.loads("\n".join(data_lines))
+                        self.last_id = event.get("id", self.last_id)
+                        self.event_received.emit(event)
+                    except ValueError:
+                        pass
+                data_lines = []
+            elif line.startswith("data:"):
+                data_lines.append(line[5:].lstrip())
+            # 'id:', 'event:' y comentarios (keepalive) no hacen falta: el JSON trae id y tipo
+
+    def stop(self):
+        self._run_flag = False
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+        # El read bloqueado puede tardar hasta el próximo keepalive en soltarse
+        self.wait(5000)
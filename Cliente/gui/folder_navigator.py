@@ -72,7 +72,7 @@ class FolderNavigator(QWidget):
             # Normalizar ruta para el servidor
             normalized_path = self.current_path.replace('\\', '/') if self.current_path else ""
             
-            data = self.client.list_directory(normalized_path)
+            folders = self.client.list_folders(normalized_path)
             self.list_widget.clear()
             
             # Mostrar carpeta padre si no estamos en raíz
@@ -83,7 +83,7 @@ class FolderNavigator(QWidget):
                 self.list_widget.addItem(item)
             
             # Mostrar carpetas
-            for folder in data.get("folders", []):
+            for folder in folders:
                 item = QListWidgetItem(f"📁 {folder}")
                 item.setData(Qt.ItemDataRole.UserRole, os.path.join(normalized_path, folder))
                 item.setIcon(QIcon(":/icons/folder.png"))
@@ -102,6 +102,51 @@ class FolderNavigator(QWidget):
             error_item.setForeground(QBrush(QColor(255, 0, 0)))
             self.list_widget.addItem(error_item)
     
+    def on_dir_event(self, event):
+        """
+        Evento 'dir' del servidor: agrega o quita la carpeta en la lista si es del
+        directorio mostrado. Si se perdieron eventos ('gap' / 'rescan') se vuelve a listar.
+        """
+        data = event.get("data") or {}
+        if event.get("type") == "gap" or data.get("change") == "rescan":
+            self.refresh()
+            return
+        current = self.current_path.replace('\\', '/') if self.current_path else ""
+        path = data.get("path")
+        name = data.get("name")
+        if path is None or name is None:
+            return
+        full = f"{path}/{name}" if path else name
+        if data.get("change") == "removed" and (current == full or current.startswith(full + "/")):
+            # Se borró la carpeta mostrada (o una que la contiene): se sube hasta la que queda
+            self.current_path = path
+            self.refresh()
+            return
+        if path != current:
+            return
+        existing = self._folder_row(name)
+        if data.get("change") == "added" and existing is None:
+            item = QListWidgetItem(f"📁 {name}")
+            item.setData(Qt.ItemDataRole.UserRole, os.path.join(current, name))
+            item.setIcon(QIcon(":/icons/folder.png"))
+            self.list_widget.insertItem(self._insert_row(name), item)
+        elif data.get("change") == "removed" and existing is not None:
+            self.list_widget.takeItem(existing)
+
+    def _folder_row(self, name):
+        for row in range(self.list_widget.count()):
+            if self.list_widget.item(row).text() == f"📁 {name}":
+                return row
+        return None
+
+    def _insert_row(self, name):
+        """Fila que mantiene el orden alfabético (después de '..')."""
+        for row in range(self.list_widget.count()):
+            text = self.list_widget.item(row).text()
+            if text.startswith("📁 ") and text[2:].lower() > name.lower():
+                return row
+        return self.list_widget.count()
+
     def navigate_up(self):
         """Navega al directorio padre"""
         if not self.current_path:
@@ -92,3 +92,7 @@ class MainWindow(QMainWindow):
     def handle_led_intensity_change(self, value):
         # Futuro: enviar valor al servidor
         pass
+
+    def closeEvent(self, event):
+        self.tab_experimento.stop_events()
+        super().closeEvent(event)
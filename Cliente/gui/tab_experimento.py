@@ -2,14 +2,17 @@ from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QPushButton,
     QHBoxLayout, QLineEdit, QInputDialog, QSpinBox,
     QMessageBox, QFormLayout, QProgressBar, QFrame,
-    QGroupBox, QCheckBox, QScrollArea
+    QGroupBox, QCheckBox, QScrollArea, QComboBox, QDoubleSpinBox
 )
 from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QFont, QIcon
 from network import NetworkClient
+from event_thread import EventThread
+from dry_run_thread import DryRunThread
 from utils import format_duration
 from gui.folder_navigator import FolderNavigator
 import re
+import json
 
 
 class TabExperimento(QWidget):
@@ -19,6 +22,9 @@ class TabExperimento(QWidget):
         self.is_running = False
         self.time_left = 0
         self.server_folder = None  # Ruta relativa de la carpeta seleccionada
+        self.last_dry_run = None   # (configuración, resultado) de la última prueba de viabilidad
+        self.dry_run_thread = None # prueba de viabilidad en curso (hilo aparte)
+        self.experiment_id = None  # id asignado por el planificador del servidor
 
         # Cámaras detectadas y checkboxes
         self.cameras = []
@@ -26,12 +32,20 @@ class TabExperimento(QWidget):
         self.chk_all = None
 
         self.init_ui()
+        # Sólo refresca el reloj entre ticks; el tiempo real y el fin los informa el servidor
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_time_left)
 
         # Cargar listado de cámaras
         self.load_cameras()
 
+        # Eventos del servidor: progreso por tick, cambios de estado del experimento y
+        # carpetas creadas o borradas (el navegador se actualiza sin volver a listar)
+        self.event_thread = EventThread(self.client.get_events_url(["tick", "experiment", "dir"]))
+        self.event_thread.event_received.connect(self.on_server_event)
+        self.event_thread.connection_changed.connect(self.on_events_connection)
+        self.event_thread.start()
+
     def init_ui(self):
         layout = QVBoxLayout()
         layout.setSpacing(16)
@@ -94,6 +108,104 @@ class TabExperimento(QWidget):
 
         layout.addLayout(form_layout)
 
+        # === Opciones de captura ===
+        grp_opts = QGroupBox("Opciones de captura")
+        opts_layout = QFormLayout(grp_opts)
+        opts_layout.setLabelAlignment(Qt.AlignmentFlag.AlignRight)
+
+        # Apilado de ráfagas (reduce ruido)
+        self.stack_spin = QSpinBox()
+        self.stack_spin.setRange(1, 16)
+        self.stack_spin.setValue(1)
+        self.stack_spin.setToolTip("Frames consecutivos combinados en cada captura (1 = sin apilado)")
+        opts_layout.addRow("Frames por captura:", self.stack_spin)
+
+        self.stack_mode_combo = QComboBox()
+        self.stack_mode_combo.addItem("Media", "mean")
+        self.stack_mode_combo.addItem("Mediana", "median")
+        opts_layout.addRow("Combinación:", self.stack_mode_combo)
+
+        # Bracketing HDR con pasos de brillo LED
+        self.bracket_edit = QLineEdit()
+        self.bracket_edit.setPlaceholderText("ej. 25,50,100 (vacío = sin HDR)")
+        self.bracket_edit.setToolTip("Brillos LED (%) capturados en cada tick y fusionados en HDR")
+        opts_layout.addRow("Bracketing LED (%):", self.bracket_edit)
+
+        self.chk_keep_brackets = QCheckBox("Guardar también cada bracket")
+        opts_layout.addRow("", self.chk_keep_brackets)
+
+        # Captura por cambio (omite frames estáticos)
+        self.chk_change = QCheckBox("Guardar sólo si hay cambio")
+        opts_layout.addRow("", self.chk_change)
+
+        self.change_spin = QDoubleSpinBox()
+        self.change_spin.setRange(0.0, 255.0)
+        self.change_spin.setDecimals(1)
+        self.change_spin.setValue(2.0)
+        self.change_spin.setToolTip("Diferencia media mínima (0-255) respecto de la última imagen guardada")
+        opts_layout.addRow("Umbral de cambio:", self.change_spin)
+
+        self.keyframe_spin = QSpinBox()
+        self.keyframe_spin.setRange(1, 10000)
+        self.keyframe_spin.setValue(10)
+        self.keyframe_spin.setSuffix(" ticks")
+        self.keyframe_spin.setToolTip("Guarda una imagen cada K ticks aunque no haya cambio")
+        opts_layout.addRow("Imagen forzada cada:", self.keyframe_spin)
+
+        # Formato de almacenamiento
+        self.format_combo = QComboBox()
+        self.format_combo.addItem("JPEG", "jpeg")
+        self.format_combo.addItem("PNG (sin pérdida)", "png")
+        self.format_combo.addItem("WebP", "webp")
+        self.format_combo.addItem("Array crudo .npy", "npy")
+        opts_layout.addRow("Formato:", self.format_combo)
+
+        self.quality_spin = QSpinBox()
+        self.quality_spin.setRange(1, 100)
+        self.quality_spin.setValue(95)
+        self.quality_spin.setToolTip("Calidad JPEG / WebP")
+        opts_layout.addRow("Calidad:", self.quality_spin)
+
+        self.png_spin = QSpinBox()
+        self.png_spin.setRange(0, 9)
+        self.png_spin.setValue(3)
+        self.png_spin.setToolTip("Nivel de compresión PNG (más alto = más lento y más chico)")
+        opts_layout.addRow("Compresión PNG:", self.png_spin)
+
+        self.encode_workers_spin = QSpinBox()
+        self.encode_workers_spin.setRange(0, 4)
+        self.encode_workers_spin.setValue(0)
+        self.encode_workers_spin.setToolTip("Procesos dedicados a codificar (0 = hilo de escritura)")
+        opts_layout.addRow("Procesos de codificación:", self.encode_workers_spin)
+
+        self.chk_fresh = QCheckBox("Descartar frames viejos del driver antes de cada captura")
+        self.chk_fresh.setChecked(True)
+        self.chk_fresh.setToolTip("Evita imágenes tomadas antes de encender el LED (cuesta algunos ms)")
+        opts_layout.addRow("", self.chk_fresh)
+
+        self.chk_pack = QCheckBox("Un contenedor por cámara (.pack) en lugar de un archivo por captura")
+        opts_layout.addRow("", self.chk_pack)
+
+        self.chk_mid_previews = QCheckBox("Generar también vista intermedia (640 px) además de miniaturas")
+        opts_layout.addRow("", self.chk_mid_previews)
+
+        self.disk_policy_combo = QComboBox()
+        self.disk_policy_combo.addItem("Detener el experimento", "stop")
+        self.disk_policy_combo.addItem("Bajar calidad", "downgrade")
+        self.disk_policy_combo.addItem("Borrar miniaturas antiguas", "prune_thumbs")
+        opts_layout.addRow("Si el disco se llena:", self.disk_policy_combo)
+
+        self.delay_spin = QSpinBox()
+        self.delay_spin.setRange(0, 7 * 24 * 60)
+        self.delay_spin.setSuffix(" min")
+        self.delay_spin.setToolTip("Deja el experimento en cola y lo inicia pasado este tiempo")
+        opts_layout.addRow("Iniciar dentro de:", self.delay_spin)
+
+        self.chk_shared = QCheckBox("Compartir cámaras con otros experimentos (sólo lectura)")
+        opts_layout.addRow("", self.chk_shared)
+
+        layout.addWidget(grp_opts)
+
         # === Selección de cámaras ===
         grp = QGroupBox("Cámaras para el experimento")
         vgrp = QVBoxLayout(grp)
@@ -125,6 +237,17 @@ class TabExperimento(QWidget):
         """)
         self.btn_start.clicked.connect(self.start_experiment)
 
+        self.btn_dry_run = QPushButton("⏱ Probar viabilidad")
+        self.btn_dry_run.setToolTip("Ejecuta unos ticks de prueba y estima el intervalo mínimo seguro")
+        self.btn_dry_run.setStyleSheet("""
+            QPushButton { 
+                background-color: #2980B9; color: white; padding: 8px; 
+                border-radius: 6px; font-weight: bold;
+            }
+            QPushButton:hover { background-color: #3498DB; }
+        """)
+        self.btn_dry_run.clicked.connect(self.check_feasibility)
+
         self.btn_stop = QPushButton("⏹ Detener Experimento")
         self.btn_stop.setIcon(QIcon(":/icons/stop.png"))
         self.btn_stop.setStyleSheet("""
@@ -138,6 +261,7 @@ class TabExperimento(QWidget):
         self.btn_stop.setEnabled(False)
 
         btn_layout.addWidget(self.btn_start)
+        btn_layout.addWidget(self.btn_dry_run)
         btn_layout.addWidget(self.btn_stop)
         layout.addLayout(btn_layout)
 
@@ -147,6 +271,11 @@ class TabExperimento(QWidget):
         self.lbl_time_left.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.lbl_time_left)
 
+        # Último tick informado por el servidor
+        self.lbl_tick_info = QLabel("")
+        self.lbl_tick_info.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.lbl_tick_info)
+
         # Barra de progreso
         self.progress_bar = QProgressBar()
         self.progress_bar.setValue(0)
@@ -245,11 +374,98 @@ class TabExperimento(QWidget):
         selected = [cam_id for cam_id, cb in self.checkboxes if cb.isChecked()]
         return selected if selected else None
 
+    def experiment_options(self):
+        """Opciones de captura a enviar al servidor junto con /experiment/start."""
+        options = {
+            "stack_frames": self.stack_spin.value(),
+            "stack_mode": self.stack_mode_combo.currentData(),
+            "image_format": self.format_combo.currentData(),
+            "image_quality": self.quality_spin.value(),
+            "png_compression": self.png_spin.value(),
+            "encode_workers": self.encode_workers_spin.value(),
+            "container": "pack" if self.chk_pack.isChecked() else "files",
+            "mid_previews": self.chk_mid_previews.isChecked(),
+            "disk_policy": self.disk_policy_combo.currentData(),
+            "fresh_frames": self.chk_fresh.isChecked(),
+        }
+        bracket = [int(v) for v in re.findall(r'\d+', self.bracket_edit.text())]
+        if bracket:
+            options["bracket"] = bracket
+            options["keep_brackets"] = self.chk_keep_brackets.isChecked()
+        if self.chk_change.isChecked():
+            options["change_threshold"] = self.change_spin.value()
+            options["keyframe_every"] = self.keyframe_spin.value()
+        return options
+
+    # ------------------------------
+    #   Prueba de viabilidad
+    # ------------------------------
+    def _dry_run_key(self, interval, cam_ids, options):
+        return (interval, tuple(cam_ids or ()), json.dumps(options, sort_keys=True))
+
+    def run_dry_run(self, duration, interval, cam_ids, options, on_done):
+        """
+        Pide al servidor la prueba de viabilidad en un hilo aparte (puede tardar hasta
+        2 minutos) y llama a on_done(resp) al terminar. Guarda el resultado si salió bien.
+        Mientras corre, los botones de inicio y de prueba quedan deshabilitados.
+        """
+        if self.dry_run_thread is not None:
+            return
+        key = self._dry_run_key(interval, cam_ids, options)
+
+        def finished(resp):
+            self.dry_run_thread = None
+            self.btn_dry_run.setText("⏱ Probar viabilidad")
+            self.btn_dry_run.setEnabled(True)
+            self.btn_start.setEnabled(not self.is_running)
+            if resp.get("status") == "ok":
+                self.last_dry_run = (key, resp)
+            on_done(resp)
+
+        self.btn_start.setEnabled(False)
+        self.btn_dry_run.setEnabled(False)
+        self.btn_dry_run.setText("⏱ Probando...")
+        self.dry_run_thread = DryRunThread(self.client, duration, interval, camera_ids=cam_ids, options=options)
+        self.dry_run_thread.result_ready.connect(finished)
+        self.dry_run_thread.start()
+
+    def dry_run_summary(self, resp):
+        total = resp.get("total_s") or {}
+        capture = resp.get("capture_s") or {}
+        lines = [
+            f"Ticks de prueba: {resp.get('ticks')} (cámaras {resp.get('camera_ids')})",
+            f"Duración por tick (con guardado): p50 {total.get('p50')} s, "
+            f"p90 {total.get('p90')} s, p99 {total.get('p99')} s, máx {total.get('max')} s",
+            f"Ventana de captura (LED encendido): p50 {capture.get('p50')} s, máx {capture.get('max')} s",
+            f"Intervalo mínimo seguro: {resp.get('min_safe_interval')} s "
+            f"(configurado: {resp.get('interval')} s)",
+        ]
+        if resp.get("captures_failed"):
+            lines.append(f"Capturas fallidas durante la prueba: {resp.get('captures_failed')}")
+        plan = resp.get("disk_plan") or {}
+        if plan and not plan.get("fits", True):
+            lines.append("Advertencia: el experimento completo no entra en el disco")
+        return "\n".join(lines)
+
+    def check_feasibility(self):
+        self.run_dry_run(self.duration_spin.value(), self.interval_spin.value(),
+                         self.selected_camera_ids(), self.experiment_options(), self.show_feasibility)
+
+    def show_feasibility(self, resp):
+        if resp.get("status") != "ok":
+            QMessageBox.critical(self, "Error", f"No se pudo ejecutar la prueba:\n{resp.get('message', '')}")
+            return
+        if resp.get("interval_ok"):
+            QMessageBox.information(self, "Prueba de viabilidad", self.dry_run_summary(resp))
+        else:
+            QMessageBox.warning(self, "Prueba de viabilidad",
+                                self.dry_run_summary(resp) + "\n\nEl intervalo configurado es demasiado corto.")
+
     # ------------------------------
     #   Control de experimento
     # ------------------------------
     def start_experiment(self):
-        if self.is_running:
+        if self.is_running or self.dry_run_thread is not None:
             return
         if not self.server_folder:
             QMessageBox.warning(self, "Error", "Debe seleccionar una carpeta para el experimento")
@@ -263,39 +479,162 @@ class TabExperimento(QWidget):
         sanitized_path = self.server_folder.replace("\\", "/")
         cam_ids = self.selected_camera_ids()
 
-        resp = self.client.start_experiment(sanitized_path, duration, interval, camera_ids=cam_ids)
+        options = self.experiment_options()
+
+        # Corre la prueba de viabilidad si no se hizo para esta configuración; el inicio
+        # sigue cuando termina, con la configuración tomada ahora
+        key = self._dry_run_key(interval, cam_ids, options)
+        if self.last_dry_run and self.last_dry_run[0] == key:
+            self._start_after_dry_run(self.last_dry_run[1], sanitized_path, duration, interval,
+                                      cam_ids, options)
+        else:
+            self.run_dry_run(duration, interval, cam_ids, options,
+                             lambda resp: self._start_after_dry_run(resp, sanitized_path, duration,
+                                                                    interval, cam_ids, options))
+
+    def _start_after_dry_run(self, dry, sanitized_path, duration, interval, cam_ids, options):
+        """
+        Pide confirmación si la prueba falló, tuvo capturas fallidas o el intervalo es menor
+        al mínimo seguro; si no, inicia el experimento.
+        """
+        if self.is_running:
+            return
+        if dry.get("status") != "ok":
+            answer = QMessageBox.question(
+                self, "Prueba de viabilidad fallida",
+                f"No se pudo ejecutar la prueba de viabilidad:\n{dry.get('message', '')}\n\n"
+                "¿Iniciar de todos modos?"
+            )
+            if answer != QMessageBox.StandardButton.Yes:
+                return
+        elif not dry.get("interval_ok", True) or dry.get("captures_failed"):
+            title = "Intervalo demasiado corto" if not dry.get("interval_ok", True) \
+                else "Capturas fallidas en la prueba"
+            answer = QMessageBox.question(
+                self, title, f"{self.dry_run_summary(dry)}\n\n¿Iniciar de todos modos?"
+            )
+            if answer != QMessageBox.StandardButton.Yes:
+                return
+
+        # Planificación: no forma parte de la prueba de viabilidad
+        delay_sec = self.delay_spin.value() * 60
+        options["delay_sec"] = delay_sec
+        options["shared"] = self.chk_shared.isChecked()
+
+        resp = self.client.start_experiment(sanitized_path, duration, interval, camera_ids=cam_ids,
+                                            options=options)
+        if resp.get("status") == "error" and resp.get("disk_plan"):
+            answer = QMessageBox.question(
+                self, "Espacio insuficiente",
+                f"{resp.get('message', '')}\n\n¿Iniciar de todos modos?"
+            )
+            if answer != QMessageBox.StandardButton.Yes:
+                return
+            options["force"] = True
+            resp = self.client.start_experiment(sanitized_path, duration, interval, camera_ids=cam_ids,
+                                                options=options)
         if resp.get("status") == "ok":
             self.is_running = True
-            self.time_left = duration
+            self.experiment_id = resp.get("experiment_id")
+            self.time_left = duration + (delay_sec if resp.get("state") == "queued" else 0)
             self.btn_start.setEnabled(False)
             self.btn_stop.setEnabled(True)
-            self.timer.start(1000)
+            self.lbl_tick_info.setText("")
+            if resp.get("state") != "queued":
+                self.timer.start(1000)
             used = resp.get("camera_ids", cam_ids or "todas")
-            QMessageBox.information(self, "Experimento iniciado", f"Cámaras utilizadas: {used}")
+            if resp.get("state") == "queued":
+                QMessageBox.information(self, "Experimento programado",
+                                        f"Se iniciará en {self.delay_spin.value()} min.\n"
+                                        f"Cámaras utilizadas: {used}")
+            else:
+                QMessageBox.information(self, "Experimento iniciado", f"Cámaras utilizadas: {used}")
         else:
             QMessageBox.critical(self, "Error", f"No se pudo iniciar experimento:\n{resp.get('message', '')}")
 
     def stop_experiment(self):
         if not self.is_running:
             return
-        resp = self.client.stop_experiment()
+        resp = self.client.stop_experiment(self.experiment_id)
         if resp.get("status") == "ok":
-            self.is_running = False
-            self.timer.stop()
-            self.time_left = 0
-            self.btn_start.setEnabled(True)
-            self.btn_stop.setEnabled(False)
-            self.lbl_time_left.setText("Tiempo restante: --:--:--")
-            self.progress_bar.setValue(0)
-            self.folder_navigator.refresh()
+            self.experiment_ended()
         else:
             QMessageBox.critical(self, "Error", f"No se pudo detener experimento:\n{resp.get('message', '')}")
 
+    def experiment_ended(self, message=None):
+        """Deja los controles listos para otro experimento."""
+        self.is_running = False
+        self.experiment_id = None
+        self.timer.stop()
+        self.time_left = 0
+        self.btn_start.setEnabled(True)
+        self.btn_stop.setEnabled(False)
+        self.lbl_time_left.setText(message or "Tiempo restante: --:--:--")
+        self.progress_bar.setValue(0)
+
     def update_time_left(self):
+        # Cuenta regresiva visual entre ticks: el fin lo decide el evento del servidor
         if self.time_left > 0:
             self.time_left -= 1
-            self.lbl_time_left.setText(f"Tiempo restante: {format_duration(self.time_left)}")
-            total = self.duration_spin.value()
-            self.progress_bar.setValue(int(100 * (total - self.time_left) / total))
-        else:
-            self.stop_experiment()
+            self.show_time_left()
+
+    def show_time_left(self):
+        self.lbl_time_left.setText(f"Tiempo restante: {format_duration(self.time_left)}")
+        total = self.duration_spin.value()
+        self.progress_bar.setValue(int(100 * (total - self.time_left) / total))
+
+    # ------------------------------
+    #   Eventos del servidor
+    # ------------------------------
+    def on_server_event(self, event):
+        data = event.get("data") or {}
+        if event.get("type") == "gap":
+            # Se perdieron eventos: se relee la carpeta y se consulta el experimento
+            self.folder_navigator.on_dir_event(event)
+            self.on_events_connection(True)
+            return
+        if event.get("type") == "dir":
+            self.folder_navigator.on_dir_event(event)
+            return
+        if not self.is_running or data.get("experiment_id") != self.experiment_id:
+            return
+        if event.get("type") == "tick":
+            self.time_left = int(data.get("remaining_s") or 0)
+            self.show_time_left()
+            counts = data.get("captures") or {}
+            failed = [str(cam_id) for cam_id, r in (data.get("results") or {}).items() if r.get("error")]
+            text = (f"Tick {data.get('tick')} · guardadas {counts.get('stored', 0)} · "
+                    f"omitidas {counts.get('skipped', 0)} · fallidas {counts.get('failed', 0)}")
+            if failed:
+                text += f" (última falla en cámara {', '.join(failed)})"
+            self.lbl_tick_info.setText(text)
+        elif event.get("type") == "experiment":
+            self.on_experiment_state(data)
+
+    def on_experiment_state(self, data):
+        state = data.get("state")
+        if state == "running":
+            self.time_left = self.duration_spin.value()
+            self.show_time_left()
+            self.timer.start(1000)
+        elif state == "error":
+            self.experiment_ended("Experimento con error")
+            QMessageBox.critical(self, "Experimento con error", data.get("error") or "Error desconocido")
+        elif state in ("finished", "cancelled"):
+            reason = data.get("stop_reason")
+            self.experiment_ended("Experimento finalizado" + (f" ({reason})" if reason else ""))
+
+    def on_events_connection(self, connected):
+        """Al (re)conectar se consulta el estado por si el experimento terminó sin vernos."""
+        if not connected or not self.is_running:
+            return
+        resp = self.client.list_experiments()
+        for job in resp.get("experiments", []) if isinstance(resp, dict) else []:
+            if job.get("experiment_id") == self.experiment_id and \
+                    job.get("state") in ("finished", "cancelled", "error"):
+                self.on_experiment_state(job)
+
+    def stop_events(self):
+        self.event_thread.stop()
+        if self.dry_run_thread is not None:
+            self.dry_run_thread.wait(1000)
@@ -1,3 +1,4 @@
+import os
 import requests
 from requests.exceptions import RequestException
 from config import BASE_URL
@@ -6,6 +7,8 @@ from config import BASE_URL
 class NetworkClient:
     def __init__(self):
         self.base_url = BASE_URL.rstrip("/")
+        # Listados de directorio ya recibidos: {parámetros: (ETag, respuesta)}
+        self._dir_cache = {}
 
     # ---------- Cámaras / Streaming ----------
     def get_cameras(self):
@@ -20,6 +23,11 @@ class NetworkClient:
     def get_video_feed_url(self, cam_id):
         return f"{self.base_url}/video_feed/{cam_id}"
 
+    def get_events_url(self, types=None):
+        """URL del stream de eventos (SSE); types: lista como ['tick', 'experiment']."""
+        url = f"{self.base_url}/events"
+        return f"{url}?types={','.join(types)}" if types else url
+
     # ---------- LEDs: ON/OFF por cámara ----------
     def led_control(self, cam_id, action):
         """
@@ -87,9 +95,10 @@ class NetworkClient:
             return {}
 
     # ---------- Experimento ----------
-    def start_experiment(self, save_path, duration, interval, camera_ids=None):
+    def start_experiment(self, save_path, duration, interval, camera_ids=None, options=None):
         """
         Inicia un experimento. Si camera_ids es None o [], el servidor usará todas las cámaras.
+        options: dict opcional con parámetros de captura (p.ej. stack_frames, stack_mode).
         """
         try:
             payload = {
@@ -99,15 +108,55 @@ class NetworkClient:
             }
             if camera_ids:
                 payload["camera_ids"] = list(map(int, camera_ids))
-            r = requests.post(f"{self.base_url}/experiment/start", json=payload, timeout=8)
+            if options:
+                payload.update(options)
+            # El servidor mide una captura por cámara para estimar el disco: puede tardar
+            r = requests.post(f"{self.base_url}/experiment/start", json=payload, timeout=15)
+            if r.status_code == 507:
+                # No entra en disco: se devuelve el plan para que la GUI pregunte si forzar
+                return r.json()
+            r.raise_for_status()
+            return r.json()
+        except RequestException as e:
+            return {"status": "error", "message": str(e)}
+
+    def dry_run_experiment(self, duration, interval, camera_ids=None, options=None, ticks=None):
+        """
+        Prueba de viabilidad: el servidor ejecuta unos ticks reales con las mismas opciones,
+        descarta lo escrito y devuelve percentiles de duración e intervalo mínimo seguro.
+        """
+        try:
+            payload = {"duration": int(duration), "interval": int(interval)}
+            if camera_ids:
+                payload["camera_ids"] = list(map(int, camera_ids))
+            if options:
+                payload.update(options)
+            if ticks:
+                payload["ticks"] = int(ticks)
+            # Cada tick simulado enciende el LED y escribe a disco: puede tardar varios segundos
+            r = requests.post(f"{self.base_url}/experiment/dry_run", json=payload, timeout=120)
+            if r.status_code in (400, 409):
+                return r.json()
             r.raise_for_status()
             return r.json()
         except RequestException as e:
             return {"status": "error", "message": str(e)}
 
-    def stop_experiment(self):
+    def stop_experiment(self, experiment_id=None):
+        """Detiene el experimento indicado; sin id, todos los activos y en cola."""
         try:
-            r = requests.post(f"{self.base_url}/experiment/stop", timeout=5)
+            payload = {"experiment_id": experiment_id} if experiment_id is not None else {}
+            # Espera a que termine el tick en curso
+            r = requests.post(f"{self.base_url}/experiment/stop", json=payload, timeout=15)
+            r.raise_for_status()
+            return r.json()
+        except RequestException as e:
+            return {"status": "error", "message": str(e)}
+
+    def list_experiments(self):
+        """Experimentos en ejecución, en cola y terminados recientes."""
+        try:
+            r = requests.get(f"{self.base_url}/experiments", timeout=5)
             r.raise_for_status()
             return r.json()
         except RequestException as e:
@@ -165,24 +214,118 @@ class NetworkClient:
         except RequestException:
             return {}
 
+    def get_status_history(self, since=0, fields=None):
+        """
+        Métricas del sistema posteriores a 'since' en columnas ({campo: [valores]}).
+        Guardar 'last_seq' y pasarlo en la próxima llamada para traer sólo lo nuevo.
+        """
+        try:
+            params = {"since": since}
+            if fields:
+                params["fields"] = ",".join(fields)
+            r = requests.get(f"{self.base_url}/status/history", params=params, timeout=5)
+            r.raise_for_status()
+            return r.json()
+        except RequestException as e:
+            return {"status": "error", "message": str(e)}
+
+    def get_thumbnail_url(self, image_path, size="thumb"):
+        """URL de la miniatura de una captura (ruta relativa al directorio base)."""
+        return requests.Request(
+            "GET", f"{self.base_url}/thumbnail", params={"path": image_path, "size": size}
+        ).prepare().url
+
     # ---------- Archivos / Carpetas ----------
-    def list_directory(self, sub_path=""):
+    def list_directory(self, sub_path="", folders_only=False, sort=None, order=None,
+                       name_filter=None, cursor=None, limit=None):
         """
-        Obtiene la lista de carpetas y archivos dentro de un subdirectorio del directorio base.
+        Obtiene una página de carpetas y archivos dentro de un subdirectorio del directorio base
+        (next_cursor indica la siguiente). Reusa la respuesta anterior si el servidor contesta 304.
         Lanza Exception con mensaje de alto nivel si algo falla.
         """
+        params = {"path": sub_path} if sub_path else {}
+        if folders_only:
+            params["folders_only"] = 1
+        for key, value in (("sort", sort), ("order", order), ("filter", name_filter),
+                           ("cursor", cursor), ("limit", limit)):
+            if value:
+                params[key] = value
+        cache_key = tuple(sorted(params.items()))
+        cached = self._dir_cache.get(cache_key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
         try:
-            params = {"path": sub_path} if sub_path else {}
-            r = requests.get(f"{self.base_url}/list_dir", params=params, timeout=5)
+            r = requests.get(f"{self.base_url}/list_dir", params=params, headers=headers, timeout=5)
+            if r.status_code == 304 and cached:
+                return cached[1]
             r.raise_for_status()
             data = r.json()
             if data.get("status") == "success":
+                if r.headers.get("ETag"):
+                    self._dir_cache[cache_key] = (r.headers["ETag"], data)
                 return data
             else:
                 raise Exception(data.get("message", "Error al listar directorio"))
         except (RequestException, ValueError) as e:
             raise Exception(f"No se pudo listar directorio: {e}")
 
+    def list_folders(self, sub_path=""):
+        """Todas las subcarpetas de sub_path (recorre las páginas, sin traer archivos)."""
+        folders, cursor = [], None
+        while True:
+            data = self.list_directory(sub_path, folders_only=True, cursor=cursor)
+            folders.extend(data.get("folders", []))
+            cursor = data.get("next_cursor")
+            if not cursor:
+                return folders
+
+    # ---------- Descargas ----------
+    def download_file(self, path, dest_path, chunk_size=256 * 1024):
+        """
+        Descarga un archivo del servidor a dest_path. Si ya hay una parte descargada
+        se continúa desde ahí (Range). Devuelve los bytes escritos en esta llamada.
+        """
+        done = os.path.getsize(dest_path) if os.path.exists(dest_path) else 0
+        headers = {"Range": f"bytes={done}-"} if done else {}
+        try:
+            with requests.get(f"{self.base_url}/download", params={"path": path},
+                              headers=headers, stream=True, timeout=30) as r:
+                if r.status_code == 416:
+                    return 0  # ya estaba completo
+                r.raise_for_status()
+                # 206: continúa; 200: el servidor mandó el archivo entero
+                mode = "ab" if r.status_code == 206 else "wb"
+                written = 0
+                with open(dest_path, mode) as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        written += len(chunk)
+                return written
+        except RequestException as e:
+            raise Exception(f"No se pudo descargar {path}: {e}")
+
+    def download_archive(self, path, dest_path, fmt="zip", name_filter=None, camera_ids=None,
+                         derivatives=True, chunk_size=256 * 1024):
+        """Descarga una carpeta como zip/tar generado por el servidor (sin cargarlo en memoria)."""
+        params = {"path": path, "format": fmt}
+        if name_filter:
+            params["filter"] = name_filter
+        if camera_ids:
+            params["cams"] = ",".join(str(c) for c in camera_ids)
+        if not derivatives:
+            params["derivatives"] = 0
+        try:
+            with requests.get(f"{self.base_url}/download/archive", params=params,
+                              stream=True, timeout=30) as r:
+                r.raise_for_status()
+                written = 0
+                with open(dest_path, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        written += len(chunk)
+                return written
+        except RequestException as e:
+            raise Exception(f"No se pudo descargar {path}: {e}")
+
     def create_folder(self, folder_path):
         """
         Crea una carpeta (o estructura de carpetas) en el servidor.
@@ -14,6 +14,10 @@ class VideoThread(QThread):
     def run(self):
         try:
             stream = requests.get(self.url, stream=True, timeout=10)
+            if stream.status_code != 200:
+                # p.ej. 503: se alcanzó el máximo de espectadores de la cámara
+                print(f"VideoThread: el servidor respondió {stream.status_code} para {self.url}")
+                return
             bytes_data = b''
             for chunk in stream.iter_content(chunk_size=1024):
                 if not self._run_flag:
@@ -0,0 +1,119 @@
+import fnmatch
+import os
+import re
+import tarfile
+import zipfile
+
+from thumbnails import THUMB_DIR, MID_DIR
+
+ARCHIVE_FORMATS = ("zip", "tar")
+# Tamaño de lectura de cada archivo: la memoria usada no depende del tamaño del experimento
+CHUNK_BYTES = 256 * 1024
+
+_CAMERA_DIR = re.compile(r"^Microscopio(\d+)$")
+_TAR_BLOCK = tarfile.BLOCKSIZE
+
+
+def iter_files(root, pattern=None, cam_ids=None, derivatives=True, base=None):
+    """
+    Recorre 'root' en orden y genera (ruta absoluta, ruta dentro del archivo).
+    pattern: comodines sobre la ruta relativa (p.ej. '*.jpg'); cam_ids: sólo esas
+    carpetas MicroscopioN; derivatives=False omite miniaturas y vistas intermedias.
+    Los enlaces simbólicos que apuntan fuera de 'base' (por defecto 'root') se omiten;
+    a las carpetas enlazadas no se entra.
+    """
+    base_real = os.path.realpath(base or root)
+    prefix = os.path.basename(os.path.normpath(root))
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        rel_dir = "" if rel_dir == "." else rel_dir.replace(os.sep, "/")
+        if not derivatives:
+            dirnames[:] = [d for d in dirnames if d not in (THUMB_DIR, MID_DIR)]
+        if cam_ids is not None and not rel_dir:
+            dirnames[:] = [d for d in dirnames
+                           if not _CAMERA_DIR.match(d) or int(_CAMERA_DIR.match(d).group(1)) in cam_ids]
+        dirnames.sort()
+        for name in sorted(filenames):
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            if pattern and not fnmatch.fnmatch(rel, pattern) and not fnmatch.fnmatch(name, pattern):
+                continue
+            abs_path = os.path.join(dirpath, name)
+            if os.path.islink(abs_path) and \
+                    os.path.commonpath([base_real, os.path.realpath(abs_path)]) != base_real:
+                continue
+            yield abs_path, f"{prefix}/{rel}"
+
+
+class _ChunkSink:
+    """Destino de escritura sin seek: acumula lo escrito hasta que el generador lo entrega."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def zip_stream(files):
+    """
+    ZIP generado al vuelo sobre un stream sin seek (descriptores de datos tras cada
+    archivo). ZIP_STORED: las capturas ya están comprimidas y así no se gasta CPU.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for abs_path, arcname in files:
+            try:
+                zinfo = zipfile.ZipInfo.from_file(abs_path, arcname)
+                src = open(abs_path, "rb")
+            except OSError:
+                continue   # borrado mientras se armaba el archivo
+            zinfo.compress_type = zipfile.ZIP_STORED
+            with src, zf.open(zinfo, "w", force_zip64=zinfo.file_size >= zipfile.ZIP64_LIMIT) as dst:
+                while True:
+                    chunk = src.read(CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def tar_stream(files):
+    """
+    TAR (formato PAX) generado al vuelo: cabecera de tarfile y el contenido leído en
+    bloques, sin pasar cada archivo entero por memoria como haría TarFile.addfile.
+    """
+    for abs_path, arcname in files:
+        try:
+            src = open(abs_path, "rb")
+            st = os.fstat(src.fileno())
+        except OSError:
+            continue
+        with src:
+            info = tarfile.TarInfo(arcname)
+            info.size = st.st_size
+            info.mtime = int(st.st_mtime)
+            info.mode = 0o644
+            yield info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+            remaining = info.size
+            while remaining > 0:
+                chunk = src.read(min(CHUNK_BYTES, remaining))
+                if not chunk:
+                    # Se truncó mientras se leía: se completa con ceros para respetar la cabecera
+                    chunk = b"\0" * min(CHUNK_BYTES, remaining)
+                remaining -= len(chunk)
+                yield chunk
+            padding = -info.size % _TAR_BLOCK
+            if padding:
+                yield b"\0" * padding
+    # Fin del archivo: dos bloques vacíos
+    yield b"\0" * (2 * _TAR_BLOCK)
@@ -0,0 +1,127 @@
+import time
+import zlib
+
+HEALTH_STATES = ("ok", "degraded", "failed")
+
+# Lecturas fallidas seguidas / frames idénticos seguidos que marcan la cámara como caída
+FAILURE_STREAK_LIMIT = 5
+DUPLICATE_STREAK_LIMIT = 30
+# Latencia de lectura a partir de la cual la cámara se considera degradada
+SLOW_READ_S = 1.0
+# Espera entre reinicios del dispositivo: se duplica en cada intento fallido
+RESET_BACKOFF_MIN_S = 1.0
+RESET_BACKOFF_MAX_S = 60.0
+# Submuestreo usado para detectar frames congelados (idénticos byte a byte)
+_SIGNATURE_STEP = 16
+
+
+def frame_signature(frame):
+    """
+    CRC de una muestra de píxeles, o None si la muestra es uniforme (p.ej. negro con el
+    LED apagado): una imagen uniforme se repite legítimamente y no indica congelamiento.
+    """
+    sample = frame[::_SIGNATURE_STEP, ::_SIGNATURE_STEP]
+    if int(sample.max()) - int(sample.min()) < 2:
+        return None
+    return zlib.crc32(sample.tobytes())
+
+
+class CameraHealth:
+    """
+    Salud de una cámara a partir de sus lecturas: latencia, rachas de fallos y de
+    frames duplicados (cámara congelada que sigue "abierta").
+    Cuando queda 'failed', should_reset() habilita reiniciar el dispositivo con
+    espera exponencial entre intentos; una lectura buena vuelve a 'ok' y reinicia
+    la espera. Las reaperturas fallidas del dispositivo tienen su propia espera
+    (can_open / record_open) para no recrear la captura en cada lectura.
+    """
+
+    def __init__(self):
+        self.reads = 0
+        self.failures = 0
+        self.failure_streak = 0
+        self.duplicate_streak = 0
+        self.last_latency_ms = None
+        self.avg_latency_ms = None
+        self.last_ok = None
+        self.resets = 0
+        self.backoff_s = RESET_BACKOFF_MIN_S
+        self.next_reset_at = 0.0
+        self.open_failures = 0
+        self.open_backoff_s = RESET_BACKOFF_MIN_S
+        self.next_open_at = 0.0
+        self._last_signature = None
+
+    def record_read(self, ok, latency_s, frame=None):
+        self.reads += 1
+        ms = latency_s * 1000.0
+        self.last_latency_ms = round(ms, 2)
+        # Media móvil exponencial: refleja la tendencia sin guardar historial
+        self.avg_latency_ms = round(ms if self.avg_latency_ms is None
+                                    else 0.9 * self.avg_latency_ms + 0.1 * ms, 2)
+        if not ok or frame is None:
+            self.failures += 1
+            self.failure_streak += 1
+            return
+        self.failure_streak = 0
+        signature = frame_signature(frame)
+        if signature is not None and signature == self._last_signature:
+            self.duplicate_streak += 1
+        else:
+            self.duplicate_streak = 0
+            self.last_ok = time.time()
+            self.backoff_s = RESET_BACKOFF_MIN_S  # lectura buena: se reinicia la espera
+        self._last_signature = signature
+
+    @property
+    def state(self):
+        if self.failure_streak >= FAILURE_STREAK_LIMIT or self.duplicate_streak >= DUPLICATE_STREAK_LIMIT:
+            return "failed"
+        if self.failure_streak or self.duplicate_streak > 1 or \
+                (self.last_latency_ms or 0) >= SLOW_READ_S * 1000.0:
+            return "degraded"
+        return "ok"
+
+    def should_reset(self, now=None):
+        return self.state == "failed" and (now or time.time()) >= self.next_reset_at
+
+    def note_reset(self, now=None):
+        """Registra un reinicio y programa el próximo intento posible."""
+        now = now or time.time()
+        self.resets += 1
+        self.next_reset_at = now + self.backoff_s
+        self.backoff_s = min(RESET_BACKOFF_MAX_S, self.backoff_s * 2)
+        # Nueva oportunidad: las rachas se vuelven a medir con el dispositivo reabierto
+        self.failure_streak = 0
+        self.duplicate_streak = 0
+        self._last_signature = None
+
+    def can_open(self, now=None):
+        return (now or time.time()) >= self.next_open_at
+
+    def record_open(self, ok, now=None):
+        """Registra un intento de abrir el dispositivo; si falló, espera antes del próximo."""
+        if ok:
+            self.open_backoff_s = RESET_BACKOFF_MIN_S
+            self.next_open_at = 0.0
+            return
+        now = now or time.time()
+        self.open_failures += 1
+        self.next_open_at = now + self.open_backoff_s
+        self.open_backoff_s = min(RESET_BACKOFF_MAX_S, self.open_backoff_s * 2)
+
+    def status(self):
+        return {
+            'state': self.state,
+            'reads': self.reads,
+            'failures': self.failures,
+            'failure_streak': self.failure_streak,
+            'duplicate_streak': self.duplicate_streak,
+            'last_latency_ms': self.last_latency_ms,
+            'avg_latency_ms': self.avg_latency_ms,
+            'last_ok': self.last_ok,
+            'resets': self.resets,
+            'next_reset_in_s': max(0.0, round(self.next_reset_at - time.time(), 1)) if self.resets else None,
+            'open_failures': self.open_failures,
+            'next_open_in_s': max(0.0, round(self.next_open_at - time.time(), 1)) if self.next_open_at else None,
+        }
@@ -1,17 +1,95 @@
 import cv2
 import threading
 import time
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 import os
 
+from config import (RING_BUFFER_MAX_BYTES, MAX_VIEWERS_PER_CAMERA, USB_BUDGET_BYTES_PER_S,
+                    USB_AUTO_PLAN, CAPTURE_PROCESSES, CAPTURE_PROCESS_SLOTS, CAPTURE_PROCESS_FRAME_BYTES)
+from ring_buffer import RingRecorder
+from camera_priority import PriorityLock, PRIORITY_PREVIEW, PRIORITY_BACKGROUND, PRIORITY_CAPTURE
+from camera_properties import (PROPERTIES, APPLY_ORDER, DEFAULT_PROFILES, SWITCH_DISCARD_FRAMES,
+                               read_property, write_property, validate_properties)
+from camera_health import CameraHealth
+from camera_process import ProcessCapture
+from preview_pipeline import PreviewPipeline, PREVIEW_THROTTLED_FPS, PREVIEW_WIDTH, PREVIEW_QUALITY
+from usb_bandwidth import plan_bus, MIN_FPS, DEFAULT_MIN_FPS, DEFAULT_FOURCC, DEFAULT_FPS
+
+# Perfil con el que lee la vista en vivo (modo liviano para el bus USB). Las capturas
+# piden su propio perfil dentro de capture_window, donde la vista no lee la cámara;
+# al terminar el tick la vista vuelve a este perfil en su próxima lectura
+PREVIEW_SOURCE_PROFILE = "preview"
+
+# Slots de captura en proceso si ningún perfil fija el tamaño (BGR)
+PROCESS_FALLBACK_PREVIEW_BYTES = 640 * 480 * 3
+PROCESS_FALLBACK_FRAME_BYTES = 1920 * 1080 * 3
+
+# Captura "fresca": máximo de buffers viejos a descartar antes de aceptar un frame.
+# Un grab() que vuelve en menos de media duración de frame salió de la cola del driver.
+FRESH_MAX_DRAIN = 8
+# Diferencia máxima aceptada entre el timestamp del buffer y el reloj monotónico
+# (si el backend no entrega timestamps monotónicos se usa el tiempo de grab())
+FRESH_TIMESTAMP_TOLERANCE_MS = 10000
+
 class CameraManager:
-    def __init__(self, max_cams=5):
+    def __init__(self, max_cams=5, ring_budget_bytes=RING_BUFFER_MAX_BYTES,
+                 max_viewers=MAX_VIEWERS_PER_CAMERA, usb_budget=USB_BUDGET_BYTES_PER_S,
+                 capture_processes=CAPTURE_PROCESSES, events=None):
         self.max_cams = max_cams
+        # EventBus opcional: refresh_cameras publica eventos 'camera' (added / removed)
+        self.events = events
+        # Captura en un proceso por cámara (frames por memoria compartida) o en este proceso
+        self.capture_processes = bool(capture_processes)
         self.cameras = self.detect_cameras()                  # [0,1,2,...]
-        self.locks = {cam: threading.Lock() for cam in self.cameras}
-        self.captures = {cam: cv2.VideoCapture(cam) for cam in self.cameras}
+        # Locks con prioridad: las capturas pasan antes que la vista en vivo
+        self.locks = {cam: PriorityLock() for cam in self.cameras}
+
+        # Propiedades V4L2: perfiles con nombre, perfil activo y lecturas memoizadas
+        self.profiles = {name: dict(values) for name, values in DEFAULT_PROFILES.items()}
+        self._props = {}            # cam_id -> {propiedad: valor leído}
+        self._active_profile = {}   # cam_id -> nombre del perfil aplicado (None = ajustes sueltos)
+        self._switch_stats = {}     # cam_id -> cambios de perfil y su costo
+        # Ajustes por cámara sobre los perfiles (los elige el planificador del bus USB)
+        self._profile_overrides = {}  # cam_id -> {perfil: {propiedad: valor}}
+        # Perfil de la vista en vivo (también fija el tamaño de los slots en proceso)
+        self.preview_source_profile = PREVIEW_SOURCE_PROFILE
+
+        self.captures = {}
+        for cam in self.cameras:
+            self.captures[cam] = self._open_capture(cam)
         self.running = True
 
+        # Arbitraje vista en vivo / experimentos
+        self.max_viewers = int(max_viewers)
+        self.viewers = {}           # cam_id -> espectadores de /video_feed
+        self._capturing = {}        # cam_id -> ventanas de captura activas
+        self._capture_waits = {}    # cam_id -> esperas del lock en capturas (ms)
+        # Salud por cámara (latencia, fallos, frames congelados) y reinicios con espera
+        self.health = {cam: CameraHealth() for cam in self.cameras}
+        self._drain_stats = {}      # cam_id -> costo de descartar buffers viejos
+        self._state_lock = threading.Lock()
+        # Vista en vivo compartida por cámara (una lectura y un encode por ciclo)
+        self.pipelines = {}         # cam_id -> PreviewPipeline
+
+        # Buffers circulares pre-disparo (opcionales, por cámara)
+        self.ring_budget_bytes = int(ring_budget_bytes)
+        self.rings = {}   # cam_id -> RingRecorder
+
+        # Presupuesto del bus USB compartido: con varias cámaras se planifica al iniciar
+        # (al final: abre las cámaras y anota su salud, así que todo el estado ya existe)
+        self.usb_budget = int(usb_budget)
+        self.usb_plan = None
+        if len(self.cameras) > 1:
+            try:
+                self.usb_plan = self.plan_usb_bandwidth(apply=USB_AUTO_PLAN)
+                for name, plan in self.usb_plan['profiles'].items():
+                    if plan['oversubscribed']:
+                        print(f"[CameraManager] Bus USB sobresuscrito en perfil '{name}': "
+                              f"{plan['planned_bytes_per_s'] / 1e6:.1f} de {self.usb_budget / 1e6:.1f} MB/s")
+            except Exception as e:
+                print(f"[CameraManager] No se pudo planificar el bus USB: {e}")
+
     # ---------- Descubrimiento / utilidades ----------
     def detect_cameras(self):
         cams = []
@@ -29,85 +107,559 @@ class CameraManager:
     def refresh_cameras(self):
         """
         Re-detecta cámaras y abre/cierra capturas según haga falta.
-        Mantiene locks para cámaras que persisten; crea para nuevas; elimina para las que ya no están.
+        Mantiene locks para cámaras que persisten; crea para nuevas; de las que ya no están
+        libera todo su estado (ver _forget_camera).
         """
         found = self.detect_cameras()
         new_set, old_set = set(found), set(self.cameras)
 
-        # Cerrar las que ya no existen
+        # Crear las nuevas (antes de publicarlas en self.cameras)
+        for cam in (new_set - old_set):
+            self.locks[cam] = PriorityLock()
+            self.health[cam] = CameraHealth()
+            self.captures[cam] = self._open_capture(cam)
+
+        # Las que ya no existen dejan de aceptar pedidos antes de cerrarse
+        self.cameras = sorted(found)
         for cam in (old_set - new_set):
-            try:
-                cap = self.captures.pop(cam, None)
+            self._forget_camera(cam)
+        if self.events:
+            for cam in sorted(new_set - old_set):
+                self.events.publish("camera", {'cam_id': cam, 'change': 'added', 'cameras': self.cameras})
+            for cam in sorted(old_set - new_set):
+                self.events.publish("camera", {'cam_id': cam, 'change': 'removed', 'cameras': self.cameras})
+        return self.cameras
+
+    # ---------- Internos ----------
+    def _forget_camera(self, cam_id):
+        """
+        Cierra una cámara desconectada: buffer circular, vista en vivo (sus streams
+        terminan), captura (con captura en procesos, el proceso y su memoria compartida)
+        y todo el estado por cámara, para que una cámara nueva con el mismo id empiece
+        de cero.
+        """
+        self.disable_ring_buffer(cam_id)
+        with self._state_lock:
+            pipeline = self.pipelines.pop(cam_id, None)
+        if pipeline is not None:
+            pipeline.stop()
+        lock = self.locks.get(cam_id)
+        try:
+            # Espera a que termine la lectura en curso (si la hay) antes de cerrar
+            with lock.hold(PRIORITY_CAPTURE) if lock is not None else nullcontext():
+                cap = self.captures.pop(cam_id, None)
                 if cap is not None:
                     cap.release()
-            except Exception:
-                pass
-            self.locks.pop(cam, None)
+        except Exception:
+            pass
+        self.locks.pop(cam_id, None)
+        self.health.pop(cam_id, None)
+        with self._state_lock:
+            for state in (self._props, self._active_profile, self._switch_stats, self._drain_stats,
+                          self._profile_overrides, self.viewers, self._capturing, self._capture_waits):
+                state.pop(cam_id, None)
 
-        # Crear las nuevas
-        for cam in (new_set - old_set):
-            self.locks[cam] = threading.Lock()
-            self.captures[cam] = cv2.VideoCapture(cam)
+    def _open_capture(self, cam_id):
+        """Crea el VideoCapture; las propiedades memoizadas y el perfil dejan de valer."""
+        self._props.pop(cam_id, None)
+        self._active_profile.pop(cam_id, None)
+        if self.capture_processes:
+            return ProcessCapture(cam_id, slots=CAPTURE_PROCESS_SLOTS,
+                                  slot_bytes=self._profile_frame_bytes(cam_id, self.preview_source_profile)
+                                  or PROCESS_FALLBACK_PREVIEW_BYTES,
+                                  capture_bytes=self._process_capture_bytes(cam_id),
+                                  preview_width=PREVIEW_WIDTH, preview_quality=PREVIEW_QUALITY)
+        return cv2.VideoCapture(cam_id)
 
-        self.cameras = sorted(found)
+    def _profile_frame_bytes(self, cam_id, name):
+        """Bytes de un frame BGR con el tamaño que pide el perfil (0 si no lo fija)."""
+        values = self._profile_values(cam_id, name)
+        if values.get('width') and values.get('height'):
+            return int(values['width']) * int(values['height']) * 3
+        return 0
+
+    def _process_capture_bytes(self, cam_id):
+        """
+        Slot grande del proceso de captura: el frame BGR más grande que piden los
+        perfiles de la cámara, o el que la captura anterior informó como demasiado
+        grande (resolución negociada mayor a la pedida). CAPTURE_PROCESS_FRAME_BYTES lo fija.
+        """
+        if CAPTURE_PROCESS_FRAME_BYTES > 0:
+            return CAPTURE_PROCESS_FRAME_BYTES
+        sizes = [self._profile_frame_bytes(cam_id, name) for name in self.profiles]
+        previous = self.captures.get(cam_id)
+        sizes.append(getattr(previous, 'needed_bytes', 0))
+        return max(sizes) if any(sizes) else PROCESS_FALLBACK_FRAME_BYTES
 
-    # ---------- Internos ----------
     def _ensure_open_locked(self, cam_id):
         """
         Asegura (con lock del cam_id ya tomado) que la captura esté abierta.
-        Si no lo está, intenta reabrir una vez.
+        Si no lo está, intenta reabrir una vez; tras un intento fallido devuelve None
+        sin reintentar hasta que venza la espera anotada en la salud de la cámara.
         """
+        if cam_id not in self.cameras:
+            return None   # desconectada mientras se esperaba el lock: no se reabre
         cap = self.captures.get(cam_id)
+        health = self.health.setdefault(cam_id, CameraHealth())
+        if cap is not None and health.should_reset():
+            # Abierta pero sin frames o congelada: reinicio del dispositivo (con espera creciente)
+            print(f"[CameraManager] Reiniciando cámara {cam_id} ({health.failure_streak} fallos, "
+                  f"{health.duplicate_streak} frames repetidos)")
+            health.note_reset()
+            try:
+                cap.release()
+            except Exception:
+                pass
+            cap = None
         if cap is None or not cap.isOpened():
+            if not health.can_open():
+                return None   # el último intento falló: se espera antes de reintentar
+            if cap is not None:
+                try:
+                    cap.release()
+                except Exception:
+                    pass
             # Re-crear el VideoCapture
-            cap = cv2.VideoCapture(cam_id)
+            cap = self._open_capture(cam_id)
             self.captures[cam_id] = cap
+            health.record_open(cap.isOpened())
+            if not cap.isOpened():
+                print(f"[CameraManager] No se pudo abrir la cámara {cam_id}; "
+                      f"próximo intento en {health.next_open_at - time.time():.0f} s")
         return cap if cap.isOpened() else None
 
+    def _read_locked(self, cam_id, cap, view=False):
+        """
+        cap.read() registrando latencia, fallos y frames repetidos en la salud de la cámara.
+        view=True usa read_view() si la captura la tiene (slot compartido sin copiar).
+        """
+        read = cap.read_view if view and hasattr(cap, "read_view") else cap.read
+        t0 = time.perf_counter()
+        ok, frame = read()
+        self.health[cam_id].record_read(ok, time.perf_counter() - t0, frame if ok else None)
+        return ok, frame
+
+    def process_status(self):
+        """Estado de los procesos de captura (vacío si se captura en este proceso)."""
+        if not self.capture_processes:
+            return {}
+        return {cam_id: cap.status() for cam_id, cap in list(self.captures.items())
+                if hasattr(cap, "status")}
+
+    def health_status(self):
+        return {cam_id: self.health[cam_id].status() for cam_id in self.cameras if cam_id in self.health}
+
+    def health_state(self, cam_id):
+        health = self.health.get(cam_id)
+        return health.state if health is not None else None
+
+    # ---------- Propiedades y perfiles ----------
+    def get_properties(self, cam_id, names=None, refresh=False):
+        """
+        Devuelve las propiedades pedidas (todas por defecto). Las lecturas se memoizan:
+        sólo se consulta el dispositivo la primera vez, con refresh=True o después de
+        cambiar formato/tamaño.
+        """
+        if cam_id not in self.cameras:
+            raise ValueError(f"Cámara {cam_id} no detectada")
+        names = list(names or PROPERTIES)
+        unknown = [n for n in names if n not in PROPERTIES]
+        if unknown:
+            raise ValueError(f"Propiedades desconocidas: {', '.join(unknown)}")
+        cache = self._props.setdefault(cam_id, {})
+        missing = [n for n in names if refresh or n not in cache]
+        if missing:
+            with self.locks[cam_id].hold(PRIORITY_BACKGROUND):
+                cap = self._ensure_open_locked(cam_id)
+                if cap is None:
+                    raise RuntimeError(f"Cámara {cam_id} no disponible")
+                cache = self._props.setdefault(cam_id, {})
+                for name in missing:
+                    cache[name] = read_property(cap, name)
+        return {n: cache[n] for n in names}
+
+    def set_properties(self, cam_id, values):
+        """
+        Aplica propiedades sueltas y devuelve, por propiedad, lo pedido, lo que quedó
+        y si el driver la aceptó. La cámara queda sin perfil activo.
+        """
+        if cam_id not in self.cameras:
+            raise ValueError(f"Cámara {cam_id} no detectada")
+        values = validate_properties(values)
+        with self.locks[cam_id].hold(PRIORITY_CAPTURE):
+            cap = self._ensure_open_locked(cam_id)
+            if cap is None:
+                raise RuntimeError(f"Cámara {cam_id} no disponible")
+            result = self._apply_locked(cam_id, cap, values)
+            self._active_profile[cam_id] = None
+        return result
+
+    def _apply_locked(self, cam_id, cap, values):
+        cache = self._props.setdefault(cam_id, {})
+        if any(name in APPLY_ORDER for name in values):
+            cache.clear()  # formato/tamaño cambian otras propiedades (fps, exposición...)
+        result = {}
+        for name, value in values.items():
+            accepted = write_property(cap, name, value)
+            cache[name] = read_property(cap, name)
+            result[name] = {'requested': value, 'actual': cache[name], 'accepted': bool(accepted)}
+        return result
+
+    def _use_profile_locked(self, cam_id, cap, name):
+        """
+        Aplica el perfil sólo si no es el activo (cambiar formato reinicia el stream).
+        Descarta unos frames tras el cambio y registra su costo. Devuelve True si cambió.
+        """
+        if name is None or self._active_profile.get(cam_id) == name:
+            return False
+        t0 = time.perf_counter()
+        values = self._profile_values(cam_id, name)
+        if values:
+            self._apply_locked(cam_id, cap, values)
+            for _ in range(SWITCH_DISCARD_FRAMES):
+                cap.grab()
+        self._active_profile[cam_id] = name
+        ms = (time.perf_counter() - t0) * 1000.0
+        with self._state_lock:
+            stats = self._switch_stats.setdefault(cam_id, {'count': 0, 'last_ms': 0.0, 'max_ms': 0.0})
+            stats['count'] += 1
+            stats['last_ms'] = round(ms, 2)
+            stats['max_ms'] = round(max(stats['max_ms'], ms), 2)
+        return True
+
+    def _profile_values(self, cam_id, name):
+        """Perfil con los ajustes propios de la cámara (p.ej. MJPG o menos FPS por el bus)."""
+        values = dict(self.profiles.get(name) or {})
+        values.update(self._profile_overrides.get(cam_id, {}).get(name, {}))
+        return validate_properties(values) if values else values
+
+    def apply_profile(self, cam_id, name):
+        if cam_id not in self.cameras:
+            raise ValueError(f"Cámara {cam_id} no detectada")
+        if name not in self.profiles:
+            raise ValueError(f"Perfil desconocido: {name}")
+        with self.locks[cam_id].hold(PRIORITY_CAPTURE):
+            cap = self._ensure_open_locked(cam_id)
+            if cap is None:
+                raise RuntimeError(f"Cámara {cam_id} no disponible")
+            changed = self._use_profile_locked(cam_id, cap, name)
+        return {'profile': name, 'changed': changed}
+
+    def set_profile(self, name, values):
+        """Crea o reemplaza un perfil; las cámaras que lo tenían activo lo reaplican al usarlo."""
+        self.profiles[name] = validate_properties(values)
+        for cam_id, active in list(self._active_profile.items()):
+            if active == name:
+                self._active_profile[cam_id] = None
+        return self.profiles[name]
+
+    def profile_status(self):
+        return {
+            'profiles': self.profiles,
+            'overrides': self._profile_overrides,
+            'active': {cam_id: self._active_profile.get(cam_id) for cam_id in self.cameras},
+            'switches': {cam_id: dict(stats) for cam_id, stats in self._switch_stats.items()},
+        }
+
+    # ---------- Bus USB ----------
+    def _profile_mode(self, cam_id, name, current):
+        """Formato/tamaño/FPS que usaría la cámara con el perfil (lo no fijado: lo negociado)."""
+        values = self._profile_values(cam_id, name)
+        return {
+            'fourcc': values.get('fourcc') or current.get('fourcc') or DEFAULT_FOURCC,
+            'width': int(values.get('width') or current.get('width') or 640),
+            'height': int(values.get('height') or current.get('height') or 480),
+            'fps': float(values.get('fps') or current.get('fps') or DEFAULT_FPS),
+        }
+
+    def plan_usb_bandwidth(self, apply=False):
+        """
+        Estima el ancho de banda de cada perfil con todas las cámaras transmitiendo a la
+        vez y elige formato/FPS para que entre en usb_budget. Con apply=True guarda los
+        cambios como ajustes por cámara del perfil (se aplican la próxima vez que se use).
+        'worst_case' suma, por cámara, el perfil que más consume.
+        """
+        current = {}
+        for cam_id in self.cameras:
+            try:
+                current[cam_id] = self.get_properties(cam_id, ['fourcc', 'width', 'height', 'fps'])
+            except Exception:
+                current[cam_id] = {}
+
+        plans = {}
+        for name in self.profiles:
+            modes = {cam_id: self._profile_mode(cam_id, name, current[cam_id]) for cam_id in self.cameras}
+            plans[name] = plan_bus(modes, self.usb_budget, MIN_FPS.get(name, DEFAULT_MIN_FPS))
+            if apply:
+                for action in plans[name]['actions']:
+                    override = self._profile_overrides.setdefault(action['cam_id'], {}).setdefault(name, {})
+                    override[action['change']] = action['to']
+                    if self._active_profile.get(action['cam_id']) == name:
+                        self._active_profile[action['cam_id']] = None  # se reaplica al usarlo
+
+        worst = sum(max(plan['cameras'][cam_id]['bytes_per_s'] for plan in plans.values())
+                    for cam_id in self.cameras) if plans else 0
+        self.usb_plan = {
+            'budget_bytes_per_s': self.usb_budget,
+            'applied': bool(apply),
+            'profiles': plans,
+            'worst_case_bytes_per_s': worst,
+            'worst_case_oversubscribed': worst > self.usb_budget,
+            'negotiated': current,
+        }
+        return self.usb_plan
+
+    # ---------- Arbitraje vista en vivo / experimentos ----------
+    @contextmanager
+    def capture_window(self, cam_ids):
+        """
+        Marca las cámaras como en captura durante el bloque (LED + lecturas de un tick).
+        Mientras tanto la vista en vivo no las lee: se actualiza con los frames que
+        toman las capturas, así la captura no compite con los espectadores. Es el único
+        tramo en el que la cámara pasa al perfil de captura con la vista abierta.
+        """
+        cam_ids = list(cam_ids or [])
+        with self._state_lock:
+            for cam_id in cam_ids:
+                self._capturing[cam_id] = self._capturing.get(cam_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._state_lock:
+                for cam_id in cam_ids:
+                    self._capturing[cam_id] = max(0, self._capturing.get(cam_id, 0) - 1)
+
+    def capture_active(self, cam_id):
+        return self._capturing.get(cam_id, 0) > 0
+
+    def viewer_slots(self, cam_id):
+        """Espectadores que todavía se pueden conectar a la cámara."""
+        return max(0, self.max_viewers - self.viewers.get(cam_id, 0))
+
+    def _add_viewer(self, cam_id):
+        with self._state_lock:
+            if self.viewers.get(cam_id, 0) >= self.max_viewers:
+                return False
+            self.viewers[cam_id] = self.viewers.get(cam_id, 0) + 1
+            return True
+
+    def _remove_viewer(self, cam_id):
+        with self._state_lock:
+            if cam_id in self.viewers:   # la cámara pudo desconectarse mientras tanto
+                self.viewers[cam_id] = max(0, self.viewers[cam_id] - 1)
+
+    def _record_capture_wait(self, cam_id, waited):
+        ms = waited * 1000.0
+        with self._state_lock:
+            stats = self._capture_waits.setdefault(cam_id, {'count': 0, 'last_ms': 0.0, 'max_ms': 0.0})
+            stats['count'] += 1
+            stats['last_ms'] = round(ms, 2)
+            stats['max_ms'] = round(max(stats['max_ms'], ms), 2)
+
+    def arbitration_status(self):
+        return {
+            cam_id: {
+                'viewers': self.viewers.get(cam_id, 0),
+                'max_viewers': self.max_viewers,
+                'capturing': self.capture_active(cam_id),
+                'capture_lock_wait': dict(self._capture_waits.get(cam_id, {})),
+            }
+            for cam_id in self.cameras
+        }
+
     # ---------- Streaming ----------
+    def preview_pipeline(self, cam_id):
+        with self._state_lock:
+            pipeline = self.pipelines.get(cam_id)
+            if pipeline is None:
+                pipeline = self.pipelines[cam_id] = PreviewPipeline(self, cam_id)
+            return pipeline
+
+    def _offer_preview(self, cam_id, frame):
+        pipeline = self.pipelines.get(cam_id)
+        if pipeline is not None:
+            pipeline.offer(frame)
+
+    def preview_status(self):
+        return {cam_id: p.status() for cam_id, p in self.pipelines.items()}
+
     def generate_frames(self, cam_id):
         if cam_id not in self.cameras:
             return
-        cap = self.captures[cam_id]
-        while self.running:
-            with self.locks[cam_id]:
-                # Asegura que la cámara esté abierta
-                cap = self._ensure_open_locked(cam_id)
-                if cap is None:
-                    time.sleep(0.2)
+        if not self._add_viewer(cam_id):
+            return
+        pipeline = self.preview_pipeline(cam_id)
+        pipeline.subscribe()
+        seq = 0
+        try:
+            while self.running and not pipeline.stopped:
+                # Mismo JPEG para todos los espectadores; si no hay ciclo nuevo (p.ej. durante
+                # un tick) se reenvía el último a PREVIEW_THROTTLED_FPS para mantener el stream
+                seq, jpeg = pipeline.wait(seq, timeout=1.0 / PREVIEW_THROTTLED_FPS)
+                if jpeg is None:
                     continue
-                ret, frame = cap.read()
-            if not ret:
-                time.sleep(0.1)
-                continue
-            ret2, buffer = cv2.imencode('.jpg', frame)
-            if not ret2:
-                continue
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            time.sleep(0.03)  # ~30 FPS cap
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            pipeline.unsubscribe()
+            self._remove_viewer(cam_id)
+
+    # ---------- Captura fresca (descarta buffers encolados en V4L2) ----------
+    def _read_fresh_locked(self, cam_id, cap):
+        """
+        Lee un frame expuesto después del pedido. El driver puede tener encolados
+        frames de hace segundos (p.ej. antes de encender el LED): se descartan con
+        grab() hasta que el timestamp del buffer sea posterior al pedido o, si el
+        backend no da timestamps monotónicos, hasta que grab() tenga que esperar un
+        frame nuevo. Devuelve (ok, frame) y registra el costo del descarte.
+        """
+        t0 = time.perf_counter()
+        requested_ms = time.monotonic() * 1000.0
+        # fps memoizado con las demás propiedades (se relee sólo tras cambiar formato/tamaño)
+        cache = self._props.setdefault(cam_id, {})
+        if "fps" not in cache:
+            cache["fps"] = read_property(cap, "fps")
+        fps = cache["fps"] or 30.0
+        min_block = 0.5 / max(1.0, fps)
+        drained = 0
+        method = "timing"
+        ok, frame = False, None
+        for attempt in range(FRESH_MAX_DRAIN + 1):
+            g0 = time.perf_counter()
+            if not cap.grab():
+                break
+            blocked = time.perf_counter() - g0
+            ts_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+            if ts_ms and abs(ts_ms - requested_ms) < FRESH_TIMESTAMP_TOLERANCE_MS:
+                method = "timestamp"
+                fresh = ts_ms >= requested_ms
+            else:
+                method = "timing"
+                fresh = blocked >= min_block
+            if fresh or attempt == FRESH_MAX_DRAIN:
+                ok, frame = cap.retrieve()
+                break
+            drained += 1
+        elapsed = time.perf_counter() - t0
+        self._record_drain(cam_id, drained, elapsed, method)
+        self.health[cam_id].record_read(ok, elapsed, frame if ok else None)
+        return ok, frame
+
+    def _record_drain(self, cam_id, drained, elapsed, method):
+        ms = elapsed * 1000.0
+        with self._state_lock:
+            stats = self._drain_stats.setdefault(cam_id, {
+                'count': 0, 'drained_total': 0, 'drained_last': 0,
+                'last_ms': 0.0, 'avg_ms': 0.0, 'max_ms': 0.0, 'method': None})
+            stats['count'] += 1
+            stats['drained_total'] += drained
+            stats['drained_last'] = drained
+            stats['last_ms'] = round(ms, 2)
+            stats['avg_ms'] = round(stats['avg_ms'] + (ms - stats['avg_ms']) / stats['count'], 2)
+            stats['max_ms'] = round(max(stats['max_ms'], ms), 2)
+            stats['method'] = method
+
+    def drain_status(self):
+        """Costo de las capturas frescas por cámara (buffers descartados y tiempo)."""
+        with self._state_lock:
+            return {cam_id: dict(stats) for cam_id, stats in self._drain_stats.items()}
 
     # ---------- Captura puntual por cámara (para experimentos por subconjunto) ----------
-    def grab_frame(self, cam_id):
+    def grab_frame(self, cam_id, priority=PRIORITY_CAPTURE, fresh=False, profile=None, view=False):
         """
         Devuelve un frame (numpy array BGR) de la cámara indicada o None si falla.
-        Reabre la cámara si se cerró. Thread-safe por cámara.
+        Reabre la cámara si se cerró. Thread-safe por cámara; 'priority' decide quién
+        toma primero el lock cuando hay varios esperando.
+        fresh=True garantiza un frame expuesto después de la llamada (ver _read_fresh_locked).
+        profile: perfil de propiedades a usar (sólo se aplica si no es el activo).
+        view=True (captura en proceso): devuelve el slot compartido sin copiarlo; vale
+        hasta que el proceso lo recicle, así que sólo sirve si el llamador termina de
+        usarlo enseguida (codificar la vista en vivo). Sin efecto con fresh=True.
         """
         if cam_id not in self.cameras:
             return None
-        with self.locks[cam_id]:
+        with self.locks[cam_id].hold(priority) as held:
+            if priority == PRIORITY_CAPTURE:
+                self._record_capture_wait(cam_id, held.waited)
+            elif priority == PRIORITY_PREVIEW and self.capture_active(cam_id):
+                # Empezó un tick mientras la vista esperaba el lock: no se cambia de perfil
+                # entre lecturas de la captura (la vista recibe el frame capturado)
+                return None
             cap = self._ensure_open_locked(cam_id)
             if cap is None:
                 return None
-            ok, frame = cap.read()
+            self._use_profile_locked(cam_id, cap, profile)
+            ok, frame = self._read_fresh_locked(cam_id, cap) if fresh else self._read_locked(cam_id, cap, view)
             if not ok:
                 # Reintenta breve 1 vez por si fue un glitch
                 time.sleep(0.05)
-                ok, frame = cap.read()
+                ok, frame = self._read_locked(cam_id, cap, view and not fresh)
                 if not ok:
                     return None
-            return frame
+        if priority == PRIORITY_CAPTURE:
+            self._offer_preview(cam_id, frame)
+        return frame
+
+    def grab_preview(self, cam_id, priority=PRIORITY_PREVIEW, profile=None):
+        """
+        Vista previa reducida y codificada por el proceso de captura de la cámara:
+        (frame_reducido, jpeg, forma del frame original, encode_ms), o None si falla,
+        si la cámara está en una ventana de captura o si no se captura en procesos.
+        """
+        if cam_id not in self.cameras:
+            return None
+        with self.locks[cam_id].hold(priority):
+            if self.capture_active(cam_id):
+                return None
+            cap = self._ensure_open_locked(cam_id)
+            if cap is None or not hasattr(cap, "read_preview"):
+                return None
+            self._use_profile_locked(cam_id, cap, profile)
+            t0 = time.perf_counter()
+            ok, small, jpeg, source_shape, encode_ms = cap.read_preview()
+            self.health[cam_id].record_read(ok, time.perf_counter() - t0, small if ok else None)
+        return (small, jpeg, source_shape, encode_ms) if ok else None
+
+    def grab_burst(self, cam_id, count, on_frame, fresh=False, profile=None):
+        """
+        Lee 'count' frames consecutivos de la cámara sin soltar el lock (el stream no
+        intercala lecturas) y entrega cada uno a on_frame(frame).
+        fresh=True descarta antes los buffers encolados (el primer frame ya es nuevo).
+        Devuelve cuántos frames aceptó on_frame (si devuelve False, p.ej. FrameStacker.add
+        ante un tamaño distinto, el frame no cuenta).
+        """
+        if cam_id not in self.cameras:
+            return 0
+        got = 0
+        last = None
+        with self.locks[cam_id].hold(PRIORITY_CAPTURE) as held:
+            self._record_capture_wait(cam_id, held.waited)
+            cap = self._ensure_open_locked(cam_id)
+            if cap is None:
+                return 0
+            self._use_profile_locked(cam_id, cap, profile)
+            for i in range(int(count)):
+                if fresh and i == 0:
+                    ok, frame = self._read_fresh_locked(cam_id, cap)
+                else:
+                    ok, frame = self._read_locked(cam_id, cap)
+                if not ok:
+                    # Un glitch no invalida la ráfaga; se sigue con los frames válidos
+                    time.sleep(0.05)
+                    continue
+                if on_frame(frame) is False:
+                    continue
+                last = frame
+                got += 1
+        if last is not None:
+            self._offer_preview(cam_id, last)
+        return got
+
+    @staticmethod
+    def write_frame(frame, out_path):
+        """Escribe un frame ya capturado en out_path (crea la carpeta si falta)."""
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        return cv2.imwrite(out_path, frame)
 
     def save_snapshot(self, cam_id, out_path):
         """
@@ -117,8 +669,7 @@ class CameraManager:
         frame = self.grab_frame(cam_id)
         if frame is None:
             return False
-        os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        return cv2.imwrite(out_path, frame)
+        return self.write_frame(frame, out_path)
 
     # ---------- Compatibilidad con tu API actual ----------
     def take_photo(self, cam_id, save_path):
@@ -133,9 +684,53 @@ class CameraManager:
         if not ok:
             raise RuntimeError("No se pudo capturar imagen")
 
+    # ---------- Buffer circular pre-disparo ----------
+    def enable_ring_buffer(self, cam_id, fps=5, seconds=10, max_bytes=8 * 1024 * 1024,
+                           quality=80, dump_dir=None, post_seconds=5, trigger_threshold=None):
+        """
+        Activa (o reconfigura) el buffer circular de la cámara.
+        La suma de max_bytes de todas las cámaras no puede superar ring_budget_bytes.
+        """
+        if cam_id not in self.cameras:
+            raise ValueError(f"Cámara {cam_id} no detectada")
+        max_bytes = int(max_bytes)
+        if max_bytes <= 0:
+            raise ValueError("max_bytes debe ser > 0")
+        used = sum(r.buffer.max_bytes for c, r in self.rings.items() if c != cam_id)
+        if used + max_bytes > self.ring_budget_bytes:
+            free_mb = (self.ring_budget_bytes - used) / (1024 * 1024)
+            raise ValueError(f"Presupuesto de RAM excedido: quedan {free_mb:.1f} MB para buffers")
+
+        self.disable_ring_buffer(cam_id)
+        self.rings[cam_id] = RingRecorder(
+            self, cam_id, fps=fps, seconds=seconds, max_bytes=max_bytes, quality=quality,
+            dump_dir=dump_dir, post_seconds=post_seconds, trigger_threshold=trigger_threshold)
+        return self.rings[cam_id].status()
+
+    def disable_ring_buffer(self, cam_id):
+        ring = self.rings.pop(cam_id, None)
+        if ring is not None:
+            ring.stop()
+
+    def dump_ring_buffer(self, cam_id, out_dir=None, post_seconds=None):
+        """Vuelca el buffer de la cámara; devuelve la carpeta del evento."""
+        ring = self.rings.get(cam_id)
+        if ring is None:
+            raise ValueError(f"Cámara {cam_id} sin buffer circular activo")
+        return ring.dump(out_dir=out_dir, post_seconds=post_seconds)
+
+    def ring_buffer_status(self):
+        return {
+            'budget_bytes': self.ring_budget_bytes,
+            'used_bytes': sum(r.buffer.size_bytes for r in self.rings.values()),
+            'cameras': {cam_id: r.status() for cam_id, r in self.rings.items()},
+        }
+
     # ---------- Liberación ----------
     def release(self):
         self.running = False
+        for cam_id in list(self.rings.keys()):
+            self.disable_ring_buffer(cam_id)
         for cap in list(self.captures.values()):
             try:
                 cap.release()
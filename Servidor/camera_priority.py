@@ -0,0 +1,74 @@
+import threading
+import time
+
+# Prioridades de acceso a una cámara (mayor = pasa primero)
+PRIORITY_PREVIEW = 0      # /video_feed
+PRIORITY_BACKGROUND = 1   # buffer circular pre-disparo
+PRIORITY_CAPTURE = 2      # capturas de experimentos / fotos puntuales
+
+
+class PriorityLock:
+    """
+    Lock de una cámara con prioridades: al liberarse lo toma el pedido de mayor
+    prioridad que esté esperando, así una captura de experimento nunca queda detrás
+    de una cola de lecturas de la vista en vivo (a lo sumo espera la lectura en curso).
+    Por compatibilidad, 'with lock:' adquiere con PRIORITY_CAPTURE.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._held = False
+        self._waiting = {}   # prioridad -> cantidad de hilos esperando
+
+    def acquire(self, priority=PRIORITY_CAPTURE, timeout=None):
+        """Devuelve los segundos esperados, o None si venció el timeout."""
+        t0 = time.perf_counter()
+        with self._cond:
+            self._waiting[priority] = self._waiting.get(priority, 0) + 1
+            try:
+                ok = self._cond.wait_for(lambda: not self._held and not self._higher_waiting(priority),
+                                         timeout)
+                if not ok:
+                    return None
+                self._held = True
+                return time.perf_counter() - t0
+            finally:
+                self._waiting[priority] -= 1
+
+    def release(self):
+        with self._cond:
+            self._held = False
+            self._cond.notify_all()
+
+    def locked(self):
+        return self._held
+
+    def _higher_waiting(self, priority):
+        return any(n > 0 for p, n in self._waiting.items() if p > priority)
+
+    def hold(self, priority=PRIORITY_CAPTURE):
+        """Context manager: 'with lock.hold(PRIORITY_PREVIEW):'."""
+        return _Held(self, priority)
+
+    def __enter__(self):
+        self.acquire(PRIORITY_CAPTURE)
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class _Held:
+    def __init__(self, lock, priority):
+        self.lock = lock
+        self.priority = priority
+        self.waited = 0.0
+
+    def __enter__(self):
+        self.waited = self.lock.acquire(self.priority)
+        return self
+
+    def __exit__(self, *exc):
+        self.lock.release()
+        return False
@@ -0,0 +1,407 @@
+import multiprocessing as mp
+import struct
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from image_storage import resize_to_width
+
+# Procesos de captura con 'spawn': el servidor ya tiene hilos (Flask, OpenCV) y un
+# fork copiaría sus locks en cualquier estado
+_MP = mp.get_context("spawn")
+
+# Control compartido al inicio del bloque: hasta cuándo (reloj monotónico, s) se pidió
+# la vista previa; el proceso sólo reduce y codifica mientras alguien la lee
+_CONTROL = struct.Struct("<d")
+_CONTROL_SIZE = 16
+
+# Cabecera de cada slot de frames: seq (u64, 0 = escribiéndose), timestamp monotónico en
+# ms (f64) y forma del frame (alto, ancho, canales)
+_SLOT_HEADER = struct.Struct("<QdIII")
+_HEADER_SIZE = 32
+
+# Cabecera de cada slot de vista previa: seq, timestamp, forma de la copia reducida,
+# largo del JPEG, forma del frame original y ms de codificación
+_PREVIEW_HEADER = struct.Struct("<QdIIIIIIIf")
+_PREVIEW_HEADER_SIZE = 48
+PREVIEW_SLOTS = 2
+# La vista previa se sigue generando este tiempo después de la última lectura
+PREVIEW_KEEPALIVE_S = 2.0
+
+# Espera máxima de un frame nuevo y de la respuesta a un comando
+READ_TIMEOUT_S = 2.0
+RPC_TIMEOUT_S = 3.0
+
+
+class _Layout:
+    """Posiciones dentro del bloque compartido (las calculan igual ambos procesos)."""
+
+    def __init__(self, slots, slot_bytes, capture_bytes, preview_width):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.capture_bytes = capture_bytes
+        # Copia reducida de hasta preview_width x preview_width (cualquier proporción
+        # hasta 1:1) y su JPEG, que a calidad de vista previa ocupa mucho menos
+        self.small_bytes = preview_width * preview_width * 3
+        self.jpeg_bytes = preview_width * preview_width
+        self.capture_base = _CONTROL_SIZE + slots * (_HEADER_SIZE + slot_bytes)
+        self.preview_base = self.capture_base + _HEADER_SIZE + capture_bytes
+        self.preview_slot = _PREVIEW_HEADER_SIZE + self.small_bytes + self.jpeg_bytes
+        self.size = self.preview_base + PREVIEW_SLOTS * self.preview_slot
+
+    def slot_base(self, slot):
+        """Slots 0..slots-1: anillo; slot == slots: slot único a resolución de captura."""
+        if slot == self.slots:
+            return self.capture_base
+        return _CONTROL_SIZE + slot * (_HEADER_SIZE + self.slot_bytes)
+
+    def preview_slot_base(self, slot):
+        return self.preview_base + slot * self.preview_slot
+
+
+def _attach(shm_name):
+    """
+    Abre el bloque creado por el proceso principal. Con 'spawn' el proceso hijo comparte
+    el resource_tracker del principal, que lo libera con unlink() en release().
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    return shared_memory.SharedMemory(name=shm_name)
+
+
+def _write_preview(shm, layout, frame, ts_ms, pseq, width, quality):
+    """Reduce y codifica el frame en el slot de vista previa; devuelve (slot, ms) o None."""
+    t0 = time.perf_counter()
+    small = resize_to_width(frame, width)
+    ok, buf = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    encode_ms = (time.perf_counter() - t0) * 1000.0
+    if not ok or small.nbytes > layout.small_bytes or buf.size > layout.jpeg_bytes:
+        return None
+    slot = pseq % PREVIEW_SLOTS
+    base = layout.preview_slot_base(slot)
+    h, w = small.shape[:2]
+    c = small.shape[2] if small.ndim == 3 else 1
+    fh, fw = frame.shape[:2]
+    fc = frame.shape[2] if frame.ndim == 3 else 1
+    values = (ts_ms, h, w, c, buf.size, fh, fw, fc, encode_ms)
+    _PREVIEW_HEADER.pack_into(shm.buf, base, 0, *values)
+    data = base + _PREVIEW_HEADER_SIZE
+    np.ndarray(small.shape, dtype=np.uint8, buffer=shm.buf, offset=data)[...] = small
+    data += layout.small_bytes
+    shm.buf[data:data + buf.size] = buf.tobytes()
+    _PREVIEW_HEADER.pack_into(shm.buf, base, pseq, *values)
+    return slot, encode_ms
+
+
+def _worker(cam_id, shm_name, slots, slot_bytes, capture_bytes, preview_width, preview_quality,
+            events, commands):
+    """
+    Proceso de captura de una cámara: lee frames sin parar (decodificación incluida),
+    los copia a la memoria compartida y sólo avisa (slot, seq, timestamp) por 'events'.
+    Los frames que entran en el anillo (perfil de vista previa) rotan por sus slots; los
+    más grandes (perfil de captura) van al slot único de captura. Mientras se pida la
+    vista previa también la reduce y codifica a JPEG acá, fuera del proceso de la API.
+    Atiende get/set de propiedades por 'commands' entre lectura y lectura.
+    """
+    shm = _attach(shm_name)
+    layout = _Layout(slots, slot_bytes, capture_bytes, preview_width)
+    cap = cv2.VideoCapture(cam_id)
+    events.send(("opened", cap.isOpened()))
+    seq = 0
+    pseq = 0
+    try:
+        while True:
+            while commands.poll():
+                cmd = commands.recv()
+                if cmd[0] == "stop":
+                    return
+                if cmd[0] == "get":
+                    commands.send(cap.get(cmd[1]))
+                elif cmd[0] == "set":
+                    commands.send(cap.set(cmd[1], cmd[2]))
+                elif cmd[0] == "isOpened":
+                    commands.send(cap.isOpened())
+
+            ok, frame = cap.read()
+            ts_ms = time.monotonic() * 1000.0   # mismo reloj en todos los procesos
+            if not ok or frame is None:
+                events.send(("fail", ts_ms))
+                time.sleep(0.05)
+                continue
+            if frame.nbytes <= slot_bytes:
+                slot = (seq + 1) % slots
+            elif frame.nbytes <= capture_bytes:
+                slot = slots
+            else:
+                events.send(("too_large", frame.shape))
+                time.sleep(0.5)
+                continue
+
+            seq += 1
+            base = layout.slot_base(slot)
+            h, w = frame.shape[:2]
+            c = frame.shape[2] if frame.ndim == 3 else 1
+            # seq = 0 mientras se escribe: el lector descarta un slot a medio copiar
+            _SLOT_HEADER.pack_into(shm.buf, base, 0, ts_ms, h, w, c)
+            dst = np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf,
+                             offset=base + _HEADER_SIZE)
+            dst[...] = frame
+            _SLOT_HEADER.pack_into(shm.buf, base, seq, ts_ms, h, w, c)
+            events.send(("frame", slot, seq, ts_ms))
+
+            if _CONTROL.unpack_from(shm.buf, 0)[0] > time.monotonic():
+                written = _write_preview(shm, layout, frame, ts_ms, pseq + 1, preview_width, preview_quality)
+                if written is not None:
+                    pseq += 1
+                    events.send(("preview", written[0], pseq, ts_ms, written[1]))
+    finally:
+        cap.release()
+        shm.close()
+
+
+class ProcessCapture:
+    """
+    Reemplazo de cv2.VideoCapture que captura en un proceso propio (un núcleo por cámara).
+    Los píxeles viajan por shared_memory; entre procesos sólo cruzan metadatos.
+    Implementa lo que usa CameraManager: isOpened, read, grab, retrieve, get, set y
+    release, más read_preview() (copia reducida y JPEG hechos en el proceso).
+
+    - Memoria: 'slots' frames del tamaño de la vista previa (slot_bytes) más un único
+      slot a resolución de captura (capture_bytes) y dos slots de vista previa; un
+      frame de captura no se multiplica por la cantidad de slots.
+    - read()/retrieve() devuelven una copia del slot (el proceso sigue escribiendo);
+      read_view() devuelve el slot sin copiar para usos inmediatos.
+    - No hay cola de frames viejos: grab() espera un frame posterior al último leído y
+      CAP_PROP_POS_MSEC informa su timestamp monotónico, así la captura fresca funciona
+      por timestamp.
+    - Si el proceso recibe un frame mayor que el slot de captura lo descarta y anota en
+      needed_bytes el tamaño necesario, para reabrir con un slot más grande.
+    """
+
+    def __init__(self, cam_id, slots=3, slot_bytes=640 * 480 * 3, capture_bytes=2592 * 1944 * 3,
+                 preview_width=640, preview_quality=80):
+        self.cam_id = cam_id
+        self.slots = max(2, int(slots))
+        self.slot_bytes = int(slot_bytes)
+        self.capture_bytes = max(self.slot_bytes, int(capture_bytes))
+        self.preview_width = int(preview_width)
+        self._layout = _Layout(self.slots, self.slot_bytes, self.capture_bytes, self.preview_width)
+        self._shm = shared_memory.SharedMemory(create=True, size=self._layout.size)
+        _CONTROL.pack_into(self._shm.buf, 0, 0.0)
+
+        self._cond = threading.Condition()
+        self._rpc_lock = threading.Lock()
+        self._latest = None      # (slot, seq, ts_ms)
+        self._grabbed = None
+        self._consumed = 0
+        self._latest_preview = None   # (slot, seq, ts_ms, encode_ms)
+        self._preview_consumed = 0
+        self._opened = None
+        self._closed = False
+        self.frames = 0
+        self.previews = 0
+        self.failures = 0
+        self.copies = 0
+        self.torn = 0
+        self.needed_bytes = 0
+        self.last_error = None
+
+        events_parent, events_child = _MP.Pipe(duplex=False)
+        self._commands, commands_child = _MP.Pipe()
+        self._process = _MP.Process(
+            target=_worker, name=f"camera-{cam_id}", daemon=True,
+            args=(cam_id, self._shm.name, self.slots, self.slot_bytes, self.capture_bytes,
+                  self.preview_width, int(preview_quality), events_child, commands_child))
+        self._process.start()
+        events_child.close()
+        self._events = events_parent
+        self._reader = threading.Thread(target=self._read_events, daemon=True,
+                                        name=f"camera-{cam_id}-events")
+        self._reader.start()
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._opened is not None or self._closed, RPC_TIMEOUT_S)
+
+    # ---------- Eventos del proceso ----------
+    def _read_events(self):
+        while True:
+            try:
+                msg = self._events.recv()
+            except (EOFError, OSError):
+                break
+            with self._cond:
+                if msg[0] == "frame":
+                    self._latest = msg[1:]
+                    self.frames += 1
+                elif msg[0] == "preview":
+                    self._latest_preview = msg[1:]
+                    self.previews += 1
+                elif msg[0] == "opened":
+                    self._opened = bool(msg[1])
+                elif msg[0] == "fail":
+                    self.failures += 1
+                elif msg[0] == "too_large":
+                    self.failures += 1
+                    self.needed_bytes = max(self.needed_bytes, int(np.prod(msg[1])))
+                    self.last_error = f"Frame {tuple(msg[1])} mayor que el slot ({self.capture_bytes} bytes)"
+                self._cond.notify_all()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    # ---------- Interfaz tipo VideoCapture ----------
+    def isOpened(self):
+        return bool(self._opened) and not self._closed and self._process.is_alive()
+
+    def grab(self):
+        """Espera un frame posterior al último leído (o el más nuevo ya publicado)."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._closed or (self._latest is not None and self._latest[1] > self._consumed),
+                READ_TIMEOUT_S)
+            if self._latest is None or self._latest[1] <= self._consumed:
+                return False
+            self._grabbed = self._latest
+            self._consumed = self._latest[1]
+            return True
+
+    def read_view(self):
+        """(ok, vista del slot) sin copiar: válida hasta que el proceso recicle el slot."""
+        if not self.grab():
+            return False, None
+        return self._slot_view(self._grabbed)
+
+    def retrieve(self):
+        """
+        Copia del frame tomado por grab(). Si el proceso reescribió el slot antes o
+        durante la copia (un frame que ya tenía casi un período) se espera el siguiente
+        publicado, que sigue siendo posterior, y se reintenta una vez.
+        """
+        if self._grabbed is None:
+            return False, None
+        for attempt in range(2):
+            ok, view = self._slot_view(self._grabbed)
+            if ok:
+                frame = view.copy()
+                # Verifica que el proceso no haya escrito el slot durante la copia
+                seq = _SLOT_HEADER.unpack_from(self._shm.buf, self._layout.slot_base(self._grabbed[0]))[0]
+                if seq == self._grabbed[1]:
+                    self.copies += 1
+                    return True, frame
+            self.torn += 1
+            if attempt == 0 and not self.grab():
+                break
+        return False, None
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def read_preview(self):
+        """
+        Vista previa hecha en el proceso: (ok, copia reducida BGR, JPEG, forma del frame
+        original, ms de codificación). La primera llamada (o tras PREVIEW_KEEPALIVE_S sin
+        leer) activa la generación, así que puede esperar un frame. Si el proceso pisa el
+        slot durante la copia se reintenta una vez con la siguiente.
+        """
+        _CONTROL.pack_into(self._shm.buf, 0, time.monotonic() + PREVIEW_KEEPALIVE_S)
+        for _ in range(2):
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or (self._latest_preview is not None
+                                             and self._latest_preview[1] > self._preview_consumed),
+                    READ_TIMEOUT_S)
+                meta = self._latest_preview
+                if meta is None or meta[1] <= self._preview_consumed:
+                    break
+                self._preview_consumed = meta[1]
+            result = self._copy_preview(*meta)
+            if result is not None:
+                return (True,) + result
+            self.torn += 1
+        return False, None, None, None, None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self._grabbed[2] if self._grabbed else 0.0
+        return self._call("get", prop) or 0.0
+
+    def set(self, prop, value):
+        return bool(self._call("set", prop, value))
+
+    def release(self):
+        if self._process.is_alive():
+            try:
+                self._commands.send(("stop",))
+            except (OSError, BrokenPipeError):
+                pass
+            self._process.join(timeout=2)
+            if self._process.is_alive():
+                self._process.terminate()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        try:
+            self._shm.close()
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    # ---------- Internos ----------
+    def _copy_preview(self, slot, seq, _ts_ms, encode_ms):
+        """Copia del slot de vista previa, o None si el proceso lo reescribió mientras tanto."""
+        base = self._layout.preview_slot_base(slot)
+        header = _PREVIEW_HEADER.unpack_from(self._shm.buf, base)
+        if header[0] != seq:
+            return None
+        _, _, h, w, c, jpeg_len, fh, fw, fc, _ = header
+        data = base + _PREVIEW_HEADER_SIZE
+        shape = (h, w, c) if c > 1 else (h, w)
+        small = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf, offset=data).copy()
+        data += self._layout.small_bytes
+        jpeg = bytes(self._shm.buf[data:data + jpeg_len])
+        if _PREVIEW_HEADER.unpack_from(self._shm.buf, base)[0] != seq:
+            return None
+        source_shape = (fh, fw, fc) if fc > 1 else (fh, fw)
+        return small, jpeg, source_shape, round(encode_ms, 2)
+
+    def _slot_view(self, meta):
+        slot, seq, _ = meta
+        base = self._layout.slot_base(slot)
+        cur_seq, _, h, w, c = _SLOT_HEADER.unpack_from(self._shm.buf, base)
+        if cur_seq != seq:
+            return False, None
+        shape = (h, w, c) if c > 1 else (h, w)
+        return True, np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf, offset=base + _HEADER_SIZE)
+
+    def _call(self, *msg):
+        with self._rpc_lock:
+            if not self._process.is_alive():
+                return None
+            self._commands.send(msg)
+            if not self._commands.poll(RPC_TIMEOUT_S):
+                self.last_error = f"Sin respuesta del proceso a {msg[0]}"
+                return None
+            return self._commands.recv()
+
+    def status(self):
+        return {
+            'pid': self._process.pid,
+            'alive': self._process.is_alive(),
+            'slots': self.slots,
+            'slot_bytes': self.slot_bytes,
+            'capture_bytes': self.capture_bytes,
+            'shared_bytes': self._layout.size,
+            'needed_bytes': self.needed_bytes or None,
+            'frames': self.frames,
+            'previews': self.previews,
+            'failures': self.failures,
+            'copies': self.copies,
+            'torn_reads': self.torn,
+            'last_error': self.last_error,
+        }
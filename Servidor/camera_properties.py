@@ -0,0 +1,80 @@
+import cv2
+
+# Propiedades V4L2 expuestas por la API (nombre -> constante de OpenCV)
+PROPERTIES = {
+    "width": cv2.CAP_PROP_FRAME_WIDTH,
+    "height": cv2.CAP_PROP_FRAME_HEIGHT,
+    "fps": cv2.CAP_PROP_FPS,
+    "fourcc": cv2.CAP_PROP_FOURCC,
+    "buffersize": cv2.CAP_PROP_BUFFERSIZE,
+    "auto_exposure": cv2.CAP_PROP_AUTO_EXPOSURE,
+    "exposure": cv2.CAP_PROP_EXPOSURE,
+    "gain": cv2.CAP_PROP_GAIN,
+    "brightness": cv2.CAP_PROP_BRIGHTNESS,
+    "contrast": cv2.CAP_PROP_CONTRAST,
+    "saturation": cv2.CAP_PROP_SATURATION,
+    "sharpness": cv2.CAP_PROP_SHARPNESS,
+    "auto_wb": cv2.CAP_PROP_AUTO_WB,
+    "wb_temperature": cv2.CAP_PROP_WB_TEMPERATURE,
+    "autofocus": cv2.CAP_PROP_AUTOFOCUS,
+    "focus": cv2.CAP_PROP_FOCUS,
+}
+
+# Orden de aplicación: formato y tamaño reinician el stream, conviene fijarlos primero
+APPLY_ORDER = ("fourcc", "width", "height", "fps")
+
+# Perfiles por defecto. Si el tamaño pedido no existe, V4L2 elige el más cercano.
+DEFAULT_PROFILES = {
+    "preview": {"width": 640, "height": 480, "fps": 15, "fourcc": "MJPG"},
+    "capture": {"width": 2592, "height": 1944},
+}
+
+# Frames descartados después de cambiar de perfil (el stream se reinicia y la
+# exposición automática tarda en estabilizarse)
+SWITCH_DISCARD_FRAMES = 3
+
+
+def fourcc_to_str(value):
+    code = int(value)
+    if code <= 0:
+        return None
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4))
+
+
+def read_property(cap, name):
+    value = cap.get(PROPERTIES[name])
+    if name == "fourcc":
+        return fourcc_to_str(value)
+    if name in ("width", "height", "buffersize"):
+        return int(value)
+    return float(value)
+
+
+def write_property(cap, name, value):
+    """Aplica una propiedad; devuelve lo que informó el driver (True si la aceptó)."""
+    if name == "fourcc":
+        value = str(value)
+        if len(value) != 4:
+            raise ValueError("fourcc debe tener 4 caracteres (p.ej. 'MJPG')")
+        return cap.set(PROPERTIES[name], cv2.VideoWriter_fourcc(*value))
+    return cap.set(PROPERTIES[name], float(value))
+
+
+def validate_properties(values):
+    """Comprueba nombres y tipos; devuelve el dict normalizado en orden de aplicación."""
+    if not isinstance(values, dict) or not values:
+        raise ValueError("Se esperaba un objeto con propiedades")
+    unknown = [k for k in values if k not in PROPERTIES]
+    if unknown:
+        raise ValueError(f"Propiedades desconocidas: {', '.join(unknown)}")
+    ordered = {}
+    for name in sorted(values, key=lambda k: (APPLY_ORDER.index(k) if k in APPLY_ORDER
+                                               else len(APPLY_ORDER), k)):
+        value = values[name]
+        if name != "fourcc":
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Valor inválido para {name}: {value!r}")
+        ordered[name] = value
+    return ordered
@@ -0,0 +1,47 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class CaptureTimeline:
+    """
+    Línea de tiempo de captura compartida por todos los experimentos.
+    Los pasos pesados de cada tick (LED encendido + lecturas USB de las cámaras) se
+    ejecutan de a uno: dos experimentos cuyos ticks coinciden no compiten por el bus
+    ni se apagan los LEDs entre sí; el segundo espera a que termine el primero.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.owner = None      # experimento que ocupa la línea de tiempo
+        self.since = None
+        self.slots = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    @contextmanager
+    def slot(self, owner=None):
+        """Ocupa la línea de tiempo durante el bloque; devuelve los segundos esperados."""
+        t0 = time.perf_counter()
+        with self._lock:
+            waited = time.perf_counter() - t0
+            self.owner = owner
+            self.since = time.time()
+            self.slots += 1
+            self.total_wait_s += waited
+            self.max_wait_s = max(self.max_wait_s, waited)
+            try:
+                yield waited
+            finally:
+                self.owner = None
+                self.since = None
+
+    def status(self):
+        return {
+            'busy': self.owner is not None or self._lock.locked(),
+            'owner': self.owner,
+            'busy_for_s': round(time.time() - self.since, 2) if self.since else None,
+            'slots': self.slots,
+            'total_wait_s': round(self.total_wait_s, 2),
+            'max_wait_s': round(self.max_wait_s, 2),
+        }
@@ -0,0 +1,54 @@
+import cv2
+
+# Ancho de la firma reducida usada para comparar frames (el alto respeta la proporción)
+SIGNATURE_WIDTH = 64
+
+
+def frame_signature(frame, width=SIGNATURE_WIDTH):
+    """Versión reducida en escala de grises del frame (uint8), barata de comparar."""
+    h, w = frame.shape[:2]
+    height = max(1, int(round(h * width / float(w))))
+    small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return small
+
+
+def signature_difference(a, b):
+    """Diferencia absoluta media (0-255) entre dos firmas del mismo tamaño."""
+    if a is None or b is None or a.shape != b.shape:
+        return None
+    return float(cv2.mean(cv2.absdiff(a, b))[0])
+
+
+class ChangeDetector:
+    """
+    Decide si un frame merece guardarse comparándolo con el último frame guardado.
+    - threshold: diferencia media mínima (0-255) para considerar que hubo cambio.
+    - keyframe_every: fuerza un guardado cada K ticks aunque no haya cambio.
+    El primer frame siempre se guarda.
+    """
+
+    def __init__(self, threshold, keyframe_every=10):
+        self.threshold = float(threshold)
+        self.keyframe_every = max(1, int(keyframe_every))
+        self._reference = None       # firma del último frame guardado
+        self._since_stored = 0       # ticks desde el último guardado
+
+    def evaluate(self, frame):
+        """
+        Devuelve (store, metric, keyframe):
+            store: True si hay que guardar el frame
+            metric: diferencia con el último guardado (None si no hay referencia)
+            keyframe: True si se guarda por la regla de K ticks (o por ser el primero)
+        """
+        signature = frame_signature(frame)
+        metric = signature_difference(signature, self._reference)
+        self._since_stored += 1
+
+        keyframe = metric is None or self._since_stored >= self.keyframe_every
+        store = keyframe or metric >= self.threshold
+        if store:
+            self._reference = signature
+            self._since_stored = 0
+        return store, metric, keyframe
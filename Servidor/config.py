@@ -28,3 +28,71 @@ except PermissionError:
     )
 except Exception as e:
     raise SystemExit(f"ERROR: No se pudo preparar el directorio base: {e}")
+
+# --------------------------------------------------------------------
+# Buffer circular pre-disparo (RAM total para todas las cámaras)
+# --------------------------------------------------------------------
+# Los frames se guardan comprimidos en JPEG. En una Pi 3B (1 GB) conviene
+# no pasar de unas decenas de MB. Se puede cambiar con:
+#   export RING_BUFFER_MAX_MB=64
+# --------------------------------------------------------------------
+RING_BUFFER_MAX_BYTES = int(float(os.environ.get("RING_BUFFER_MAX_MB", "48")) * 1024 * 1024)
+
+# --------------------------------------------------------------------
+# Espacio libre mínimo a conservar en el disco de BASE_FOLDER_PATH
+# --------------------------------------------------------------------
+# Los experimentos se rechazan (o aplican su política de disco) antes de
+# bajar de este margen. Se puede cambiar con:
+#   export DISK_RESERVE_MB=500
+# --------------------------------------------------------------------
+DISK_RESERVE_BYTES = int(float(os.environ.get("DISK_RESERVE_MB", "200")) * 1024 * 1024)
+
+# --------------------------------------------------------------------
+# Vista en vivo: espectadores simultáneos por cámara
+# --------------------------------------------------------------------
+# Cada espectador de /video_feed lee y codifica frames; el límite evita que
+# muchas pestañas abiertas quiten tiempo a las capturas. Se puede cambiar con:
+#   export MAX_VIEWERS_PER_CAMERA=5
+# --------------------------------------------------------------------
+MAX_VIEWERS_PER_CAMERA = int(os.environ.get("MAX_VIEWERS_PER_CAMERA", "3"))
+
+# --------------------------------------------------------------------
+# Presupuesto del bus USB compartido por todas las cámaras
+# --------------------------------------------------------------------
+# En una Pi 3B todas las cámaras (y la red) comparten un único USB2. Al
+# iniciar se planifican formato y FPS para no superar este ancho de banda
+# (MB/s). USB_AUTO_PLAN=0 sólo informa el plan sin aplicarlo:
+#   export USB_BUDGET_MBPS=30
+#   export USB_AUTO_PLAN=0
+# --------------------------------------------------------------------
+USB_BUDGET_BYTES_PER_S = int(float(os.environ.get("USB_BUDGET_MBPS", "24")) * 1000 * 1000)
+USB_AUTO_PLAN = os.environ.get("USB_AUTO_PLAN", "1") not in ("0", "false", "no")
+
+# --------------------------------------------------------------------
+# Captura en procesos separados (un proceso y un núcleo por cámara)
+# --------------------------------------------------------------------
+# Con CAPTURE_PROCESSES=1 cada cámara lee y decodifica en su propio proceso, que
+# también reduce y codifica la vista en vivo; al proceso de la API sólo llegan
+# metadatos. Memoria por cámara: CAPTURE_PROCESS_SLOTS frames del perfil 'preview'
+# (640x480 -> ~0.9 MB) más un único slot del perfil más grande (2592x1944 -> ~15 MB).
+# CAPTURE_PROCESS_FRAME_MB fija el slot grande (0 = calcularlo de los perfiles):
+#   export CAPTURE_PROCESSES=1
+#   export CAPTURE_PROCESS_SLOTS=3
+#   export CAPTURE_PROCESS_FRAME_MB=0
+# --------------------------------------------------------------------
+CAPTURE_PROCESSES = os.environ.get("CAPTURE_PROCESSES", "0") not in ("0", "false", "no")
+CAPTURE_PROCESS_SLOTS = int(os.environ.get("CAPTURE_PROCESS_SLOTS", "3"))
+CAPTURE_PROCESS_FRAME_BYTES = int(float(os.environ.get("CAPTURE_PROCESS_FRAME_MB", "0")) * 1024 * 1024)
+
+# --------------------------------------------------------------------
+# Métricas del sistema (temperatura, CPU, RAM, disco)
+# --------------------------------------------------------------------
+# Un hilo las muestrea cada METRICS_INTERVAL_S segundos y /status devuelve
+# la última muestra. Se guardan METRICS_HISTORY muestras (1 h por defecto).
+# En /events sólo se conserva la última muestra ('metrics' es un tipo agrupado),
+# así que las métricas no desplazan a los demás eventos del historial:
+#   export METRICS_INTERVAL_S=2
+#   export METRICS_HISTORY=1800
+# --------------------------------------------------------------------
+METRICS_INTERVAL_S = float(os.environ.get("METRICS_INTERVAL_S", "5"))
+METRICS_HISTORY = int(os.environ.get("METRICS_HISTORY", "720"))
@@ -0,0 +1,219 @@
+import base64
+import fnmatch
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+SORT_KEYS = ("name", "mtime", "size")
+# Entradas por página si no se pide 'limit' y máximo aceptado
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+# Directorios recordados por la caché (LRU)
+CACHE_DIRS = 64
+# Un listado tomado a menos de esto de la última modificación del directorio no se
+# reutiliza: en sistemas de archivos con mtime grueso (FAT/exFAT: 2 s) un cambio
+# posterior podría no mover el mtime
+MTIME_SETTLE_S = 2.0
+
+
+class DirSnapshot:
+    """
+    Contenido de un directorio leído con scandir: nombres y si son carpetas (sin stat
+    por entrada). Tamaño y fecha se piden sólo si se ordena por ellos o se piden
+    detalles, y quedan guardados. Los órdenes calculados también se reutilizan.
+    """
+
+    def __init__(self, path, st):
+        self.path = path
+        self.ino = st.st_ino
+        self.mtime_ns = st.st_mtime_ns
+        self.scanned_at = time.time()
+        self.entries = []     # (nombre, es_carpeta)
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue   # ocultos (p. ej. la carpeta temporal de una prueba de viabilidad)
+                try:
+                    is_dir = entry.is_dir()
+                    if not is_dir and not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                self.entries.append((entry.name, is_dir))
+        self.digest = zlib.crc32("\0".join(
+            f"{'d' if d else 'f'}{n}" for n, d in sorted(self.entries)).encode("utf-8", "surrogateescape"))
+        self._stats = None
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    def is_current(self, st):
+        return (st.st_ino == self.ino and st.st_mtime_ns == self.mtime_ns
+                and self.scanned_at - st.st_mtime_ns / 1e9 > MTIME_SETTLE_S)
+
+    def stats(self):
+        """{nombre: (tamaño, mtime)}; un stat por entrada, sólo la primera vez."""
+        with self._lock:
+            if self._stats is None:
+                stats = {}
+                for name, _ in self.entries:
+                    try:
+                        st = os.stat(os.path.join(self.path, name))
+                        stats[name] = (st.st_size, st.st_mtime)
+                    except OSError:
+                        stats[name] = (0, 0.0)
+                self._stats = stats
+            return self._stats
+
+    def sort_value(self, name, sort):
+        if sort == "name":
+            return name.lower()
+        size, mtime = self.stats()[name]
+        return size if sort == "size" else mtime
+
+    def ordered(self, sort, reverse):
+        """Carpetas primero; dentro de cada grupo por 'sort' (y nombre para desempatar)."""
+        key = (sort, reverse)
+        with self._lock:
+            cached = self._orders.get(key)
+        if cached is not None:
+            return cached
+        groups = []
+        for want_dir in (True, False):
+            group = [(name, is_dir) for name, is_dir in self.entries if is_dir == want_dir]
+            group.sort(key=lambda e: (self.sort_value(e[0], sort), e[0]), reverse=reverse)
+            groups.extend(group)
+        positions = {name: i for i, (name, _) in enumerate(groups)}
+        with self._lock:
+            self._orders[key] = (groups, positions)
+        return groups, positions
+
+
+def encode_cursor(snapshot, entry, sort):
+    name, is_dir = entry
+    raw = json.dumps([0 if is_dir else 1, snapshot.sort_value(name, sort), name])
+    return base64.urlsafe_b64encode(raw.encode("utf-8", "surrogateescape")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        group, value, name = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return int(group), value, name
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError("Cursor inválido")
+
+
+def name_matcher(pattern):
+    """Patrón con comodines (*, ?, [) -> fnmatch; si no, 'contiene' (sin mayúsculas)."""
+    if not pattern:
+        return None
+    pattern = pattern.lower()
+    if any(c in pattern for c in "*?["):
+        return lambda name: fnmatch.fnmatchcase(name.lower(), pattern)
+    return lambda name: pattern in name.lower()
+
+
+class DirListingCache:
+    """Listados por directorio, invalidados por mtime (o explícitamente con invalidate)."""
+
+    def __init__(self, max_dirs=CACHE_DIRS):
+        self.max_dirs = int(max_dirs)
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()   # ruta absoluta -> DirSnapshot
+        self.hits = 0
+        self.misses = 0
+
+    def snapshot(self, path):
+        st = os.stat(path)
+        with self._lock:
+            snap = self._snapshots.get(path)
+            if snap is not None and snap.is_current(st):
+                self._snapshots.move_to_end(path)
+                self.hits += 1
+                return snap
+        snap = DirSnapshot(path, st)
+        with self._lock:
+            self.misses += 1
+            self._snapshots[path] = snap
+            self._snapshots.move_to_end(path)
+            while len(self._snapshots) > self.max_dirs:
+                self._snapshots.popitem(last=False)
+        return snap
+
+    def invalidate(self, path):
+        with self._lock:
+            self._snapshots.pop(path, None)
+
+    def status(self):
+        with self._lock:
+            return {'dirs': len(self._snapshots), 'hits': self.hits, 'misses': self.misses}
+
+
+def list_page(snapshot, folders_only=False, sort="name", reverse=False, pattern=None,
+              cursor=None, limit=DEFAULT_LIMIT, details=False):
+    """
+    Página del listado: carpetas y archivos (en ese orden) después de 'cursor'.
+    Devuelve folders, files, totales tras el filtro y next_cursor (None en la última).
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Orden inválido: {sort} (opciones: {', '.join(SORT_KEYS)})")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    match = name_matcher(pattern)
+    ordered, positions = snapshot.ordered(sort, reverse)
+
+    start = 0
+    if cursor:
+        group, value, name = decode_cursor(cursor)
+        if name in positions:
+            start = positions[name] + 1
+        else:
+            # La entrada del cursor ya no existe: primera posterior según el orden
+            start = len(ordered)
+            for i, (n, is_dir) in enumerate(ordered):
+                g = 0 if is_dir else 1
+                key, ckey = (snapshot.sort_value(n, sort), n), (value, name)
+                if g > group or (g == group and (key < ckey if reverse else key > ckey)):
+                    start = i
+                    break
+
+    folders, files, entries = [], [], []
+    total_folders = total_files = 0
+    last = None
+    for i, (name, is_dir) in enumerate(ordered):
+        if folders_only and not is_dir:
+            break   # las carpetas van primero: no queda ninguna
+        if match and not match(name):
+            continue
+        if is_dir:
+            total_folders += 1
+        else:
+            total_files += 1
+        if i < start or len(folders) + len(files) > limit:
+            continue
+        (folders if is_dir else files).append(name)
+        last = (name, is_dir)
+        if details:
+            size, mtime = snapshot.stats()[name]
+            entries.append({'name': name, 'type': 'dir' if is_dir else 'file',
+                            'size': None if is_dir else size, 'mtime': mtime})
+
+    # Se junta una entrada de más para saber si hay otra página
+    more = len(folders) + len(files) > limit
+    if more:
+        extra_dir = bool(files) is False
+        (folders if extra_dir else files).pop()
+        if details:
+            entries.pop()
+        last = (folders[-1], True) if not files else (files[-1], False)
+    result = {
+        'folders': folders,
+        'files': [] if folders_only else files,
+        'total_folders': total_folders,
+        'total_files': None if folders_only else total_files,
+        'next_cursor': encode_cursor(snapshot, last, sort) if more and last else None,
+    }
+    if details:
+        result['entries'] = entries
+    return result
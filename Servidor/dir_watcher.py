@@ -0,0 +1,195 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+from collections import OrderedDict
+
+# Máscaras de inotify (linux/inotify.h)
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT_HEADER = struct.Struct("iIII")   # wd, mask, cookie, len (+ nombre)
+
+# Directorios vigilados a la vez (los últimos listados) y período del modo sondeo
+MAX_WATCHES = 64
+POLL_S = 2.0
+
+
+def _load_inotify():
+    """Funciones de inotify de la libc, o None si no están (no Linux, libc sin inotify)."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        for name in ("inotify_init", "inotify_add_watch", "inotify_rm_watch"):
+            getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+    libc.inotify_rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+    return libc
+
+
+class DirWatcher:
+    """
+    Avisa altas y bajas de carpetas dentro de los directorios que se están mirando
+    (los últimos MAX_WATCHES listados con /list_dir) como eventos 'dir':
+    {'path': ruta relativa del directorio, 'name', 'change': 'added' | 'removed'}.
+    Cualquier cambio (también de archivos) invalida el listado en caché de ese directorio.
+    Usa inotify por ctypes; si no está disponible compara listados cada POLL_S segundos.
+    Si la cola del kernel se desborda publica {'change': 'rescan'} para que el cliente relea.
+    """
+
+    def __init__(self, base_path, events=None, cache=None, max_watches=MAX_WATCHES, poll_s=POLL_S):
+        self.base_path = os.path.abspath(base_path)
+        self.events = events
+        self.cache = cache
+        self.max_watches = int(max_watches)
+        self.poll_s = float(poll_s)
+        self._lock = threading.Lock()
+        self._watched = OrderedDict()   # ruta absoluta -> wd (inotify) o set de carpetas (sondeo)
+        self._paths = {}                # wd -> ruta absoluta
+        self._stop = threading.Event()
+        self.overflows = 0
+
+        self._libc = _load_inotify()
+        self._fd = -1
+        if self._libc is not None:
+            self._fd = self._libc.inotify_init()
+            if self._fd < 0:
+                print(f"[DirWatcher] inotify no disponible ({os.strerror(ctypes.get_errno())}); "
+                      f"se usa sondeo cada {self.poll_s} s")
+        self.mode = "inotify" if self._fd >= 0 else "poll"
+        target = self._read_loop if self.mode == "inotify" else self._poll_loop
+        self._thread = threading.Thread(target=target, daemon=True, name="dir-watcher")
+        self._thread.start()
+
+    # ---------- API ----------
+    def watch(self, abs_path):
+        """Empieza (o sigue) vigilando un directorio; olvida el menos reciente si hay demasiados."""
+        abs_path = os.path.abspath(abs_path)
+        with self._lock:
+            if abs_path in self._watched:
+                self._watched.move_to_end(abs_path)
+                return
+            if self.mode == "inotify":
+                wd = self._libc.inotify_add_watch(self._fd, os.fsencode(abs_path), WATCH_MASK)
+                if wd < 0:
+                    return
+                self._paths[wd] = abs_path
+                self._watched[abs_path] = wd
+            else:
+                self._watched[abs_path] = self._subdirs(abs_path)
+            while len(self._watched) > self.max_watches:
+                old_path, old = self._watched.popitem(last=False)
+                if self.mode == "inotify":
+                    self._paths.pop(old, None)
+                    self._libc.inotify_rm_watch(self._fd, old)
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        with self._lock:
+            return {'mode': self.mode, 'watched': [self._relative(p) for p in self._watched],
+                    'overflows': self.overflows}
+
+    # ---------- Internos ----------
+    def _relative(self, abs_path):
+        rel = os.path.relpath(abs_path, self.base_path)
+        return "" if rel == "." else rel.replace(os.sep, "/")
+
+    def _changed(self, abs_dir, name, change):
+        if self.cache is not None:
+            self.cache.invalidate(abs_dir)
+        if self.events and change:
+            self.events.publish("dir", {'path': self._relative(abs_dir), 'name': name, 'change': change})
+
+    def _forget(self, abs_path):
+        with self._lock:
+            wd = self._watched.pop(abs_path, None)
+            if self.mode == "inotify" and wd is not None:
+                self._paths.pop(wd, None)
+
+    def _read_loop(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], 1.0)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                print(f"[DirWatcher] Error leyendo inotify: {e}")
+                continue
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                raw = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length]
+                offset += _EVENT_HEADER.size + length
+                self._handle(wd, mask, os.fsdecode(raw.rstrip(b"\0")))
+        os.close(self._fd)
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Se perdieron eventos: se descarta toda la caché y el cliente relee
+            self.overflows += 1
+            with self._lock:
+                watched = list(self._watched)
+            for abs_dir in watched:
+                if self.cache is not None:
+                    self.cache.invalidate(abs_dir)
+            if self.events:
+                self.events.publish("dir", {'path': None, 'name': None, 'change': 'rescan'})
+            return
+        with self._lock:
+            abs_dir = self._paths.get(wd)
+        if abs_dir is None:
+            return
+        if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+            # El propio directorio desapareció (su padre, si se mira, avisa la baja)
+            self._forget(abs_dir)
+            if self.cache is not None:
+                self.cache.invalidate(abs_dir)
+            return
+        change = None
+        if mask & IN_ISDIR and not name.startswith("."):   # los ocultos no se listan
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                change = "added"
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                change = "removed"
+        self._changed(abs_dir, name, change)
+
+    @staticmethod
+    def _subdirs(abs_path):
+        try:
+            with os.scandir(abs_path) as it:
+                return {e.name for e in it if e.is_dir() and not e.name.startswith(".")}
+        except OSError:
+            return None
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_s):
+            with self._lock:
+                watched = list(self._watched.items())
+            for abs_dir, before in watched:
+                now = self._subdirs(abs_dir)
+                if now is None:
+                    self._forget(abs_dir)
+                    continue
+                if before is None or now == before:
+                    continue
+                for name in sorted(now - before):
+                    self._changed(abs_dir, name, "added")
+                for name in sorted(before - now):
+                    self._changed(abs_dir, name, "removed")
+                with self._lock:
+                    if abs_dir in self._watched:
+                        self._watched[abs_dir] = now
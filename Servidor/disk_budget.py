@@ -0,0 +1,69 @@
+import os
+import shutil
+
+from config import DISK_RESERVE_BYTES
+
+# Qué hacer cuando el disco se acerca al margen de reserva durante un experimento
+DISK_POLICIES = ("stop", "downgrade", "prune_thumbs")
+
+# Sobrecosto fijo por captura (línea de capturas.jsonl, entradas de índice, etc.)
+RECORD_OVERHEAD_BYTES = 512
+
+
+class InsufficientStorageError(RuntimeError):
+    """El experimento no entra en el disco; 'plan' trae el detalle de la estimación."""
+
+    def __init__(self, message, plan):
+        super().__init__(message)
+        self.plan = plan
+
+
+def free_bytes(path):
+    return shutil.disk_usage(path).free
+
+
+def plan_footprint(per_camera_bytes, ticks, path, reserve_bytes=DISK_RESERVE_BYTES):
+    """
+    Estima el espacio del experimento a partir del tamaño medido por captura y cámara.
+    Devuelve un dict serializable con la estimación y si entra en el disco.
+    """
+    per_tick = sum(per_camera_bytes.values()) + RECORD_OVERHEAD_BYTES * len(per_camera_bytes)
+    estimated = per_tick * int(ticks)
+    free = free_bytes(path)
+    return {
+        'ticks': int(ticks),
+        'per_camera_bytes': {str(k): int(v) for k, v in per_camera_bytes.items()},
+        'per_tick_bytes': int(per_tick),
+        'estimated_bytes': int(estimated),
+        'free_bytes': int(free),
+        'reserve_bytes': int(reserve_bytes),
+        'fits': estimated + reserve_bytes <= free,
+    }
+
+
+def prune_oldest(folders, bytes_needed, max_files=500):
+    """
+    Borra los archivos más viejos (por nombre = timestamp) de las carpetas indicadas
+    hasta liberar bytes_needed o borrar max_files. Devuelve (archivos, bytes) liberados.
+    """
+    entries = []
+    for folder in folders:
+        try:
+            with os.scandir(folder) as it:
+                entries.extend((e.name, e.path) for e in it if e.is_file(follow_symlinks=False))
+        except FileNotFoundError:
+            continue
+    entries.sort()
+
+    removed = freed = 0
+    for _, path in entries:
+        if freed >= bytes_needed or removed >= max_files:
+            break
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            continue
+        removed += 1
+        freed += size
+    return removed, freed
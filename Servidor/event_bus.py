@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from collections import deque
+
+# Tipos de evento publicados por el servidor
+EVENT_TYPES = ("tick", "experiment", "led", "camera", "metrics", "dir")
+# Eventos recientes conservados para clientes que se reconectan con Last-Event-ID
+EVENT_HISTORY = 500
+# Tipos periódicos de los que sólo se guarda el último: no ocupan lugar en el historial
+# ni desplazan a los demás eventos
+COALESCED_TYPES = ("metrics",)
+# Comentario SSE enviado si no hubo eventos (mantiene viva la conexión a través de proxies)
+KEEPALIVE_S = 15.0
+
+
+def format_sse(event):
+    """Evento -> bloque text/event-stream (id, event, data)."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+class EventBus:
+    """
+    Publicación de eventos del servidor para /events (SSE) y /events/poll (long-poll).
+    publish() no bloquea ni depende de los clientes: el evento queda en un historial
+    acotado y cada cliente lo lee a su ritmo por id. Un cliente demasiado lento (o que
+    se reconecta tarde) recibe un evento 'gap' con los ids perdidos.
+    De los tipos en 'coalesce' sólo se conserva el último evento, fuera del historial.
+    """
+
+    def __init__(self, history=EVENT_HISTORY, coalesce=COALESCED_TYPES):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=max(1, int(history)))
+        self._coalesce = frozenset(coalesce)
+        self._latest = {}      # tipo agrupado -> último evento
+        self._evicted = 0      # id más alto descartado del historial
+        self.seq = 0
+        self.clients = 0
+
+    def publish(self, event_type, data=None):
+        with self._cond:
+            self.seq += 1
+            event = {'id': self.seq, 'type': event_type, 'time': time.time(), 'data': data or {}}
+            if event_type in self._coalesce:
+                self._latest[event_type] = event
+            else:
+                if len(self._events) == self._events.maxlen:
+                    self._evicted = self._events[0]['id']
+                self._events.append(event)
+            self._cond.notify_all()
+        return event
+
+    def since(self, last_id, types=None):
+        """Eventos con id > last_id (más un 'gap' si el historial ya descartó alguno)."""
+        with self._cond:
+            return self._since_locked(last_id, types)
+
+    def _since_locked(self, last_id, types):
+        if last_id > self.seq:
+            last_id = 0   # id de una ejecución anterior del servidor
+        result = []
+        if last_id and last_id < self._evicted:
+            result.append({'id': self._evicted, 'type': 'gap', 'time': time.time(),
+                           'data': {'missed_from': last_id + 1, 'missed_to': self._evicted}})
+        # Los ids del historial no son consecutivos (faltan los agrupados): se recorre
+        # desde el final hasta el último ya visto
+        start = len(self._events)
+        while start > 0 and self._events[start - 1]['id'] > last_id:
+            start -= 1
+        pending = [self._events[i] for i in range(start, len(self._events))]
+        latest = [e for e in self._latest.values() if e['id'] > last_id]
+        if latest:
+            pending = sorted(pending + latest, key=lambda e: e['id'])
+        for event in pending:
+            if types is None or event['type'] in types:
+                result.append(event)
+        return result
+
+    def wait(self, last_id, timeout, types=None):
+        """Long-poll: espera hasta 'timeout' s a que haya eventos nuevos y los devuelve."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                events = self._since_locked(last_id, types)
+                if events:
+                    return events
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return []
+                # Los eventos hasta seq ya se revisaron (eran de otros tipos)
+                last_id = self.seq
+                self._cond.wait(remaining)
+
+    def stream(self, last_id=None, types=None, keepalive_s=KEEPALIVE_S):
+        """
+        Generador SSE para un cliente; termina cuando el cliente se desconecta.
+        Sin last_id (cliente nuevo, sin Last-Event-ID) empieza en los eventos siguientes:
+        el historial sólo se repite a quien se reconecta.
+        """
+        with self._cond:
+            self.clients += 1
+            if last_id is None:
+                last_id = self.seq
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                events = self.wait(last_id, keepalive_s, types)
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                for event in events:
+                    yield format_sse(event)
+                last_id = events[-1]['id']
+        finally:
+            with self._cond:
+                self.clients -= 1
+
+    def status(self):
+        with self._cond:
+            return {'seq': self.seq, 'buffered': len(self._events), 'clients': self.clients,
+                    'coalesced': sorted(self._coalesce)}
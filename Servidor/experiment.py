@@ -1,14 +1,83 @@
 import threading
 import time
 import os
+import json
+import math
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 
+from frame_stack import FrameStacker, STACK_MODES
+from hdr_merge import merge_brackets
+from change_detector import ChangeDetector
+from quality_metrics import capture_quality, SharpnessMonitor, make_alert
+from image_storage import (STORAGE_FORMATS, EXTENSIONS, DEFAULT_QUALITY, DEFAULT_PNG_COMPRESSION,
+                           encode_image, write_bytes, NpyStore, resize_to_width)
+from frame_pack import FramePack
+from timelapse_preview import TimelapsePreview, TIMELAPSE_WIDTH
+from thumbnails import thumbnail_path, write_jpeg, THUMB_WIDTH, MID_WIDTH, THUMB_DIR, MID_DIR
+from disk_budget import (DISK_POLICIES, InsufficientStorageError, plan_footprint, free_bytes,
+                         prune_oldest)
+from capture_timeline import CaptureTimeline
+
+CONTAINERS = ("files", "pack")
+
+# Tamaño supuesto por captura si no se pudo medir una cámara al iniciar
+FALLBACK_CAPTURE_BYTES = 1024 * 1024
+# Límite inferior de calidad al aplicar la política 'downgrade'
+MIN_DOWNGRADE_QUALITY = 40
+
+# Tiempo de estabilización entre pasos de bracketing (el LED ya estaba encendido)
+BRACKET_SETTLE_S = 0.2
+
+# Prueba de viabilidad: ticks simulados y margen sobre el peor tick medido
+DRY_RUN_TICKS = 5
+DRY_RUN_MARGIN = 1.25
+
+# Registro por captura (una línea JSON por cámara y tick, incluidas las omitidas)
+CAPTURE_LOG_NAME = "capturas.jsonl"
+
+
+def timing_summary(values):
+    """Percentiles (p50/p90/p99, interpolados) y máximo de una lista de duraciones en segundos."""
+    ordered = sorted(values)
+    if not ordered:
+        return {'p50': None, 'p90': None, 'p99': None, 'max': None}
+
+    def pct(p):
+        pos = (len(ordered) - 1) * p / 100.0
+        lo = int(pos)
+        hi = min(lo + 1, len(ordered) - 1)
+        return round(ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo), 3)
+
+    return {'p50': pct(50), 'p90': pct(90), 'p99': pct(99), 'max': round(ordered[-1], 3)}
+
+
+def resolve_camera_ids(camera_manager, camera_ids):
+    """Subconjunto válido de cámaras detectadas; None, vacío o sin válidas = todas."""
+    detected = set(camera_manager.cameras)
+    if camera_ids:
+        # Filtra a sólo cámaras válidas detectadas por CameraManager
+        selected = sorted({int(c) for c in camera_ids if int(c) in detected})
+        if selected:
+            return selected
+    return sorted(detected)
+
 
 class Experiment:
-    def __init__(self, camera_manager, led_controller, dht_sensor):
+    def __init__(self, camera_manager, led_controller, dht_sensor, timeline=None, events=None):
         self.camera_manager = camera_manager
         self.led_controller = led_controller
         self.dht_sensor = dht_sensor
+        # Línea de tiempo compartida con otros experimentos (ver ExperimentScheduler)
+        self.timeline = timeline or CaptureTimeline()
+        # EventBus opcional: publica un evento 'tick' al terminar cada captura
+        self.events = events
+        self.experiment_id = None
+        self.started_at = None
+        self.error = None
 
         self.save_path = None
         self.duration = 0  # segundos
@@ -17,32 +86,250 @@ class Experiment:
         # NUEVO: subconjunto activo de cámaras (lista de enteros)
         self.camera_ids = None
 
+        # Apilado de ráfagas: N frames por cámara y tick combinados en una imagen
+        self.stack_frames = 1
+        self.stack_mode = "mean"
+        self._stackers = {}   # cam_id -> FrameStacker (buffers reutilizados)
+
+        # Captura fresca: descartar frames encolados en el driver antes de cada captura
+        self.fresh_frames = True
+        # Perfil de propiedades de cámara (resolución, formato...) usado al capturar
+        self.camera_profile = "capture"
+
+        # Bracketing HDR: brillos LED (1-100) recorridos en cada tick
+        self.bracket = None
+        self.keep_brackets = False
+
+        # Captura por cambio: sólo se guarda si difiere del último guardado (o cada K ticks)
+        self.change_threshold = None
+        self.keyframe_every = 10
+        self._detectors = {}  # cam_id -> ChangeDetector
+
+        # Registro de capturas
+        self._tick = 0
+        self._capture_log = None
+        self._log_lock = threading.Lock()  # el tick y el hilo de escritura registran
+        self.captures_stored = 0
+        self.captures_skipped = 0
+        self.captures_failed = 0
+        # Salud de la cámara al capturar: las capturas con cámara no 'ok' quedan marcadas
+        self.captures_unhealthy = 0
+        self._tick_health = {}   # cam_id -> estado de salud en la última captura
+        self.last_results = {}   # cam_id -> resultado de la última captura registrada
+
+        # Calidad por captura (enfoque / exposición) y alertas de desenfoque
+        self.last_quality = {}   # cam_id -> métricas de la última captura
+        self._sharpness = {}     # cam_id -> SharpnessMonitor
+        self.alerts = deque(maxlen=50)
+
+        # Formato de almacenamiento: jpeg / png / webp o 'npy' (array crudo por cámara)
+        self.image_format = "jpeg"
+        self.image_quality = DEFAULT_QUALITY
+        self.png_compression = DEFAULT_PNG_COMPRESSION
+        self.encode_workers = 0     # >0: codificar en procesos aparte
+        self._encoder_pool = None
+        self._npy_stores = {}       # cam_id -> NpyStore
+        # Contenedor: 'files' (un archivo por tick) o 'pack' (capturas.pack + índice por cámara)
+        self.container = "files"
+        self._packs = {}            # cam_id -> FramePack
+        # Time-lapse reducido por cámara, actualizado con cada captura guardada
+        self._previews = {}         # cam_id -> TimelapsePreview
+        # Miniaturas junto a cada captura (thumbs/) y vista intermedia opcional (previews/)
+        self.thumbnails = True
+        self.mid_previews = False
+
+        # Presupuesto de disco: estimación al iniciar y política si el disco se llena
+        self.disk_policy = "stop"
+        self.disk_plan = None
+        self.stop_reason = None
+
+        # Escritura en segundo plano (combinar + guardar) fuera de la ventana del LED
+        self._writer = None
+        self._pending = {}    # cam_id -> Future del último guardado de esa cámara
+
         self._thread = None
         self._stop_event = threading.Event()
         self.running = False
 
     # ================== API ==================
-    def start(self, save_path, duration_sec, interval_sec, camera_ids=None):
+    def start(self, save_path, duration_sec, interval_sec, camera_ids=None, **options):
         """
         Inicia el experimento. Si camera_ids es None o vacío, usa todas las detectadas.
+        Las opciones de captura se describen en _prepare.
         """
         if self.running:
             raise RuntimeError("Experimento ya en ejecución")
+        self._prepare(save_path, duration_sec, interval_sec, camera_ids, **options)
+
+        self._stop_event.clear()
+        self.error = None
+        self.started_at = time.time()
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def dry_run(self, target_path, duration_sec, interval_sec, camera_ids=None,
+                ticks=DRY_RUN_TICKS, **options):
+        """
+        Prueba de viabilidad: ejecuta 'ticks' ticks seguidos por el mismo camino que un
+        experimento real (LED, cámaras, codificación, escritura a disco) en una carpeta
+        oculta temporal dentro de target_path, para medir el mismo disco en el que
+        correría el experimento; la carpeta se borra siempre al terminar.
+        Devuelve percentiles de la duración de cada tick y el intervalo mínimo seguro.
+        Usar sobre una instancia aparte: no debe haber otro experimento usando las cámaras.
+        """
+        if self.running:
+            raise RuntimeError("Experimento ya en ejecución")
+        ticks = max(1, int(ticks))
+        capture_s, total_s = [], []
+        work_dir = tempfile.mkdtemp(prefix=".prueba_", dir=target_path)
+        try:
+            options['force'] = True   # el plan de disco se informa, no bloquea la prueba
+            self._prepare(work_dir, duration_sec, interval_sec, camera_ids,
+                          npy_capacity=ticks, plan_path=target_path, **options)
+            for _ in range(ticks):
+                t0 = time.perf_counter()
+                self._capture_tick()
+                t1 = time.perf_counter()
+                # Incluye el guardado en segundo plano: el siguiente tick lo esperaría
+                self._drain_pending()
+                capture_s.append(t1 - t0)
+                total_s.append(time.perf_counter() - t0)
+        finally:
+            self._close_outputs()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        total = timing_summary(total_s)
+        min_safe = max(1, int(math.ceil(total['max'] * DRY_RUN_MARGIN)))
+        return {
+            'ticks': ticks,
+            'camera_ids': self.camera_ids,
+            'capture_s': timing_summary(capture_s),
+            'total_s': total,
+            'min_safe_interval': min_safe,
+            'interval': self.interval,
+            'interval_ok': self.interval >= min_safe,
+            'captures_stored': self.captures_stored,
+            'captures_failed': self.captures_failed,
+            'captures_unhealthy': self.captures_unhealthy,
+            'disk_plan': self.disk_plan,
+        }
+
+    def _prepare(self, save_path, duration_sec, interval_sec, camera_ids=None,
+                 stack_frames=1, stack_mode="mean", bracket=None, keep_brackets=False,
+                 change_threshold=None, keyframe_every=10, image_format="jpeg",
+                 image_quality=DEFAULT_QUALITY, png_compression=DEFAULT_PNG_COMPRESSION,
+                 encode_workers=0, container="files", thumbnails=None, mid_previews=False,
+                 disk_policy="stop", force=False, npy_capacity=None, fresh_frames=True,
+                 camera_profile="capture", plan_path=None):
+        """
+        Valida las opciones y deja listos carpetas, registros, contenedores y el hilo
+        de escritura (sin lanzar el bucle de ticks).
+        stack_frames > 1 captura esa cantidad de frames por cámara y tick y guarda
+        su media ('mean') o mediana ('median').
+        bracket: lista de brillos LED (1-100); en cada tick se captura un frame por
+        brillo y se guarda la fusión HDR (keep_brackets guarda además cada frame).
+        Requiere exposición fija en la cámara para que el brillo del LED sea la exposición.
+        change_threshold: si se indica, sólo se guarda la imagen cuando la diferencia media
+        (0-255, sobre una versión reducida) con la última guardada lo supera; se fuerza un
+        guardado cada keyframe_every ticks. Todas las capturas quedan en capturas.jsonl.
+        image_format: 'jpeg' (image_quality), 'png' (png_compression 0-9), 'webp'
+        (image_quality) o 'npy' (segmentos .npy memory-mapped por cámara, un frame por tick).
+        encode_workers > 0 codifica en ese número de procesos; el registro guarda el
+        tiempo de codificación y el tamaño de cada captura.
+        container='pack' agrega cada imagen codificada a Microscopio<N>/capturas.pack
+        (con índice capturas.idx) en lugar de crear un archivo por tick.
+        thumbnails / mid_previews: genera en el hilo de escritura una miniatura
+        (thumbs/<ts>.jpg) y opcionalmente una vista intermedia (previews/<ts>.jpg).
+        thumbnails=None (por defecto) las genera sólo con container='files' y formatos de
+        imagen: con 'pack' o 'npy' se evita volver a crear un archivo por tick.
+        Antes de empezar se mide el tamaño real de una captura por cámara y se estima el
+        total; si no entra en el disco se lanza InsufficientStorageError (force=True sólo
+        advierte). Durante la corrida, al acercarse a la reserva se aplica disk_policy:
+        'stop', 'downgrade' (baja calidad / quita vistas intermedias) o 'prune_thumbs'.
+        fresh_frames: descarta los buffers que el driver tenía encolados antes de cada
+        captura, así ninguna imagen muestra el estado previo al encendido del LED.
+        camera_profile: perfil de propiedades de cámara para las capturas (None = dejar
+        la cámara como esté); sólo se reaplica si otro uso lo cambió.
+        npy_capacity: máximo de frames por segmento .npy (por defecto, los que entran en
+        NPY_CHUNK_BYTES).
+        plan_path: carpeta cuyo disco se usa para el plan de espacio (por defecto save_path).
+        """
+        stack_frames = int(stack_frames)
+        if stack_frames < 1:
+            raise ValueError("stack_frames debe ser >= 1")
+        if stack_mode not in STACK_MODES:
+            raise ValueError(f"stack_mode debe ser uno de {', '.join(STACK_MODES)}")
+        if bracket:
+            bracket = [int(v) for v in bracket]
+            if len(bracket) < 2 or any(v < 1 or v > 100 for v in bracket):
+                raise ValueError("bracket debe tener al menos 2 brillos entre 1 y 100")
+            if stack_frames > 1:
+                raise ValueError("stack_frames y bracket no se pueden combinar")
+            if not self.led_controller or not hasattr(self.led_controller, "set_brightness"):
+                raise ValueError("El bracketing requiere control de brillo de LED")
+        else:
+            bracket = None
+        if change_threshold is not None:
+            change_threshold = float(change_threshold)
+            if change_threshold < 0:
+                raise ValueError("change_threshold debe ser >= 0")
+        keyframe_every = int(keyframe_every)
+        if keyframe_every < 1:
+            raise ValueError("keyframe_every debe ser >= 1")
+        if image_format not in STORAGE_FORMATS:
+            raise ValueError(f"image_format debe ser uno de {', '.join(STORAGE_FORMATS)}")
+        image_quality = int(image_quality)
+        if not 1 <= image_quality <= 100:
+            raise ValueError("image_quality debe estar entre 1 y 100")
+        png_compression = int(png_compression)
+        if not 0 <= png_compression <= 9:
+            raise ValueError("png_compression debe estar entre 0 y 9")
+        encode_workers = max(0, int(encode_workers))
+        if container not in CONTAINERS:
+            raise ValueError(f"container debe ser uno de {', '.join(CONTAINERS)}")
+        if container == "pack" and image_format == "npy":
+            raise ValueError("El formato npy ya es un contenedor; use container='files'")
+        if thumbnails is None:
+            thumbnails = container == "files" and image_format != "npy"
+        if disk_policy not in DISK_POLICIES:
+            raise ValueError(f"disk_policy debe ser uno de {', '.join(DISK_POLICIES)}")
+        camera_profile = camera_profile or None
+        if camera_profile is not None and camera_profile not in self.camera_manager.profiles:
+            raise ValueError(f"Perfil de cámara desconocido: {camera_profile}")
+        # Se fija ya: la medición de tamaño de abajo captura con el mismo perfil
+        self.camera_profile = camera_profile
 
         self.save_path = save_path
         self.duration = int(duration_sec)
         self.interval = int(interval_sec)
 
         # Sanitiza subconjunto de cámaras
-        if camera_ids:
-            # Filtra a sólo cámaras válidas detectadas por CameraManager
-            detected = set(self.camera_manager.cameras)
-            self.camera_ids = sorted({int(c) for c in camera_ids if int(c) in detected})
-            if not self.camera_ids:
-                # Si la lista viene inválida, cae en todas
-                self.camera_ids = sorted(list(detected))
-        else:
-            self.camera_ids = sorted(list(self.camera_manager.cameras))
+        self.camera_ids = resolve_camera_ids(self.camera_manager, camera_ids)
+
+        if bracket:
+            # Todas las cámaras deben tener LED mapeado (get_brightness lanza ValueError si no)
+            for cam_id in self.camera_ids:
+                try:
+                    self.led_controller.get_brightness(cam_id)
+                except ValueError:
+                    raise ValueError(f"Cámara {cam_id} sin LED: no se puede usar bracketing")
+
+        # === Presupuesto de disco (antes de crear nada) ===
+        per_camera = self._measure_capture_bytes(
+            image_format, image_quality, png_compression, bool(thumbnails), bool(mid_previews),
+            len(bracket) if bracket and keep_brackets else 0)
+        ticks = self.duration // max(1, self.interval) + 1
+        self.disk_plan = plan_footprint(per_camera, ticks, plan_path or self.save_path)
+        self.disk_plan['warnings'] = []
+        if not self.disk_plan['fits']:
+            msg = (f"El experimento necesita ~{self.disk_plan['estimated_bytes'] / 1e9:.2f} GB y hay "
+                   f"{self.disk_plan['free_bytes'] / 1e9:.2f} GB libres "
+                   f"(reserva {self.disk_plan['reserve_bytes'] / 1e6:.0f} MB)")
+            if not force:
+                raise InsufficientStorageError(msg, self.disk_plan)
+            self.disk_plan['warnings'].append(msg)
+            print(f"[Experiment] Advertencia: {msg}")
 
         # Crear subcarpetas sólo para las cámaras seleccionadas
         for cam_id in self.camera_ids:
@@ -55,10 +342,72 @@ class Experiment:
         with open(resumen_path, 'w') as f:
             f.write("=== Resumen de lecturas DHT11 ===\n")
 
-        self._stop_event.clear()
-        self.running = True
-        self._thread = threading.Thread(target=self._run, daemon=True)
-        self._thread.start()
+        self.stack_frames = stack_frames
+        self.stack_mode = stack_mode
+        self.fresh_frames = bool(fresh_frames)
+        self.bracket = bracket
+        self.keep_brackets = bool(keep_brackets)
+        self.change_threshold = change_threshold
+        self.keyframe_every = keyframe_every
+        self._detectors = {}
+        if self.change_threshold is not None:
+            self._detectors = {cam_id: ChangeDetector(self.change_threshold, self.keyframe_every)
+                               for cam_id in self.camera_ids}
+
+        self._tick = 0
+        self.captures_stored = 0
+        self.captures_skipped = 0
+        self.captures_failed = 0
+        self.captures_unhealthy = 0
+        self._tick_health = {}
+        self.last_results = {}
+        self.last_quality = {}
+        self._sharpness = {cam_id: SharpnessMonitor() for cam_id in self.camera_ids}
+        self.alerts.clear()
+        self._capture_log = open(os.path.join(self.save_path, CAPTURE_LOG_NAME), 'w')
+        self._stackers = {}
+        if self.stack_frames > 1:
+            self._stackers = {cam_id: FrameStacker(self.stack_frames, self.stack_mode)
+                              for cam_id in self.camera_ids}
+        self.image_format = image_format
+        self.image_quality = image_quality
+        self.png_compression = png_compression
+        self.encode_workers = encode_workers
+        self._npy_stores = {}
+        if self.image_format == "npy":
+            self._npy_stores = {
+                cam_id: NpyStore(os.path.join(self.save_path, f"Microscopio{cam_id}", "frames"),
+                                 chunk_frames=npy_capacity)
+                for cam_id in self.camera_ids}
+
+        self.container = container
+        self.disk_policy = disk_policy
+        self.stop_reason = None
+        self.thumbnails = bool(thumbnails)
+        self.mid_previews = bool(mid_previews)
+        self._packs = {}
+        if self.container == "pack":
+            self._packs = {
+                cam_id: FramePack(os.path.join(self.save_path, f"Microscopio{cam_id}", "capturas"),
+                                  mode="a", ext=EXTENSIONS[self.image_format])
+                for cam_id in self.camera_ids}
+
+        self._previews = {}
+        for cam_id in self.camera_ids:
+            try:
+                self._previews[cam_id] = TimelapsePreview(self.save_path, cam_id)
+            except Exception as e:
+                print(f"[Experiment] Sin vista previa para cámara {cam_id}: {e}")
+
+        self._pending = {}
+        self._encoder_pool = None
+        writer_threads = 1
+        if self.encode_workers and self.image_format != "npy":
+            self._encoder_pool = ProcessPoolExecutor(max_workers=self.encode_workers)
+            # Un hilo por cámara para que las codificaciones en procesos se solapen;
+            # _wait_pending mantiene a lo sumo una captura en vuelo por cámara.
+            writer_threads = max(1, len(self.camera_ids))
+        self._writer = ThreadPoolExecutor(max_workers=writer_threads, thread_name_prefix="exp-writer")
 
     def stop(self):
         if not self.running:
@@ -67,7 +416,45 @@ class Experiment:
         if self._thread:
             self._thread.join()
         self.running = False
-        self._led_off_selected()
+        with self.timeline.slot(self.experiment_id):
+            self._led_off_selected()
+
+    def status_info(self):
+        """Estado y configuración del experimento (bloque 'experiment' de /status)."""
+        return {
+            'experiment_id': self.experiment_id,
+            'running': self.running,
+            'save_path': self.save_path,
+            'duration': self.duration,
+            'interval': self.interval,
+            'camera_ids': self.camera_ids,  # subconjunto activo (o todas)
+            'stack_frames': self.stack_frames,
+            'stack_mode': self.stack_mode,
+            'fresh_frames': self.fresh_frames,
+            'camera_profile': self.camera_profile,
+            'bracket': self.bracket,
+            'keep_brackets': self.keep_brackets,
+            'change_threshold': self.change_threshold,
+            'keyframe_every': self.keyframe_every,
+            'captures_stored': self.captures_stored,
+            'captures_skipped': self.captures_skipped,
+            'captures_failed': self.captures_failed,
+            'image_format': self.image_format,
+            'image_quality': self.image_quality,
+            'png_compression': self.png_compression,
+            'encode_workers': self.encode_workers,
+            'container': self.container,
+            'thumbnails': self.thumbnails,
+            'mid_previews': self.mid_previews,
+            'disk_policy': self.disk_policy,
+            'disk_plan': self.disk_plan,
+            'stop_reason': self.stop_reason,
+            'error': self.error,
+            'started_at': self.started_at,
+            'tick': self._tick,
+            'quality': self.last_quality,   # métricas de la última captura por cámara
+            'alerts': list(self.alerts),
+        }
 
     # ================== Internos ==================
     def _run(self):
@@ -81,18 +468,81 @@ class Experiment:
                     self._capture_tick()
                     # Programa el siguiente tick sumando interval (evita drift acumulado grande)
                     next_capture += self.interval
+                    self._publish_tick(start_time, next_capture)
                 else:
                     time.sleep(0.1)
+        except Exception as e:
+            self.error = str(e)
+            print(f"[Experiment] Error en el experimento {self.experiment_id}: {e}")
         finally:
             self.running = False
+            self._close_outputs()
+
+    def _publish_tick(self, start_time, next_capture):
+        """Evento 'tick': contadores, próxima captura y resultado de la última por cámara."""
+        if not self.events:
+            return
+        end = start_time + self.duration
+        with self._log_lock:
+            results = {cam_id: dict(r) for cam_id, r in self.last_results.items()}
+            counters = {'stored': self.captures_stored, 'skipped': self.captures_skipped,
+                        'failed': self.captures_failed, 'unhealthy': self.captures_unhealthy}
+        self.events.publish("tick", {
+            'experiment_id': self.experiment_id,
+            'tick': self._tick,
+            'elapsed_s': round(time.time() - start_time, 1),
+            'remaining_s': round(max(0.0, end - time.time()), 1),
+            'duration': self.duration,
+            'next_capture_at': next_capture if next_capture < end else None,
+            'captures': counters,
+            'results': results,
+            'stop_reason': self.stop_reason,
+        })
+
+    def _close_outputs(self):
+        """Apaga LEDs, espera los guardados pendientes y cierra almacenes y registro."""
+        with self.timeline.slot(self.experiment_id):
             self._led_off_selected()
+        if self._writer:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+        if self._encoder_pool:
+            self._encoder_pool.shutdown(wait=True)
+            self._encoder_pool = None
+        for store in self._npy_stores.values():
+            try:
+                store.close()
+            except Exception as e:
+                print(f"[Experiment] Error cerrando {store.folder}: {e}")
+        for pack in self._packs.values():
+            pack.close()
+        for preview in self._previews.values():
+            preview.close()
+        with self._log_lock:
+            if self._capture_log:
+                self._capture_log.close()
+                self._capture_log = None
 
     def _capture_tick(self):
+        if not self._check_disk():
+            return
+        # Guardados del tick anterior: se esperan antes de tomar la línea de tiempo, así
+        # una escritura lenta no retiene el LED ni la vista en vivo de otros experimentos
+        self._drain_pending()
+        # LED + lecturas USB: de a un experimento por vez en la línea de tiempo compartida,
+        # con la vista en vivo de estas cámaras en pausa durante la ventana de captura
+        with self.timeline.slot(self.experiment_id), \
+                self.camera_manager.capture_window(self.camera_ids):
+            self._capture_tick_locked()
+
+    def _capture_tick_locked(self):
         # Encender LEDs sólo de cámaras seleccionadas (si hay API por-cámara); si no, fallback a all_on()
         self._led_on_selected()
         time.sleep(0.5)  # Tiempo para estabilizar iluminación
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._tick += 1
+        tick = self._tick
 
         # === Lectura DHT11 ===
         resumen_path = os.path.join(self.save_path, "resumen_dht.txt")
@@ -109,24 +559,362 @@ class Experiment:
             else:
                 f.write(f"{timestamp} - Lectura DHT11 fallida\n")
 
+        # === Bracketing HDR: recorre los brillos y fusiona en segundo plano ===
+        if self.bracket:
+            self._capture_bracketed(tick, timestamp)
+            self._led_off_selected()
+            return
+
         # === Captura de fotos sólo de cámaras seleccionadas ===
+        # (la escritura a disco se hace en el hilo de escritura, fuera de la ventana del LED)
         for cam_id in self.camera_ids:
-            cam_folder = os.path.join(self.save_path, f"Microscopio{cam_id}")
-            photo_path = os.path.join(cam_folder, f"{timestamp}.jpg")
             try:
-                # Puedes usar take_photo (compat) o save_snapshot (más robusto) si lo añadiste al CameraManager
-                if hasattr(self.camera_manager, "save_snapshot"):
-                    ok = self.camera_manager.save_snapshot(cam_id, photo_path)
-                    if not ok:
-                        raise RuntimeError("save_snapshot devolvió False")
+                if cam_id in self._stackers:
+                    self._capture_stacked(cam_id, tick, timestamp)
                 else:
-                    self.camera_manager.take_photo(cam_id, photo_path)
+                    frame = self.camera_manager.grab_frame(cam_id, fresh=self.fresh_frames,
+                                                           profile=self.camera_profile)
+                    self._note_health(cam_id)
+                    if frame is None:
+                        raise RuntimeError("grab_frame devolvió None")
+                    self._pending[cam_id] = self._writer.submit(
+                        self._store_capture, cam_id, tick, timestamp, frame)
             except Exception as e:
                 print(f"[Experiment] Error tomando foto cámara {cam_id}: {e}")
+                self._note_health(cam_id)
+                self._log_capture({"tick": tick, "timestamp": timestamp, "cam_id": cam_id,
+                                   "stored": False, "file": None, "error": str(e)})
 
         # Apagar LEDs seleccionados / todos según disponibilidad
         self._led_off_selected()
 
+    # ================== Presupuesto de disco ==================
+    def _measure_capture_bytes(self, fmt, quality, png_compression, thumbs, mid, kept_brackets):
+        """
+        Mide, con el LED encendido como en un tick real, cuánto ocupa una captura por
+        cámara en el formato elegido (más miniaturas, vista previa y brackets guardados).
+        """
+        sizes = {}
+        with self.timeline.slot(self.experiment_id), \
+                self.camera_manager.capture_window(self.camera_ids):
+            self._led_on_selected()
+            try:
+                time.sleep(0.5)
+                for cam_id in self.camera_ids:
+                    frame = self.camera_manager.grab_frame(cam_id, fresh=True,
+                                                           profile=self.camera_profile)
+                    if frame is None:
+                        sizes[cam_id] = FALLBACK_CAPTURE_BYTES
+                        continue
+                    if fmt == "npy":
+                        main = frame.nbytes
+                    else:
+                        main = len(encode_image(frame, fmt, quality, png_compression)[0])
+                    total = main * (1 + kept_brackets)
+                    mid_img = resize_to_width(frame, MID_WIDTH)
+                    if mid:
+                        total += len(encode_image(mid_img, "jpeg", 75)[0])
+                    small = resize_to_width(mid_img, TIMELAPSE_WIDTH)
+                    total += len(encode_image(small, "jpeg", 70)[0])
+                    if thumbs:
+                        total += len(encode_image(resize_to_width(small, THUMB_WIDTH), "jpeg", 75)[0])
+                    sizes[cam_id] = total
+            finally:
+                self._led_off_selected()
+        return sizes
+
+    def _check_disk(self):
+        """
+        Verifica el espacio libre antes de cada tick. Si se acerca a la reserva aplica la
+        política configurada. Devuelve False si el experimento debe detenerse.
+        """
+        plan = self.disk_plan or {}
+        reserve = plan.get('reserve_bytes', 0)
+        needed = reserve + 2 * plan.get('per_tick_bytes', FALLBACK_CAPTURE_BYTES)
+        try:
+            free = free_bytes(self.save_path)
+        except OSError:
+            return True
+        if free >= needed:
+            return True
+
+        policy = self.disk_policy
+        if policy == "prune_thumbs":
+            folders = []
+            for cam_id in self.camera_ids:
+                cam_folder = os.path.join(self.save_path, f"Microscopio{cam_id}")
+                folders += [os.path.join(cam_folder, MID_DIR), os.path.join(cam_folder, THUMB_DIR)]
+            removed, freed = prune_oldest(folders, needed - free)
+            if removed:
+                self._disk_alert(f"Disco casi lleno: se borraron {removed} miniaturas ({freed / 1e6:.1f} MB)")
+                if free + freed >= needed:
+                    return True
+        elif policy == "downgrade" and self._downgrade_storage():
+            return True
+
+        self._disk_alert(f"Disco casi lleno ({free / 1e6:.0f} MB libres): experimento detenido")
+        self.stop_reason = "disk_full"
+        self._stop_event.set()
+        return False
+
+    def _downgrade_storage(self):
+        """Reduce el costo por captura un escalón. Devuelve False si ya no hay margen."""
+        if self.mid_previews:
+            self.mid_previews = False
+            self._disk_alert("Disco casi lleno: se desactivan las vistas intermedias")
+            return True
+        if self.image_format in ("jpeg", "webp") and self.image_quality > MIN_DOWNGRADE_QUALITY:
+            self.image_quality = max(MIN_DOWNGRADE_QUALITY, self.image_quality - 15)
+            self._disk_alert(f"Disco casi lleno: calidad reducida a {self.image_quality}")
+            return True
+        if self.image_format == "png" and self.png_compression < 9:
+            self.png_compression = 9
+            self._disk_alert("Disco casi lleno: compresión PNG al máximo")
+            return True
+        return False
+
+    def _disk_alert(self, message):
+        print(f"[Experiment] {message}")
+        self.alerts.append(make_alert(None, message, tick=self._tick, kind="disk"))
+
+    # ================== Apilado de ráfagas ==================
+    def _capture_stacked(self, cam_id, tick, timestamp):
+        """
+        Captura la ráfaga dentro de la ventana del LED y deja la combinación y el
+        guardado al hilo de escritura. _capture_tick ya esperó el guardado del tick
+        anterior de la cámara, así el acumulador se reutiliza (memoria acotada).
+        """
+        stacker = self._stackers[cam_id]
+        stacker.reset()
+        got = self.camera_manager.grab_burst(cam_id, stacker.count, stacker.add,
+                                             fresh=self.fresh_frames, profile=self.camera_profile)
+        self._note_health(cam_id)
+        if got == 0:
+            raise RuntimeError("grab_burst no devolvió frames")
+        self._pending[cam_id] = self._writer.submit(self._write_stacked, cam_id, tick, timestamp)
+
+    # ================== Bracketing HDR ==================
+    def _capture_bracketed(self, tick, timestamp):
+        """
+        Para cada brillo del bracket: ajusta los LEDs, espera estabilización y toma un
+        frame por cámara. Restaura el brillo guardado al final y deja la fusión al
+        hilo de escritura, así el bracketing sólo suma tiempo de captura.
+        """
+        saved = {cam_id: self.led_controller.get_brightness(cam_id) for cam_id in self.camera_ids}
+        frames = {cam_id: [] for cam_id in self.camera_ids}
+        levels = {cam_id: [] for cam_id in self.camera_ids}
+        try:
+            for level in self.bracket:
+                for cam_id in self.camera_ids:
+                    self.led_controller.set_brightness(cam_id, level)
+                    self.led_controller.on_for_camera(cam_id)
+                time.sleep(BRACKET_SETTLE_S)
+                for cam_id in self.camera_ids:
+                    frame = self.camera_manager.grab_frame(cam_id, fresh=self.fresh_frames,
+                                                           profile=self.camera_profile)
+                    self._note_health(cam_id)
+                    if frame is None:
+                        print(f"[Experiment] Bracket {level}% sin frame en cámara {cam_id}")
+                        continue
+                    frames[cam_id].append(frame)
+                    levels[cam_id].append(level)
+        finally:
+            for cam_id, value in saved.items():
+                try:
+                    self.led_controller.set_brightness(cam_id, value)
+                except Exception:
+                    pass
+
+        for cam_id in self.camera_ids:
+            if not frames[cam_id]:
+                print(f"[Experiment] Error tomando brackets cámara {cam_id}: sin frames")
+                self._log_capture({"tick": tick, "timestamp": timestamp, "cam_id": cam_id,
+                                   "stored": False, "file": None, "error": "sin frames"})
+                continue
+            self._pending[cam_id] = self._writer.submit(
+                self._write_bracketed, cam_id, tick, timestamp, frames[cam_id], levels[cam_id])
+
+    def _write_bracketed(self, cam_id, tick, timestamp, frames, levels):
+        try:
+            if len(frames) > 1:
+                _, merged = merge_brackets(frames, levels)
+            else:
+                merged = frames[0]
+        except Exception as e:
+            print(f"[Experiment] Error fusionando brackets cámara {cam_id}: {e}")
+            merged = frames[-1]
+        extra = None
+        if self.keep_brackets:
+            extra = [(f"_led{level:03d}", frame) for frame, level in zip(frames, levels)]
+        self._store_capture(cam_id, tick, timestamp, merged, extra_frames=extra)
+
+    def _write_stacked(self, cam_id, tick, timestamp):
+        frame = self._stackers[cam_id].combine()
+        if frame is None:
+            print(f"[Experiment] Error guardando ráfaga cámara {cam_id}: sin frames")
+            return
+        self._store_capture(cam_id, tick, timestamp, frame)
+
+    # ================== Guardado (hilo de escritura) ==================
+    def _wait_pending(self, cam_id):
+        """Espera el guardado anterior de la cámara (a lo sumo una captura en vuelo por cámara)."""
+        prev = self._pending.get(cam_id)
+        if prev is not None:
+            prev.result()
+
+    def _drain_pending(self):
+        """Espera los guardados en vuelo de todas las cámaras (fuera de la ventana de captura)."""
+        for cam_id in self.camera_ids:
+            try:
+                self._wait_pending(cam_id)
+            except Exception as e:
+                print(f"[Experiment] Error guardando captura anterior cámara {cam_id}: {e}")
+
+    def _photo_path(self, cam_id, timestamp, suffix="", fmt=None):
+        ext = EXTENSIONS[fmt or self.image_format]
+        return os.path.join(self.save_path, f"Microscopio{cam_id}", f"{timestamp}{suffix}{ext}")
+
+    def _encode(self, frame, fmt):
+        """Codifica en el pool de procesos si está activo; si no, en este hilo."""
+        args = (frame, fmt, self.image_quality, self.png_compression)
+        if self._encoder_pool is not None:
+            return self._encoder_pool.submit(encode_image, *args).result()
+        return encode_image(*args)
+
+    def _write_image(self, cam_id, timestamp, frame, record, extra_frames=None):
+        """Guarda la captura en el formato configurado y anota archivo, tamaño y tiempo."""
+        if self.image_format == "npy":
+            store = self._npy_stores[cam_id]
+            t0 = time.perf_counter()
+            chunk_path, record["index"] = store.append(frame)
+            record["encode_ms"] = round((time.perf_counter() - t0) * 1000.0, 2)
+            record["bytes"] = int(frame.nbytes)
+            record["file"] = os.path.relpath(chunk_path, self.save_path)
+            extra_fmt = "png"   # los brackets sueltos se guardan sin pérdida
+        else:
+            data, encode_ms = self._encode(frame, self.image_format)
+            pack = self._packs.get(cam_id)
+            if pack is not None:
+                record["index"] = pack.append(data, time.time())
+                record["file"] = os.path.relpath(pack.data_path, self.save_path)
+            else:
+                photo_path = self._photo_path(cam_id, timestamp)
+                write_bytes(data, photo_path)
+                record["file"] = os.path.relpath(photo_path, self.save_path)
+            record["encode_ms"] = round(encode_ms, 2)
+            record["bytes"] = len(data)
+            extra_fmt = self.image_format
+        record["format"] = self.image_format
+
+        for suffix, extra in extra_frames or []:
+            data, _ = self._encode(extra, extra_fmt)
+            write_bytes(data, self._photo_path(cam_id, timestamp, suffix, fmt=extra_fmt))
+
+    def _store_capture(self, cam_id, tick, timestamp, frame, extra_frames=None):
+        """
+        Decide si guardar (captura por cambio), escribe la imagen y registra la captura.
+        extra_frames: lista opcional [(sufijo, frame)] que se guarda junto a la principal.
+        """
+        record = {"tick": tick, "timestamp": timestamp, "cam_id": cam_id,
+                  "stored": False, "file": None}
+        try:
+            self._score_capture(cam_id, frame, record)
+
+            store = True
+            detector = self._detectors.get(cam_id)
+            if detector is not None:
+                store, metric, keyframe = detector.evaluate(frame)
+                record["change"] = round(metric, 3) if metric is not None else None
+                record["keyframe"] = keyframe
+
+            if store:
+                self._write_image(cam_id, timestamp, frame, record, extra_frames)
+                record["stored"] = True
+                self._write_derivatives(cam_id, timestamp, frame, record)
+        except Exception as e:
+            print(f"[Experiment] Error guardando foto cámara {cam_id}: {e}")
+            record["error"] = str(e)
+        self._log_capture(record)
+
+    def _write_derivatives(self, cam_id, timestamp, frame, record):
+        """
+        Pirámide de reducciones de la captura: vista intermedia -> frame del time-lapse
+        -> miniatura. Cada nivel se reduce desde el anterior, no desde el original.
+        """
+        cam_folder = os.path.join(self.save_path, f"Microscopio{cam_id}")
+        try:
+            mid = resize_to_width(frame, MID_WIDTH)
+            if self.mid_previews:
+                path = thumbnail_path(cam_folder, timestamp, "mid")
+                if write_jpeg(mid, path):
+                    record["mid"] = os.path.relpath(path, self.save_path)
+
+            small = resize_to_width(mid, TIMELAPSE_WIDTH)
+            preview = self._previews.get(cam_id)
+            if preview is not None:
+                preview.append(frame, small=small)
+
+            if self.thumbnails:
+                path = thumbnail_path(cam_folder, timestamp, "thumb")
+                if write_jpeg(resize_to_width(small, THUMB_WIDTH), path):
+                    record["thumb"] = os.path.relpath(path, self.save_path)
+        except Exception as e:
+            print(f"[Experiment] Error generando miniaturas cámara {cam_id}: {e}")
+
+    def _score_capture(self, cam_id, frame, record):
+        """Calcula métricas de calidad, las agrega al registro y dispara alertas de enfoque."""
+        try:
+            quality = capture_quality(frame)
+        except Exception as e:
+            print(f"[Experiment] Error calculando calidad cámara {cam_id}: {e}")
+            return
+        monitor = self._sharpness.get(cam_id)
+        if monitor is not None:
+            message = monitor.update(quality['sharpness'])
+            quality['baseline_sharpness'] = monitor.baseline
+            if message:
+                print(f"[Experiment] Alerta cámara {cam_id}: {message}")
+                self.alerts.append(make_alert(cam_id, message, tick=record['tick'],
+                                              sharpness=quality['sharpness'],
+                                              baseline=monitor.baseline))
+        record['quality'] = quality
+        self.last_quality[cam_id] = quality
+
+    def _note_health(self, cam_id):
+        """
+        Guarda el estado de salud de la cámara al capturar; el registro de esa captura
+        lo lee más tarde (a lo sumo una captura en vuelo por cámara).
+        """
+        state = self.camera_manager.health_state(cam_id)
+        prev = self._tick_health.get(cam_id)
+        # En bracketing se guarda el peor estado de los pasos del tick
+        if prev == "failed" or (prev == "degraded" and state == "ok"):
+            return
+        self._tick_health[cam_id] = state
+
+    def _log_capture(self, record):
+        health = self._tick_health.pop(record.get("cam_id"), None)
+        if health not in (None, "ok"):
+            record["camera_health"] = health
+        with self._log_lock:
+            if health not in (None, "ok"):
+                self.captures_unhealthy += 1
+            if record.get("error"):
+                self.captures_failed += 1
+            elif record.get("stored"):
+                self.captures_stored += 1
+            else:
+                self.captures_skipped += 1
+            self.last_results[record.get("cam_id")] = {
+                k: record.get(k) for k in ("tick", "stored", "file", "error", "camera_health")}
+            if self._capture_log is None:
+                return
+            try:
+                self._capture_log.write(json.dumps(record) + "\n")
+                self._capture_log.flush()
+            except Exception as e:
+                print(f"[Experiment] Error escribiendo {CAPTURE_LOG_NAME}: {e}")
+
     # ================== LEDs helpers ==================
     def _led_on_selected(self):
         """
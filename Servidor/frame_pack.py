@@ -0,0 +1,159 @@
+import os
+import struct
+import zlib
+from datetime import datetime
+
+# Cabecera del índice: magia + extensión de las imágenes (rellena a 8 bytes)
+_INDEX_MAGIC = b"FPAKIDX1"
+_HEADER_SIZE = 16
+# Entrada del índice: offset (u64), largo (u32), crc32 (u32), timestamp (f64)
+_ENTRY = struct.Struct("<QIId")
+
+PACK_EXT = ".pack"
+INDEX_EXT = ".idx"
+
+
+class FramePack:
+    """
+    Contenedor de frames codificados por cámara: un archivo de datos con las imágenes
+    concatenadas (<nombre>.pack) y un índice de entradas de tamaño fijo (<nombre>.idx).
+
+    - Append seguro ante cortes: primero se escriben (y sincronizan) los datos y después
+      la entrada del índice. Al reabrir, se descartan entradas incompletas y los bytes
+      de datos que no llegaron a indexarse.
+    - Acceso aleatorio barato: la entrada i está en HEADER + i * 24 bytes del índice.
+    """
+
+    def __init__(self, base_path, mode="r", ext=".jpg", fsync=True):
+        """
+        base_path: ruta sin extensión (se usan base_path.pack y base_path.idx)
+        mode: 'r' lectura, 'a' agregar (crea si no existe)
+        """
+        self.data_path = base_path + PACK_EXT
+        self.index_path = base_path + INDEX_EXT
+        self.mode = mode
+        self.fsync = fsync
+        self.ext = ext
+
+        # Sólo el modo 'a' mantiene archivos abiertos; las lecturas abren por llamada
+        # (así un lector ve los frames que el escritor agrega mientras tanto).
+        self._data = None
+        self._index = None
+        if mode == "a":
+            os.makedirs(os.path.dirname(self.data_path) or ".", exist_ok=True)
+            self._recover()
+            self._data = open(self.data_path, "ab")
+            self._index = open(self.index_path, "ab")
+        elif mode == "r":
+            self._read_header()
+        else:
+            raise ValueError(f"Modo no válido: {mode}")
+
+    # ---------- Apertura / recuperación ----------
+    def _read_header(self):
+        with open(self.index_path, "rb") as f:
+            header = f.read(_HEADER_SIZE)
+        if len(header) != _HEADER_SIZE or header[:8] != _INDEX_MAGIC:
+            raise ValueError(f"Índice inválido: {self.index_path}")
+        self.ext = header[8:].rstrip(b"\0").decode("ascii") or self.ext
+
+    def _recover(self):
+        """Deja índice y datos consistentes tras un posible corte a mitad de escritura."""
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) < _HEADER_SIZE:
+            with open(self.index_path, "wb") as f:
+                f.write(_INDEX_MAGIC + self.ext.encode("ascii").ljust(8, b"\0"))
+            with open(self.data_path, "wb"):
+                pass
+            return
+
+        data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        with open(self.index_path, "r+b") as f:
+            header = f.read(_HEADER_SIZE)
+            if header[:8] != _INDEX_MAGIC:
+                raise ValueError(f"Índice inválido: {self.index_path}")
+            self.ext = header[8:].rstrip(b"\0").decode("ascii") or self.ext
+            count = (os.path.getsize(self.index_path) - _HEADER_SIZE) // _ENTRY.size
+            # Retrocede hasta la última entrada cuyos datos existen completos
+            end = 0
+            while count > 0:
+                f.seek(_HEADER_SIZE + (count - 1) * _ENTRY.size)
+                offset, length, _, _ = _ENTRY.unpack(f.read(_ENTRY.size))
+                if offset + length <= data_size:
+                    end = offset + length
+                    break
+                count -= 1
+            f.truncate(_HEADER_SIZE + count * _ENTRY.size)
+        with open(self.data_path, "r+b") as f:
+            f.truncate(end)
+
+    # ---------- Escritura ----------
+    def append(self, data, ts):
+        """Agrega una imagen codificada; devuelve su índice."""
+        offset = self._data.seek(0, os.SEEK_END)
+        self._data.write(data)
+        self._data.flush()
+        if self.fsync:
+            os.fsync(self._data.fileno())
+
+        index_pos = self._index.seek(0, os.SEEK_END)
+        self._index.write(_ENTRY.pack(offset, len(data), zlib.crc32(data), float(ts)))
+        self._index.flush()
+        if self.fsync:
+            os.fsync(self._index.fileno())
+        return (index_pos - _HEADER_SIZE) // _ENTRY.size
+
+    # ---------- Lectura ----------
+    def __len__(self):
+        return max(0, (os.path.getsize(self.index_path) - _HEADER_SIZE) // _ENTRY.size)
+
+    def entry(self, i):
+        """Devuelve (offset, length, crc32, timestamp) de la entrada i."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Frame {i} fuera de rango")
+        with open(self.index_path, "rb") as f:
+            f.seek(_HEADER_SIZE + i * _ENTRY.size)
+            return _ENTRY.unpack(f.read(_ENTRY.size))
+
+    def read(self, i):
+        """Devuelve (bytes, timestamp) del frame i, verificando el CRC."""
+        offset, length, crc, ts = self.entry(i)
+        with open(self.data_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        if zlib.crc32(data) != crc:
+            raise ValueError(f"CRC inválido en frame {i}")
+        return data, ts
+
+    def export(self, out_dir, start=0, end=None):
+        """Escribe los frames [start, end) como archivos sueltos; devuelve cuántos escribió."""
+        os.makedirs(out_dir, exist_ok=True)
+        end = len(self) if end is None else min(int(end), len(self))
+        written = 0
+        for i in range(max(0, int(start)), end):
+            data, ts = self.read(i)
+            name = datetime.fromtimestamp(ts).strftime("%Y%m%d_%H%M%S") + f"_{i:06d}{self.ext}"
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(data)
+            written += 1
+        return written
+
+    def close(self):
+        for f in (self._data, self._index):
+            if f is None:
+                continue
+            try:
+                f.close()
+            except Exception:
+                pass
+        self._data = None
+        self._index = None
+
+
+def pack_base_path(path):
+    """Acepta 'x.pack', 'x.idx' o 'x' y devuelve la ruta base sin extensión."""
+    for ext in (PACK_EXT, INDEX_EXT):
+        if path.endswith(ext):
+            return path[:-len(ext)]
+    return path
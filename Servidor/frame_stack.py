@@ -0,0 +1,91 @@
+import cv2
+import numpy as np
+
+STACK_MODES = ("mean", "median")
+
+
+class FrameStacker:
+    """
+    Combina N frames consecutivos de una cámara en una sola imagen (menos ruido).
+    - 'mean': acumula cada frame en un único acumulador float32 preasignado (cv2.accumulate).
+    - 'median': guarda la ráfaga en un buffer N x H x W x C preasignado y calcula la
+      mediana por partición in-place (la mediana necesita todos los frames).
+    Los buffers se reservan una vez por cámara y se reutilizan en cada tick; sólo se
+    re-asignan si cambia la resolución.
+    """
+
+    def __init__(self, count, mode="mean"):
+        if mode not in STACK_MODES:
+            raise ValueError(f"Modo de apilado no válido: {mode}")
+        self.count = max(1, int(count))
+        self.mode = mode
+        self.filled = 0
+
+        self._acc = None     # float32 H x W x C (modo mean)
+        self._burst = None   # uint8 N x H x W x C (modo median)
+        self._out = None     # uint8 H x W x C (resultado reutilizable)
+
+    # ---------- Buffers ----------
+    def _ensure_buffers(self, shape):
+        if self._out is not None and self._out.shape == shape:
+            return
+        self._out = np.empty(shape, dtype=np.uint8)
+        if self.mode == "mean":
+            self._acc = np.empty(shape, dtype=np.float32)
+            self._burst = None
+        else:
+            self._burst = np.empty((self.count,) + shape, dtype=np.uint8)
+            self._acc = None
+
+    def reset(self):
+        self.filled = 0
+
+    # ---------- Captura (hilo del tick) ----------
+    def add(self, frame):
+        """
+        Agrega un frame a la ráfaga actual. Devuelve False si ya está completa
+        o si el frame no coincide en tamaño con los anteriores.
+        """
+        if self.filled >= self.count:
+            return False
+        if self.filled == 0:
+            self._ensure_buffers(frame.shape)
+        elif frame.shape != self._out.shape:
+            return False
+
+        if self.mode == "mean":
+            if self.filled == 0:
+                self._acc[...] = frame
+            else:
+                cv2.accumulate(frame, self._acc)
+        else:
+            np.copyto(self._burst[self.filled], frame)
+        self.filled += 1
+        return True
+
+    # ---------- Combinación (hilo de escritura) ----------
+    def combine(self):
+        """
+        Devuelve la imagen combinada (uint8) o None si no hay frames.
+        El array devuelto se reutiliza en el siguiente tick: consumirlo antes de
+        volver a llamar add().
+        """
+        n = self.filled
+        if n == 0:
+            return None
+        if self.mode == "mean":
+            # acc / n redondeado, sin arrays temporales
+            self._acc *= 1.0 / n
+            self._acc += 0.5
+            np.copyto(self._out, self._acc, casting="unsafe")
+        else:
+            # Partición in-place sobre la ráfaga (se descarta después): sin copias
+            frames = self._burst[:n]
+            mid = n // 2
+            if n % 2:
+                frames.partition(mid, axis=0)
+                np.copyto(self._out, frames[mid])
+            else:
+                frames.partition((mid - 1, mid), axis=0)
+                cv2.addWeighted(frames[mid - 1], 0.5, frames[mid], 0.5, 0, dst=self._out)
+        return self._out
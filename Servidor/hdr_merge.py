@@ -0,0 +1,66 @@
+import numpy as np
+
+# Peso gaussiano centrado en el gris medio: los píxeles bien expuestos pesan más
+_WELL_EXPOSED_SIGMA = 0.2
+# Peso mínimo para que un píxel saturado en todos los brackets no divida por cero
+_MIN_WEIGHT = 1e-4
+
+
+def merge_brackets(frames, levels):
+    """
+    Fusiona frames capturados con distintos brillos de LED en una imagen HDR.
+
+    :param frames: lista de frames uint8 BGR del mismo tamaño (uno por bracket)
+    :param levels: brillo LED (1-100) usado en cada frame; se toma como exposición relativa
+    :return: (radiance, tonemapped)
+        - radiance: float32 H x W x C, radiancia relativa a la exposición máxima
+        - tonemapped: uint8 H x W x C, listo para guardar como imagen normal
+
+    Se acumula bracket por bracket (num += w * I / e, den += w): la memoria no crece con
+    la cantidad de brackets (dos acumuladores y dos buffers de trabajo H x W x C).
+    """
+    if not frames:
+        raise ValueError("No hay frames para fusionar")
+    if len(frames) != len(levels):
+        raise ValueError("frames y levels deben tener el mismo largo")
+
+    shape = frames[0].shape
+    num = np.zeros(shape, dtype=np.float32)
+    den = np.zeros(shape, dtype=np.float32)
+    value = np.empty(shape, dtype=np.float32)
+    weight = np.empty(shape, dtype=np.float32)
+    top = float(max(levels))
+    for frame, level in zip(frames, levels):
+        np.multiply(frame, 1.0 / 255.0, out=value, casting="unsafe")
+
+        # w = exp(-(I - 0.5)^2 / (2 sigma^2))
+        np.subtract(value, 0.5, out=weight)
+        np.square(weight, out=weight)
+        weight *= -1.0 / (2.0 * _WELL_EXPOSED_SIGMA ** 2)
+        np.exp(weight, out=weight)
+        weight += _MIN_WEIGHT
+        den += weight
+
+        # Radiancia = sum(w * I / e) / sum(w), con e = brillo relativo al máximo
+        value *= top / float(level)
+        value *= weight
+        num += value
+
+    radiance = num
+    radiance /= den
+    return radiance, tonemap(radiance)
+
+
+def tonemap(radiance):
+    """
+    Reinhard global extendido: L * (1 + L / Lw^2) / (1 + L), con Lw = máximo de la escena.
+    Devuelve uint8 en el rango completo 0-255.
+    """
+    lw = float(np.percentile(radiance, 99.9))
+    lw = max(lw, 1e-6)
+    out = radiance * (1.0 + radiance / (lw * lw))
+    out /= (1.0 + radiance)
+    # Con esta curva L = Lw vale exactamente 1.0 (blanco)
+    out *= 255.0
+    np.clip(out, 0, 255, out=out)
+    return out.astype(np.uint8)
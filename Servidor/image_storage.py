@@ -0,0 +1,147 @@
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+STORAGE_FORMATS = ("jpeg", "png", "webp", "npy")
+EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+DEFAULT_QUALITY = 95        # JPEG / WebP (1-100)
+DEFAULT_PNG_COMPRESSION = 3  # PNG (0-9): 3 es el punto rápido de zlib
+# Tamaño máximo de cada segmento .npy (lo único mapeado a la vez por cámara)
+NPY_CHUNK_BYTES = 256 * 1024 * 1024
+
+
+def encode_params(fmt, quality=DEFAULT_QUALITY, png_compression=DEFAULT_PNG_COMPRESSION):
+    if fmt == "jpeg":
+        return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    if fmt == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    raise ValueError(f"Formato sin codificador de imagen: {fmt}")
+
+
+def encode_image(frame, fmt, quality=DEFAULT_QUALITY, png_compression=DEFAULT_PNG_COMPRESSION):
+    """
+    Codifica un frame y devuelve (bytes, encode_ms).
+    Es una función de módulo para poder ejecutarse en un ProcessPoolExecutor.
+    """
+    t0 = time.perf_counter()
+    ok, buf = cv2.imencode(EXTENSIONS[fmt], frame, encode_params(fmt, quality, png_compression))
+    if not ok:
+        raise RuntimeError(f"cv2.imencode falló ({fmt})")
+    return buf.tobytes(), (time.perf_counter() - t0) * 1000.0
+
+
+def write_bytes(data, out_path):
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, 'wb') as f:
+        f.write(data)
+
+
+class NpyStore:
+    """
+    Almacén crudo por cámara en segmentos: <carpeta>/frames_00000.npy, frames_00001.npy...
+    cada uno memory-mapped (n x H x W x C, uint8) para a lo sumo chunk_frames frames.
+    Sólo el segmento en curso está mapeado, así la memoria virtual y el espacio
+    preasignado quedan acotados (32 bits, FAT/exFAT sin archivos dispersos).
+    index.json lista los segmentos y sus frames; close() recorta el último segmento y
+    su cabecera a los frames escritos, así cada uno se abre con np.load(..., mmap_mode='r').
+    """
+
+    def __init__(self, folder, chunk_frames=None, chunk_bytes=NPY_CHUNK_BYTES):
+        self.folder = folder
+        self.chunk_frames = int(chunk_frames) if chunk_frames else None
+        self.chunk_bytes = int(chunk_bytes)
+        self.count = 0
+        self.chunks = []        # [{'file', 'count'}] de los segmentos ya cerrados
+        self.shape = None
+        self.path = None        # segmento en curso
+        self._mm = None
+        self._capacity = 0      # frames del segmento en curso
+        self._written = 0
+
+    def append(self, frame):
+        """Agrega un frame; devuelve (ruta del segmento, índice dentro del segmento)."""
+        if self.shape is None:
+            self.shape = frame.shape
+            frame_bytes = max(1, int(frame.nbytes))
+            by_bytes = max(1, self.chunk_bytes // frame_bytes)
+            self.chunk_frames = min(self.chunk_frames, by_bytes) if self.chunk_frames else by_bytes
+        if frame.shape != self.shape:
+            raise ValueError(f"Tamaño de frame {frame.shape} distinto al del almacén {self.shape}")
+        if self._mm is not None and self._written >= self._capacity:
+            self._close_chunk()
+        if self._mm is None:
+            self._open_chunk()
+        index = self._written
+        self._mm[index] = frame
+        self._written += 1
+        self.count += 1
+        return self.path, index
+
+    def _open_chunk(self):
+        os.makedirs(self.folder, exist_ok=True)
+        self.path = os.path.join(self.folder, f"frames_{len(self.chunks):05d}.npy")
+        self._capacity = self.chunk_frames
+        self._written = 0
+        self._mm = np.lib.format.open_memmap(
+            self.path, mode='w+', dtype=np.uint8, shape=(self._capacity,) + self.shape)
+
+    def _close_chunk(self):
+        """Cierra el segmento en curso (recortando la cabecera si quedó incompleto)."""
+        frame_bytes = int(np.prod(self.shape))
+        self._mm.flush()
+        del self._mm
+        self._mm = None
+        if self._written < self._capacity:
+            _rewrite_npy_shape(self.path, (self._written,) + self.shape, frame_bytes)
+        self.chunks.append({'file': os.path.basename(self.path), 'count': self._written})
+        self._write_index()
+
+    def _write_index(self):
+        index = {
+            'dtype': 'uint8',
+            'shape': list(self.shape),
+            'chunk_frames': self.chunk_frames,
+            'count': sum(c['count'] for c in self.chunks),
+            'chunks': self.chunks,
+        }
+        tmp = os.path.join(self.folder, "index.json.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp, os.path.join(self.folder, "index.json"))
+
+    def close(self):
+        if self._mm is None:
+            return
+        self._close_chunk()
+
+
+def _rewrite_npy_shape(path, shape, frame_bytes):
+    """Reescribe la forma en la cabecera .npy (mismo largo, relleno con espacios) y trunca."""
+    with open(path, 'r+b') as f:
+        major, _ = np.lib.format.read_magic(f)
+        len_size = 2 if major == 1 else 4
+        header_len = int.from_bytes(f.read(len_size), 'little')
+        data_offset = f.tell() + header_len
+
+        header = repr({'descr': '|u1', 'fortran_order': False, 'shape': tuple(shape)})
+        header = header.ljust(header_len - 1) + '\n'
+        if len(header) != header_len:
+            raise RuntimeError("No se pudo reescribir la cabecera .npy")
+        f.seek(data_offset - header_len)
+        f.write(header.encode('latin1'))
+        f.truncate(data_offset + shape[0] * frame_bytes)
+
+
+def resize_to_width(frame, width):
+    """Reduce el frame a 'width' de ancho (manteniendo proporción); no agranda."""
+    h, w = frame.shape[:2]
+    if w <= width:
+        return frame
+    height = max(1, int(round(h * width / float(w))))
+    return cv2.resize(frame, (int(width), height), interpolation=cv2.INTER_AREA)
@@ -10,18 +10,21 @@ class LedController:
     - 'off' apaga sin perder el valor de brillo almacenado.
     """
 
-    def __init__(self, cam_pin_map, pwm_freq=1000, default_brightness=100):
+    def __init__(self, cam_pin_map, pwm_freq=1000, default_brightness=100, events=None):
         """
         cam_pin_map: dict {camera_id: gpio_bcm_pin}
         pwm_freq: frecuencia PWM en Hz (por defecto 1 kHz)
         default_brightness: brillo por defecto (0-100) cuando nunca se ha configurado
+        events: EventBus opcional; publica un evento 'led' cuando cambia encendido o brillo
         """
+        self.events = events
         self.cam_pin_map = dict(cam_pin_map)
         self.pwm_freq = int(pwm_freq)
         self.default_brightness = max(0, min(100, int(default_brightness)))
 
         self._pwm = {}          # cam_id -> PWM
         self._brightness = {}   # cam_id -> 0..100 (persistente en memoria)
+        self._lit = {}          # cam_id -> encendido (según la última orden on/off)
 
         GPIO.setmode(GPIO.BCM)
         for cam_id, pin in self.cam_pin_map.items():
@@ -30,40 +33,34 @@ class LedController:
             pwm.start(0)  # inicia apagado
             self._pwm[cam_id] = pwm
             self._brightness[cam_id] = self.default_brightness
+            self._lit[cam_id] = False
 
     # -------- Brillo por cámara --------
     def set_brightness(self, cam_id, value):
         """
-        Establece el brillo (0-100) y aplica al PWM si el LED está "encendido".
-        Nota: Encendido significa que el duty != 0. Para encender, usa on()/on_for_camera().
+        Establece el brillo (0-100) y lo aplica al PWM sólo si el LED está encendido
+        (según on/off); apagado, el duty queda en 0 y el brillo se usa al encender.
+        Para encender, usa on()/on_for_camera().
         """
         if cam_id not in self._pwm:
             raise ValueError(f"LED sin mapeo para cámara {cam_id}")
 
         value = max(0, min(100, int(value)))
+        changed = value != self._brightness.get(cam_id)
         self._brightness[cam_id] = value
 
-        # Si actualmente está encendido (duty>0), actualiza duty al nuevo brillo
-        # Para saber si está encendido, simplemente aplicamos el nuevo duty:
-        # - Si estaba apagado y quieres mantener apagado, no lo encendemos aquí.
-        #   'set_brightness' solo actualiza el valor; 'on' decide encender.
-        current_duty = self._get_current_duty(cam_id)
-        if current_duty > 0 or value == 0:
+        # 'set_brightness' solo actualiza el valor; 'on' decide encender.
+        # Así el duty nunca contradice a is_on() ni a los eventos 'led'.
+        if self.is_on(cam_id):
             self._pwm[cam_id].ChangeDutyCycle(value)
+        if changed:
+            self._notify(cam_id)
 
     def get_brightness(self, cam_id):
         if cam_id not in self._brightness:
             raise ValueError(f"LED sin mapeo para cámara {cam_id}")
         return int(self._brightness[cam_id])
 
-    def _get_current_duty(self, cam_id):
-        """
-        No hay API pública para leer duty actual en RPi.GPIO;
-        para mantener simple, devolvemos el valor guardado si duty>0,
-        pero como no lo distinguimos, usamos el brillo guardado como referencia.
-        """
-        return self._brightness.get(cam_id, 0)
-
     # -------- Encendido / Apagado por cámara --------
     def on_for_camera(self, cam_id):
         """
@@ -73,6 +70,7 @@ class LedController:
             return
         duty = self._brightness.get(cam_id, self.default_brightness)
         self._pwm[cam_id].ChangeDutyCycle(duty)
+        self._set_lit(cam_id, True)
 
     def off_for_camera(self, cam_id):
         """
@@ -81,6 +79,20 @@ class LedController:
         if cam_id not in self._pwm:
             return
         self._pwm[cam_id].ChangeDutyCycle(0)
+        self._set_lit(cam_id, False)
+
+    def is_on(self, cam_id):
+        return bool(self._lit.get(cam_id))
+
+    def _set_lit(self, cam_id, lit):
+        if self._lit.get(cam_id) != lit:
+            self._lit[cam_id] = lit
+            self._notify(cam_id)
+
+    def _notify(self, cam_id):
+        if self.events:
+            self.events.publish("led", {'cam_id': cam_id, 'on': self.is_on(cam_id),
+                                        'brightness': self._brightness.get(cam_id)})
 
     def set_for_camera(self, cam_id, state: bool):
         if state:
@@ -119,7 +131,7 @@ class LedController:
         time.sleep(max(0, duration_ms) / 1000.0)
         # si el LED estaba encendido, volvemos al brillo previo; si estaba apagado,
         # dejamos duty=0 (para no encenderlo "de paso")
-        if prev > 0:
+        if self.is_on(cam_id):
             self._pwm[cam_id].ChangeDutyCycle(prev)
         else:
             self._pwm[cam_id].ChangeDutyCycle(0)
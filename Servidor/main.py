@@ -1,11 +1,26 @@
 # main.py
-from flask import Flask, Response, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from camera_manager import CameraManager
 from led_control import LedController
-from experiment import Experiment
-from utils import get_raspberry_status
-from config import BASE_FOLDER_PATH
+from experiment import Experiment, DRY_RUN_TICKS
+from scheduler import ExperimentScheduler
+from disk_budget import InsufficientStorageError
+from system_metrics import MetricsCollector, HISTORY_MAX_LIMIT
+from event_bus import EventBus, EVENT_TYPES
+from dir_listing import DirListingCache, list_page, DEFAULT_LIMIT as LIST_DEFAULT_LIMIT
+from dir_watcher import DirWatcher
+from archive_stream import ARCHIVE_FORMATS, iter_files, zip_stream, tar_stream
+from config import BASE_FOLDER_PATH, METRICS_INTERVAL_S, METRICS_HISTORY
 from dht_sensor import DHTSensor
+from frame_pack import FramePack, pack_base_path
+from timelapse_preview import open_preview, mjpeg_frames, build_strip
+from preview_pipeline import histogram as preview_histogram_of, build_mosaic
+from thumbnails import thumbnail_for_image, make_thumbnail, SIZES as THUMB_SIZES
+import mimetypes
+import json
+import zlib
+import time
+from datetime import datetime
 import threading
 import os
 
@@ -21,26 +36,194 @@ CAMERA_LED_PIN_MAP = {
 # Configuración del pin BCM para el DHT11
 DHT11_PIN = 4  # GPIO4 en modo BCM
 
-camera_manager = CameraManager()
-led_controller = LedController(CAMERA_LED_PIN_MAP)
-dht_sensor = DHTSensor(pin=DHT11_PIN)  # Nuevo diseño: solo número de pin BCM
+# Con CAPTURE_PROCESSES los procesos de cámara arrancan con 'spawn' y vuelven a importar
+# este módulo como '__mp_main__': ahí no se crean cámaras, LEDs ni hilos
+if __name__ != '__mp_main__':
+    # Eventos para /events: ticks, experimentos, LEDs, cámaras y métricas
+    event_bus = EventBus()
 
-experiment = Experiment(camera_manager, led_controller, dht_sensor)
+    camera_manager = CameraManager(events=event_bus)
+    led_controller = LedController(CAMERA_LED_PIN_MAP, events=event_bus)
+    dht_sensor = DHTSensor(pin=DHT11_PIN)  # Nuevo diseño: solo número de pin BCM
+
+    # Varios experimentos a la vez sobre cámaras distintas y cola de inicios programados
+    scheduler = ExperimentScheduler(camera_manager, led_controller, dht_sensor, events=event_bus)
+    dry_run_lock = threading.Lock()
+    # Listados de directorios reutilizados mientras no cambie su mtime
+    dir_cache = DirListingCache()
+    # Altas/bajas de carpetas en los directorios listados -> eventos 'dir' (e invalida la caché)
+    dir_watcher = DirWatcher(BASE_FOLDER_PATH, events=event_bus, cache=dir_cache)
+
+    # Métricas del sistema muestreadas en segundo plano (/status no mide en el request)
+    metrics = MetricsCollector(interval_s=METRICS_INTERVAL_S, history=METRICS_HISTORY, events=event_bus)
+    metrics.start()
 
 @app.route('/cameras')
 def cameras():
     # Devuelve lista de IDs de cámaras detectadas
     return jsonify(camera_manager.cameras)
 
+@app.route('/cameras/refresh', methods=['POST'])
+def cameras_refresh():
+    """Re-detecta cámaras (publica eventos 'camera'); no se hace con experimentos en curso."""
+    if scheduler.running():
+        return jsonify({'status': 'error', 'message': 'Hay experimentos en ejecución'}), 409
+    try:
+        return jsonify({'status': 'ok', 'cameras': camera_manager.refresh_cameras()})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @app.route('/video_feed/<int:cam_id>')
 def video_feed(cam_id):
     if cam_id not in camera_manager.cameras:
         return "Camera not found", 404
+    if camera_manager.viewer_slots(cam_id) == 0:
+        return jsonify({'status': 'error',
+                        'message': f'Máximo de {camera_manager.max_viewers} espectadores por cámara'}), 503
     return Response(
         camera_manager.generate_frames(cam_id),
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
 
+@app.route('/preview/<int:cam_id>/frame', methods=['GET'])
+def preview_frame(cam_id):
+    """Último JPEG reducido de la vista en vivo compartida (sin abrir un stream)."""
+    if cam_id not in camera_manager.cameras:
+        return jsonify({'status': 'error', 'message': 'Cámara no encontrada'}), 404
+    _, jpeg = camera_manager.preview_pipeline(cam_id).snapshot()
+    if jpeg is None:
+        return jsonify({'status': 'error', 'message': 'Cámara sin frames'}), 503
+    return Response(jpeg, mimetype='image/jpeg', headers={'Cache-Control': 'no-store'})
+
+@app.route('/preview/<int:cam_id>/histogram', methods=['GET'])
+def preview_histogram(cam_id):
+    """Histograma por canal y de brillo calculado sobre la copia reducida (?bins=64)."""
+    if cam_id not in camera_manager.cameras:
+        return jsonify({'status': 'error', 'message': 'Cámara no encontrada'}), 404
+    try:
+        bins = min(max(2, int(request.args.get('bins', 64))), 256)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'bins debe ser entero'}), 400
+    frame, _ = camera_manager.preview_pipeline(cam_id).snapshot()
+    if frame is None:
+        return jsonify({'status': 'error', 'message': 'Cámara sin frames'}), 503
+    return jsonify({'status': 'ok', 'cam_id': cam_id, 'histogram': preview_histogram_of(frame, bins)})
+
+@app.route('/preview/mosaic', methods=['GET'])
+def preview_mosaic():
+    """Mosaico JPEG con la copia reducida de varias cámaras (?cams=0,1&cols=2&tile=320)."""
+    try:
+        cams = request.args.get('cams')
+        cam_ids = [int(c) for c in cams.split(',')] if cams else list(camera_manager.cameras)
+        cols = int(request.args.get('cols', 2))
+        tile = min(max(80, int(request.args.get('tile', 320))), 1280)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'cams/cols/tile inválidos'}), 400
+    frames = {c: camera_manager.preview_pipeline(c).snapshot()[0]
+              for c in cam_ids if c in camera_manager.cameras}
+    data = build_mosaic(frames, cols=cols, tile_width=tile)
+    if data is None:
+        return jsonify({'status': 'error', 'message': 'Sin frames de cámaras'}), 503
+    return Response(data, mimetype='image/jpeg', headers={'Cache-Control': 'no-store'})
+
+@app.route('/preview/status', methods=['GET'])
+def preview_status():
+    """Estado de las vistas compartidas: suscriptores, resolución origen/reducida, costo del encode."""
+    return jsonify(camera_manager.preview_status())
+
+@app.route('/cameras/arbitration', methods=['GET'])
+def cameras_arbitration():
+    """Espectadores, ventanas de captura activas y esperas del lock por cámara."""
+    return jsonify(camera_manager.arbitration_status())
+
+@app.route('/cameras/health', methods=['GET'])
+def cameras_health():
+    """Salud por cámara: latencia de lectura, rachas de fallos/frames repetidos y reinicios."""
+    return jsonify(camera_manager.health_status())
+
+@app.route('/cameras/drain', methods=['GET'])
+def cameras_drain():
+    """Costo de las capturas frescas: buffers viejos descartados y tiempo por cámara."""
+    return jsonify(camera_manager.drain_status())
+
+@app.route('/cameras/processes', methods=['GET'])
+def cameras_processes():
+    """Procesos de captura por cámara (CAPTURE_PROCESSES=1): frames publicados y lecturas."""
+    return jsonify({'enabled': camera_manager.capture_processes,
+                    'cameras': camera_manager.process_status()})
+
+# ==============================
+#   PROPIEDADES Y PERFILES DE CÁMARA
+# ==============================
+@app.route('/cameras/<int:cam_id>/properties', methods=['GET'])
+def get_camera_properties(cam_id):
+    """Propiedades V4L2 (memoizadas). ?names=width,height para algunas; ?refresh=1 relee."""
+    names = request.args.get('names')
+    refresh = request.args.get('refresh') in ('1', 'true', 'yes')
+    try:
+        props = camera_manager.get_properties(
+            cam_id, names=names.split(',') if names else None, refresh=refresh)
+        return jsonify({'status': 'ok', 'cam_id': cam_id, 'properties': props,
+                        'profile': camera_manager.profile_status()['active'].get(cam_id)})
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+    except RuntimeError as re:
+        return jsonify({'status': 'error', 'message': str(re)}), 503
+
+@app.route('/cameras/<int:cam_id>/properties', methods=['POST'])
+def set_camera_properties(cam_id):
+    """Aplica propiedades sueltas, p.ej. {"exposure": -6, "gain": 0}."""
+    data = request.get_json(silent=True) or {}
+    try:
+        result = camera_manager.set_properties(cam_id, data)
+        return jsonify({'status': 'ok', 'cam_id': cam_id, 'properties': result})
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+    except RuntimeError as re:
+        return jsonify({'status': 'error', 'message': str(re)}), 503
+
+@app.route('/cameras/profiles', methods=['GET'])
+def camera_profiles():
+    """Perfiles definidos, perfil activo por cámara y costo de los cambios."""
+    return jsonify(camera_manager.profile_status())
+
+@app.route('/cameras/profiles/<string:name>', methods=['POST'])
+def define_camera_profile(name):
+    """Crea o reemplaza un perfil, p.ej. {"width": 1280, "height": 720, "fourcc": "MJPG"}."""
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify({'status': 'ok', 'profile': name, 'values': camera_manager.set_profile(name, data)})
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+
+@app.route('/cameras/<int:cam_id>/profile/<string:name>', methods=['POST'])
+def apply_camera_profile(cam_id, name):
+    try:
+        result = camera_manager.apply_profile(cam_id, name)
+        result['status'] = 'ok'
+        return jsonify(result)
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+    except RuntimeError as re:
+        return jsonify({'status': 'error', 'message': str(re)}), 503
+
+@app.route('/usb/plan', methods=['GET'])
+def usb_plan():
+    """Plan de ancho de banda del bus USB (último calculado; ?refresh=1 lo recalcula sin aplicar)."""
+    if request.args.get('refresh') in ('1', 'true', 'yes') or camera_manager.usb_plan is None:
+        camera_manager.plan_usb_bandwidth(apply=False)
+    return jsonify(camera_manager.usb_plan)
+
+@app.route('/usb/plan', methods=['POST'])
+def usb_plan_apply():
+    """Recalcula el plan y aplica los formatos/FPS elegidos ({"apply": false} sólo simula)."""
+    data = request.get_json(silent=True) or {}
+    try:
+        plan = camera_manager.plan_usb_bandwidth(apply=bool(data.get('apply', True)))
+        return jsonify(plan)
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 # ==============================
 #         LEDs: ON/OFF
 # ==============================
@@ -121,6 +304,91 @@ def sensor_data():
 # ==============================
 #        EXPERIMENTO
 # ==============================
+def _experiment_options(data):
+    """
+    Lee y normaliza las opciones de captura comunes a /experiment/start y
+    /experiment/dry_run. Lanza ValueError con el mensaje para la respuesta 400.
+    """
+    stack_frames = data.get('stack_frames', 1)     # opcional: frames por captura
+    stack_mode = data.get('stack_mode', 'mean')    # opcional: 'mean' | 'median'
+    bracket = data.get('bracket')                  # opcional: lista de brillos LED (HDR)
+    keep_brackets = bool(data.get('keep_brackets', False))
+    change_threshold = data.get('change_threshold')  # opcional: guardar sólo si hay cambio
+    keyframe_every = data.get('keyframe_every', 10)  # opcional: guardado forzado cada K ticks
+    image_format = data.get('image_format', 'jpeg')  # opcional: jpeg | png | webp | npy
+    image_quality = data.get('image_quality', 95)    # opcional: calidad JPEG/WebP
+    png_compression = data.get('png_compression', 3) # opcional: compresión PNG 0-9
+    encode_workers = data.get('encode_workers', 0)   # opcional: procesos de codificación
+    container = data.get('container', 'files')       # opcional: files | pack
+    thumbnails = data.get('thumbnails')              # opcional: miniaturas (por defecto sólo con 'files')
+    thumbnails = None if thumbnails is None else bool(thumbnails)
+    mid_previews = bool(data.get('mid_previews', False))
+    disk_policy = data.get('disk_policy', 'stop')    # opcional: stop | downgrade | prune_thumbs
+    fresh_frames = bool(data.get('fresh_frames', True))  # opcional: descartar buffers viejos
+    camera_profile = data.get('camera_profile', 'capture')  # opcional: perfil de propiedades
+
+    try:
+        stack_frames = int(stack_frames)
+    except Exception:
+        raise ValueError('stack_frames debe ser entero')
+    try:
+        if change_threshold is not None:
+            change_threshold = float(change_threshold)
+        keyframe_every = int(keyframe_every)
+    except Exception:
+        raise ValueError('change_threshold/keyframe_every inválidos')
+    try:
+        image_quality = int(image_quality)
+        png_compression = int(png_compression)
+        encode_workers = int(encode_workers)
+    except Exception:
+        raise ValueError('image_quality/png_compression/encode_workers deben ser enteros')
+    if bracket not in (None, [], ()):
+        try:
+            bracket = [int(v) for v in bracket]
+        except Exception:
+            raise ValueError('bracket debe ser una lista de enteros')
+    else:
+        bracket = None
+
+    return dict(stack_frames=stack_frames, stack_mode=stack_mode,
+                bracket=bracket, keep_brackets=keep_brackets,
+                change_threshold=change_threshold, keyframe_every=keyframe_every,
+                image_format=image_format, image_quality=image_quality,
+                png_compression=png_compression, encode_workers=encode_workers,
+                container=container, thumbnails=thumbnails,
+                mid_previews=mid_previews, disk_policy=disk_policy,
+                fresh_frames=fresh_frames, camera_profile=camera_profile)
+
+def _selected_camera_ids(camera_ids):
+    """Normaliza camera_ids (None, lista vacía, lista de strings/ints); None = todas."""
+    if camera_ids in (None, [], ()):
+        return None
+    try:
+        detected = set(camera_manager.cameras)
+        selected_ids = sorted({int(c) for c in camera_ids if int(c) in detected})
+    except Exception:
+        raise ValueError('camera_ids inválidos')
+    return selected_ids or None  # si la lista no tiene válidos, caerá en "todas"
+
+def _parse_start_at(data):
+    """
+    Hora de inicio programada: 'start_at' (epoch o 'YYYY-MM-DDTHH:MM:SS' local) o
+    'delay_sec' (segundos desde ahora). None = iniciar ya.
+    """
+    start_at = data.get('start_at')
+    delay = data.get('delay_sec')
+    try:
+        if start_at not in (None, ''):
+            if isinstance(start_at, str):
+                return datetime.fromisoformat(start_at).timestamp()
+            return float(start_at)
+        if delay not in (None, '', 0):
+            return time.time() + float(delay)
+    except Exception:
+        raise ValueError('start_at/delay_sec inválidos')
+    return None
+
 @app.route('/experiment/start', methods=['POST'])
 def start_experiment():
     data = request.get_json(silent=True) or {}
@@ -128,6 +396,8 @@ def start_experiment():
     duration = data.get('duration')
     interval = data.get('interval')
     camera_ids = data.get('camera_ids')  # opcional: lista de enteros
+    force = bool(data.get('force', False))           # opcional: iniciar aunque no entre en disco
+    shared = bool(data.get('shared', False))         # opcional: compartir cámaras (sólo lectura)
 
     if not all([save_path, duration, interval]):
         return jsonify({'status': 'error', 'message': 'Faltan parámetros'}), 400
@@ -138,27 +408,32 @@ def start_experiment():
         interval = int(interval)
     except Exception:
         return jsonify({'status': 'error', 'message': 'duration/interval deben ser enteros'}), 400
+    try:
+        options = _experiment_options(data)
+        selected_ids = _selected_camera_ids(camera_ids)
+        start_at = _parse_start_at(data)
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
 
-    # Normaliza camera_ids (puede venir None, lista vacía, lista de strings/ints)
-    selected_ids = None
-    if camera_ids not in (None, [], ()):
-        try:
-            detected = set(camera_manager.cameras)
-            selected_ids = sorted({int(c) for c in camera_ids if int(c) in detected})
-            if not selected_ids:
-                selected_ids = None  # si la lista no tiene válidos, caerá en "todas"
-        except Exception:
-            return jsonify({'status': 'error', 'message': 'camera_ids inválidos'}), 400
+    if dry_run_lock.locked():
+        return jsonify({'status': 'error', 'message': 'Prueba de viabilidad en curso'}), 409
 
     try:
         abs_save_path = safe_join(BASE_FOLDER_PATH, save_path)
         os.makedirs(abs_save_path, exist_ok=True)
-        # Pasa lista (o None) al experimento
-        experiment.start(abs_save_path, duration, interval, camera_ids=selected_ids)
+        # Pasa lista (o None) al planificador; sin start_at arranca ya
+        job = scheduler.submit(abs_save_path, duration, interval, camera_ids=selected_ids,
+                               shared=shared, start_at=start_at, force=force, **options)
+        exp = job['experiment']
         return jsonify({
             'status': 'ok',
+            'experiment_id': job['id'],
+            'state': job['state'],
+            'start_at': job['start_at'],
             'save_path': abs_save_path,
-            'camera_ids': experiment.camera_ids  # confirma cuáles se usarán realmente
+            'camera_ids': job['camera_ids'],  # confirma cuáles se usarán realmente
+            'disk_plan': exp.disk_plan,
+            'warnings': exp.disk_plan.get('warnings', []) if exp.disk_plan else []
         })
     except ValueError as ve:
         return jsonify({'status': 'error', 'message': str(ve)}), 400
@@ -167,17 +442,163 @@ def start_experiment():
             'status': 'error',
             'message': f'Sin permisos para crear/escribir en: {abs_save_path}'
         }), 403
+    except InsufficientStorageError as ise:
+        return jsonify({'status': 'error', 'message': str(ise), 'disk_plan': ise.plan}), 507
     except RuntimeError as re:
-        # p.ej. "Experimento ya en ejecución"
+        # p.ej. cámaras ocupadas por otro experimento
         return jsonify({'status': 'error', 'message': str(re)}), 409
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/experiment/dry_run', methods=['POST'])
+def dry_run_experiment():
+    """
+    Prueba de viabilidad antes de iniciar: ejecuta unos ticks reales (LED, cámaras,
+    codificación y disco) con las mismas opciones, descarta lo escrito y devuelve la
+    duración de los ticks y el intervalo mínimo seguro.
+    """
+    data = request.get_json(silent=True) or {}
+    duration = data.get('duration')
+    interval = data.get('interval')
+    ticks = data.get('ticks', DRY_RUN_TICKS)
+
+    if not all([duration, interval]):
+        return jsonify({'status': 'error', 'message': 'Faltan parámetros'}), 400
+    try:
+        duration = int(duration)
+        interval = int(interval)
+        ticks = min(max(1, int(ticks)), 20)
+    except Exception:
+        return jsonify({'status': 'error', 'message': 'duration/interval/ticks deben ser enteros'}), 400
+    try:
+        options = _experiment_options(data)
+        selected_ids = _selected_camera_ids(data.get('camera_ids'))
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+
+    # Usa las cámaras y LEDs reales: no puede correr junto a un experimento ni a otra prueba
+    busy = scheduler.busy_cameras(selected_ids)
+    if busy or not dry_run_lock.acquire(blocking=False):
+        return jsonify({'status': 'error', 'message': f'Cámaras ocupadas por un experimento o prueba en curso {busy or ""}'.strip()}), 409
+    try:
+        probe = Experiment(camera_manager, led_controller, dht_sensor, timeline=scheduler.timeline)
+        result = probe.dry_run(BASE_FOLDER_PATH, duration, interval, camera_ids=selected_ids,
+                               ticks=ticks, **options)
+        result['status'] = 'ok'
+        return jsonify(result)
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    finally:
+        dry_run_lock.release()
+
 @app.route('/experiment/stop', methods=['POST'])
 def stop_experiment():
-    experiment.stop()
+    """Detiene el experimento indicado (experiment_id) o, sin id, todos los activos y en cola."""
+    data = request.get_json(silent=True) or {}
+    try:
+        stopped = scheduler.stop(data.get('experiment_id'))
+    except (KeyError, ValueError, TypeError):
+        return jsonify({'status': 'error', 'message': 'Experimento no encontrado'}), 404
+    return jsonify({'status': 'ok', 'stopped': stopped})
+
+@app.route('/experiments', methods=['GET'])
+def list_experiments():
+    """Experimentos en ejecución, en cola y terminados recientes, más el estado de la línea de tiempo."""
+    return jsonify({'experiments': scheduler.list_jobs(), 'timeline': scheduler.timeline.status()})
+
+@app.route('/experiment/preview/<int:cam_id>', methods=['GET'])
+def experiment_preview(cam_id):
+    """
+    Time-lapse reducido de las capturas hechas hasta ahora.
+    ?format=mjpeg (por defecto, &fps=10) o ?format=strip (&last=20&cols=10).
+    ?path=<carpeta relativa> para un experimento anterior; si no, el actual/último.
+    """
+    try:
+        rel = request.args.get('path')
+        exp_path = safe_join(BASE_FOLDER_PATH, rel) if rel else scheduler.current().save_path
+        if not exp_path:
+            return jsonify({'status': 'error', 'message': 'No hay experimento'}), 404
+        pack = open_preview(exp_path, cam_id)
+        fmt = request.args.get('format', 'mjpeg')
+        if fmt == 'strip':
+            data = build_strip(pack, last=int(request.args.get('last', 20)),
+                               cols=int(request.args.get('cols', 10)))
+            if data is None:
+                return jsonify({'status': 'error', 'message': 'Sin capturas aún'}), 404
+            return Response(data, mimetype='image/jpeg')
+        return Response(
+            mjpeg_frames(pack, fps=float(request.args.get('fps', 10)),
+                         start=int(request.args.get('start', 0))),
+            mimetype='multipart/x-mixed-replace; boundary=frame'
+        )
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+    except FileNotFoundError:
+        return jsonify({'status': 'error', 'message': 'Vista previa no encontrada'}), 404
+
+# ==============================
+#   BUFFER CIRCULAR PRE-DISPARO
+# ==============================
+def _event_dir(save_path=None):
+    """
+    Carpeta destino de volcados: la indicada (relativa al directorio base),
+    la del experimento en curso o <base>/eventos.
+    """
+    if save_path:
+        return safe_join(BASE_FOLDER_PATH, save_path)
+    current = scheduler.current()
+    if current.running and current.save_path:
+        return current.save_path
+    return safe_join(BASE_FOLDER_PATH, 'eventos')
+
+@app.route('/ring/<int:cam_id>/enable', methods=['POST'])
+def ring_enable(cam_id):
+    if cam_id not in camera_manager.cameras:
+        return jsonify({'status': 'error', 'message': 'Cámara no encontrada'}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        threshold = data.get('trigger_threshold')
+        info = camera_manager.enable_ring_buffer(
+            cam_id,
+            fps=float(data.get('fps', 5)),
+            seconds=float(data.get('seconds', 10)),
+            max_bytes=int(float(data.get('max_mb', 8)) * 1024 * 1024),
+            quality=int(data.get('quality', 80)),
+            dump_dir=_event_dir(data.get('save_path')),
+            post_seconds=float(data.get('post_seconds', 5)),
+            trigger_threshold=None if threshold is None else float(threshold),
+        )
+        return jsonify({'status': 'ok', 'ring': info})
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+@app.route('/ring/<int:cam_id>/disable', methods=['POST'])
+def ring_disable(cam_id):
+    camera_manager.disable_ring_buffer(cam_id)
     return jsonify({'status': 'ok'})
 
+@app.route('/ring/<int:cam_id>/dump', methods=['POST'])
+def ring_dump(cam_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        post = data.get('post_seconds')
+        folder = camera_manager.dump_ring_buffer(
+            cam_id,
+            out_dir=_event_dir(data.get('save_path')),
+            post_seconds=None if post is None else float(post),
+        )
+        return jsonify({'status': 'ok', 'folder': folder})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except PermissionError:
+        return jsonify({'status': 'error', 'message': 'Sin permisos para escribir el volcado'}), 403
+
+@app.route('/ring/status', methods=['GET'])
+def ring_status():
+    return jsonify({'status': 'ok', 'ring': camera_manager.ring_buffer_status()})
+
 # ==============================
 #           STATUS
 # ==============================
@@ -187,7 +608,7 @@ def status():
     Estado del sistema y del experimento en curso.
     Incluye qué cámaras participan y el brillo por cámara.
     """
-    sys_info = get_raspberry_status()
+    sys_info = metrics.latest()
     # Mapa de brillos actual (si alguna cámara no tiene LED, puede no estar presente)
     led_map = {}
     for cam_id in CAMERA_LED_PIN_MAP.keys():
@@ -196,15 +617,76 @@ def status():
         except Exception:
             led_map[cam_id] = None
 
-    exp_info = {
-        'running': experiment.running,
-        'save_path': experiment.save_path,
-        'duration': experiment.duration,
-        'interval': experiment.interval,
-        'camera_ids': experiment.camera_ids,  # subconjunto activo (o todas)
-        'led_brightness': led_map
-    }
-    return jsonify({'system': sys_info, 'experiment': exp_info})
+    exp_info = scheduler.current().status_info()
+    exp_info['led_brightness'] = led_map
+    return jsonify({'system': sys_info, 'experiment': exp_info,
+                    'experiments': scheduler.list_jobs(),
+                    'camera_health': {cam_id: camera_manager.health_state(cam_id)
+                                      for cam_id in camera_manager.cameras}})
+
+@app.route('/status/history', methods=['GET'])
+def status_history():
+    """
+    Muestras de métricas posteriores a ?since=<seq>, en columnas. Opcionales:
+    ?limit=N y ?fields=temperature_c,cpu_percent. Se repite con since=last_seq.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', HISTORY_MAX_LIMIT))
+        fields = [f for f in request.args.get('fields', '').split(',') if f] or None
+        data = metrics.history(since, limit=limit, fields=fields)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify(dict(data, status='ok'))
+
+# ==============================
+#           EVENTOS
+# ==============================
+def _event_filter():
+    """?types=tick,led -> conjunto de tipos (None = todos); ValueError si hay desconocidos."""
+    types = [t for t in request.args.get('types', '').split(',') if t]
+    unknown = [t for t in types if t not in EVENT_TYPES]
+    if unknown:
+        raise ValueError(f"Tipos de evento desconocidos: {', '.join(unknown)}")
+    return set(types) or None
+
+@app.route('/events', methods=['GET'])
+def events_stream():
+    """
+    Server-sent events: tick, experiment, led, camera, metrics, dir (y 'gap' si se perdieron).
+    Al reconectar se retoma desde Last-Event-ID (o ?last_id=N); una conexión nueva sólo
+    recibe los eventos posteriores. ?types= filtra.
+    """
+    try:
+        types = _event_filter()
+        last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+        last_id = None if last_id is None else int(last_id)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return Response(stream_with_context(event_bus.stream(last_id, types)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/events/poll', methods=['GET'])
+def events_poll():
+    """
+    Long-poll: eventos posteriores a ?since=N, esperando hasta ?timeout=25 s. Sin 'since'
+    se esperan sólo eventos nuevos (la respuesta trae last_id para la siguiente consulta).
+    """
+    try:
+        types = _event_filter()
+        since = request.args.get('since')
+        since = event_bus.seq if since is None else int(since)
+        timeout = max(0.0, min(60.0, float(request.args.get('timeout', 25))))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    events = event_bus.wait(since, timeout, types)
+    return jsonify({'status': 'ok', 'events': events,
+                    'last_id': events[-1]['id'] if events else since})
+
+@app.route('/events/status', methods=['GET'])
+def events_status():
+    return jsonify(dict(event_bus.status(), dir_watcher=dir_watcher.status()))
 
 # ==============================
 #          SHUTDOWN
@@ -223,6 +705,8 @@ def shutdown():
             camera_manager.release()
         except Exception:
             pass
+        metrics.stop()
+        dir_watcher.stop()
         try:
             dht_sensor.cleanup()  # cleanup en lugar de stop
         except Exception:
@@ -238,10 +722,15 @@ def shutdown():
 #         UTILIDADES
 # ==============================
 def safe_join(base, *paths):
-    """Une rutas de forma segura evitando salir del directorio base."""
+    """
+    Une rutas de forma segura evitando salir del directorio base. Compara rutas reales
+    (enlaces simbólicos resueltos) por componentes: '../experimentos2' o un enlace que
+    apunta afuera no pasan.
+    """
     normalized_paths = [p.replace('\\', '/') for p in paths]
     final_path = os.path.abspath(os.path.join(base, *normalized_paths))
-    if not final_path.startswith(os.path.abspath(base)):
+    base_real = os.path.realpath(base)
+    if os.path.commonpath([base_real, os.path.realpath(final_path)]) != base_real:
         raise ValueError("Ruta fuera del directorio permitido")
     return final_path
 
@@ -250,31 +739,176 @@ def safe_join(base, *paths):
 # ==============================
 @app.route('/list_dir', methods=['GET'])
 def list_dir():
+    """
+    Lista un subdirectorio del directorio base (carpetas primero), paginado.
+    Parámetros: path, folders_only=1, sort=name|mtime|size, order=asc|desc,
+    filter (texto o comodines), limit, cursor (next_cursor de la página anterior)
+    y details=1 (tamaño y fecha). Responde 304 si If-None-Match coincide.
+    """
     try:
         sub_path = request.args.get("path", "").strip()
         sub_path = sub_path.replace('\\', '/')
         abs_path = safe_join(BASE_FOLDER_PATH, sub_path)
 
-        if not os.path.exists(abs_path):
+        if not os.path.isdir(abs_path):
             return jsonify({"status": "error", "message": "Ruta no encontrada"}), 404
 
-        items = os.listdir(abs_path)
-        folders = [f for f in items if os.path.isdir(os.path.join(abs_path, f))]
-        files = [f for f in items if os.path.isfile(os.path.join(abs_path, f))]
+        options = {
+            'folders_only': request.args.get('folders_only') in ('1', 'true', 'yes'),
+            'sort': request.args.get('sort', 'name'),
+            'reverse': request.args.get('order', 'asc') == 'desc',
+            'pattern': request.args.get('filter') or None,
+            'cursor': request.args.get('cursor') or None,
+            'limit': int(request.args.get('limit', LIST_DEFAULT_LIMIT)),
+            'details': request.args.get('details') in ('1', 'true', 'yes'),
+        }
+        dir_watcher.watch(abs_path)
+        snapshot = dir_cache.snapshot(abs_path)
+        etag = f"{snapshot.ino:x}-{snapshot.mtime_ns:x}-{snapshot.digest:08x}-" \
+               f"{zlib.crc32(json.dumps(options, sort_keys=True).encode()):08x}"
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+        page = list_page(snapshot, **options)
         parent_path = os.path.dirname(sub_path) if sub_path else ""
-        
-        return jsonify({
-            "status": "success",
-            "current_path": sub_path,
-            "parent_path": parent_path,
-            "folders": folders,
-            "files": files
-        })
+        response = jsonify(dict(page, status="success", current_path=sub_path, parent_path=parent_path))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except ValueError as ve:
         return jsonify({"status": "error", "message": str(ve)}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# ==============================
+#   CONTENEDORES DE CAPTURAS
+# ==============================
+def _open_pack(rel_path):
+    abs_path = safe_join(BASE_FOLDER_PATH, rel_path.replace('\\', '/'))
+    return FramePack(pack_base_path(abs_path), mode="r")
+
+@app.route('/pack/info', methods=['GET'])
+def pack_info():
+    try:
+        pack = _open_pack(request.args.get('path', ''))
+        return jsonify({'status': 'ok', 'frames': len(pack), 'ext': pack.ext})
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+    except FileNotFoundError:
+        return jsonify({'status': 'error', 'message': 'Contenedor no encontrado'}), 404
+
+@app.route('/pack/frame', methods=['GET'])
+def pack_frame():
+    """Devuelve el frame 'index' de un contenedor (negativo = desde el final)."""
+    try:
+        pack = _open_pack(request.args.get('path', ''))
+        data, _ = pack.read(int(request.args.get('index', -1)))
+        mimetype = mimetypes.guess_type('frame' + pack.ext)[0] or 'application/octet-stream'
+        return Response(data, mimetype=mimetype)
+    except IndexError as ie:
+        return jsonify({'status': 'error', 'message': str(ie)}), 404
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+    except FileNotFoundError:
+        return jsonify({'status': 'error', 'message': 'Contenedor no encontrado'}), 404
+
+@app.route('/pack/export', methods=['POST'])
+def pack_export():
+    """Exporta frames [start, end) de un contenedor a archivos sueltos junto al contenedor."""
+    data = request.get_json(silent=True) or {}
+    try:
+        pack = _open_pack(data.get('path', ''))
+        end = data.get('end')
+        out_dir = os.path.join(os.path.dirname(pack.data_path), 'export')
+        written = pack.export(out_dir, start=int(data.get('start', 0)),
+                              end=None if end is None else int(end))
+        return jsonify({'status': 'ok', 'written': written,
+                        'folder': os.path.relpath(out_dir, BASE_FOLDER_PATH)})
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+    except FileNotFoundError:
+        return jsonify({'status': 'error', 'message': 'Contenedor no encontrado'}), 404
+    except PermissionError:
+        return jsonify({'status': 'error', 'message': 'Sin permisos para exportar'}), 403
+
+# ==============================
+#          MINIATURAS
+# ==============================
+THUMBNAIL_MAX_AGE = 7 * 24 * 3600  # las miniaturas no cambian una vez generadas
+
+@app.route('/thumbnail', methods=['GET'])
+def thumbnail():
+    """
+    Miniatura de una captura: ?path=<ruta relativa de la imagen>&size=thumb|mid.
+    Si la miniatura no existe (corridas anteriores) se genera en el momento.
+    Respuesta con ETag / Last-Modified y Cache-Control para que el cliente la cachee.
+    """
+    try:
+        size = request.args.get('size', 'thumb')
+        if size not in THUMB_SIZES:
+            return jsonify({'status': 'error', 'message': 'size debe ser thumb o mid'}), 400
+        image_path = safe_join(BASE_FOLDER_PATH, request.args.get('path', ''))
+        thumb_path = thumbnail_for_image(image_path, size)
+        if not os.path.isfile(thumb_path):
+            if not os.path.isfile(image_path) or make_thumbnail(image_path, size) is None:
+                return jsonify({'status': 'error', 'message': 'Imagen no encontrada'}), 404
+        return send_file(thumb_path, mimetype='image/jpeg', conditional=True,
+                         etag=True, max_age=THUMBNAIL_MAX_AGE)
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+
+# ==============================
+#          DESCARGAS
+# ==============================
+@app.route('/download', methods=['GET'])
+def download_file():
+    """
+    Descarga un archivo: ?path=<ruta relativa>. Admite Range (reanudar o pedir partes),
+    If-None-Match / If-Modified-Since; el servidor WSGI puede enviarlo con sendfile.
+    """
+    try:
+        abs_path = safe_join(BASE_FOLDER_PATH, request.args.get('path', ''))
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+    if os.path.isdir(abs_path):
+        return jsonify({'status': 'error', 'message': 'Es una carpeta: usar /download/archive'}), 400
+    if not os.path.isfile(abs_path):
+        return jsonify({'status': 'error', 'message': 'Archivo no encontrado'}), 404
+    mimetype = mimetypes.guess_type(abs_path)[0] or 'application/octet-stream'
+    return send_file(abs_path, mimetype=mimetype, as_attachment=True, conditional=True, etag=True)
+
+@app.route('/download/archive', methods=['GET'])
+def download_archive():
+    """
+    Carpeta (p.ej. un experimento) como zip o tar armado al vuelo, con memoria constante.
+    ?path=<carpeta>&format=zip|tar y filtros opcionales: filter=*.jpg (comodines sobre la
+    ruta relativa), cams=0,1 (carpetas MicroscopioN) y derivatives=0 (sin miniaturas).
+    """
+    try:
+        sub_path = request.args.get('path', '').strip().replace('\\', '/')
+        abs_path = safe_join(BASE_FOLDER_PATH, sub_path)
+        fmt = request.args.get('format', 'zip')
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f"format debe ser uno de: {', '.join(ARCHIVE_FORMATS)}")
+        cams = request.args.get('cams')
+        cam_ids = {int(c) for c in cams.split(',') if c} if cams else None
+    except ValueError as ve:
+        return jsonify({'status': 'error', 'message': str(ve)}), 400
+    if not os.path.isdir(abs_path):
+        return jsonify({'status': 'error', 'message': 'Carpeta no encontrada'}), 404
+
+    files = iter_files(abs_path, pattern=request.args.get('filter') or None, cam_ids=cam_ids,
+                       derivatives=request.args.get('derivatives', '1') not in ('0', 'false', 'no'),
+                       base=BASE_FOLDER_PATH)
+    name = os.path.basename(os.path.normpath(abs_path)) or 'experimentos'
+    if fmt == 'zip':
+        body, mimetype = zip_stream(files), 'application/zip'
+    else:
+        body, mimetype = tar_stream(files), 'application/x-tar'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{name}.{fmt}"',
+                             'X-Accel-Buffering': 'no'})
+
 @app.route('/create_folder', methods=['POST'])
 def create_folder():
     try:
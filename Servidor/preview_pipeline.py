@@ -0,0 +1,207 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from camera_priority import PRIORITY_PREVIEW
+from image_storage import resize_to_width
+
+# Vista en vivo: ancho de la copia reducida y calidad JPEG (un solo encode por ciclo)
+PREVIEW_WIDTH = 640
+PREVIEW_QUALITY = 80
+# FPS normal y FPS reducido mientras un experimento captura esa cámara
+PREVIEW_FPS = 30
+PREVIEW_THROTTLED_FPS = 2
+# Segundos sin suscriptores tras los que se detiene el hilo de la cámara
+IDLE_STOP_S = 2.0
+
+
+class PreviewPipeline:
+    """
+    Vista en vivo compartida de una cámara. Un único hilo lee el frame con el perfil
+    de vista previa (cm.preview_source_profile), deriva una copia reducida
+    (PREVIEW_WIDTH) y la codifica a JPEG una vez por ciclo; todos los consumidores
+    (stream, histograma, mosaico) usan esa copia. Con captura en procesos la
+    reducción y el JPEG los hace el proceso de la cámara y acá sólo se publican.
+    Mientras un experimento captura la cámara el hilo no la lee: las capturas se
+    ofrecen con offer() y la vista se actualiza con el mismo frame del experimento.
+    """
+
+    def __init__(self, camera_manager, cam_id, width=PREVIEW_WIDTH, quality=PREVIEW_QUALITY,
+                 fps=PREVIEW_FPS):
+        self.camera_manager = camera_manager
+        self.cam_id = cam_id
+        self.width = int(width)
+        self.quality = int(quality)
+        self.fps = float(fps)
+
+        self._cond = threading.Condition()
+        self.seq = 0
+        self.frame = None        # copia reducida BGR
+        self.jpeg = None         # JPEG de la copia reducida
+        self.timestamp = None
+        self.source_shape = None
+        self.encode_ms = None
+        self.from_captures = 0   # ciclos alimentados por capturas de experimentos
+
+        self.stopped = False     # la cámara se desconectó: el hilo y los streams terminan
+        self._subscribers = 0
+        self._offered = None
+        self._idle_since = None
+        self._thread = None
+
+    # ---------- Consumidores ----------
+    def subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+            self._idle_since = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True,
+                                                name=f"preview-{self.cam_id}")
+                self._thread.start()
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers = max(0, self._subscribers - 1)
+            if self._subscribers == 0:
+                self._idle_since = time.time()
+
+    def wait(self, after_seq, timeout):
+        """Espera un ciclo posterior a after_seq; devuelve (seq, jpeg) (el último si vence)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > after_seq, timeout)
+            return self.seq, self.jpeg
+
+    def snapshot(self, max_age_s=1.0, timeout=3.0):
+        """
+        Devuelve (frame_reducido, jpeg) recientes; si el hilo no está corriendo se
+        suscribe un momento para obtener uno. (None, None) si la cámara no responde.
+        """
+        with self._cond:
+            if self.frame is not None and self.timestamp and time.time() - self.timestamp <= max_age_s:
+                return self.frame, self.jpeg
+            seq = self.seq
+        self.subscribe()
+        try:
+            with self._cond:
+                self._cond.wait_for(lambda: self.seq > seq, timeout)
+                if self.seq > seq:
+                    return self.frame, self.jpeg
+                return None, None
+        finally:
+            self.unsubscribe()
+
+    def offer(self, frame):
+        """Frame completo tomado por una captura: se reduce en el hilo de la vista, no acá."""
+        with self._cond:
+            if self._subscribers:
+                self._offered = frame
+                self._cond.notify_all()
+
+    # ---------- Hilo ----------
+    def _loop(self):
+        cm = self.camera_manager
+        while cm.running and not self.stopped:
+            with self._cond:
+                if self._subscribers == 0 and self._idle_since and time.time() - self._idle_since > IDLE_STOP_S:
+                    self._thread = None
+                    return
+                full, self._offered = self._offered, None
+            t0 = time.perf_counter()
+            if full is None:
+                if cm.capture_active(self.cam_id):
+                    # Tick en curso: no se compite por la cámara; se espera el frame capturado
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._offered is not None, 1.0 / PREVIEW_THROTTLED_FPS)
+                    continue
+                if self._subscribers == 0:
+                    time.sleep(0.1)
+                    continue
+                if cm.capture_processes:
+                    # Reducida y codificada en el proceso de la cámara
+                    ready = cm.grab_preview(self.cam_id, profile=cm.preview_source_profile)
+                    if ready is None:
+                        time.sleep(0.1)
+                        continue
+                    self._store(*ready)
+                    time.sleep(max(0.0, 1.0 / self.fps - (time.perf_counter() - t0)))
+                    continue
+                full = cm.grab_frame(self.cam_id, priority=PRIORITY_PREVIEW,
+                                     profile=cm.preview_source_profile)
+                if full is None:
+                    time.sleep(0.1)
+                    continue
+            else:
+                self.from_captures += 1
+            self._publish(full)
+            time.sleep(max(0.0, 1.0 / self.fps - (time.perf_counter() - t0)))
+
+    def _publish(self, full):
+        small = resize_to_width(full, self.width)
+        t0 = time.perf_counter()
+        ok, buf = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        self._store(small, buf.tobytes(), full.shape, round((time.perf_counter() - t0) * 1000.0, 2))
+
+    def _store(self, small, jpeg, source_shape, encode_ms):
+        with self._cond:
+            self.seq += 1
+            self.frame = small
+            self.jpeg = jpeg
+            self.timestamp = time.time()
+            self.source_shape = source_shape
+            self.encode_ms = encode_ms
+            self._cond.notify_all()
+
+    def stop(self):
+        """Termina el hilo (la cámara ya no existe); los streams abiertos cortan solos."""
+        with self._cond:
+            self.stopped = True
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=2.0)
+
+    def status(self):
+        return {
+            'subscribers': self._subscribers,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'seq': self.seq,
+            'source_shape': list(self.source_shape) if self.source_shape else None,
+            'preview_shape': list(self.frame.shape) if self.frame is not None else None,
+            'jpeg_bytes': len(self.jpeg) if self.jpeg else 0,
+            'encode_ms': self.encode_ms,
+            'from_captures': self.from_captures,
+        }
+
+
+def histogram(frame, bins=64):
+    """Histograma por canal (B, G, R) y de brillo de la copia reducida."""
+    result = {}
+    channels = cv2.split(frame) if frame.ndim == 3 else [frame]
+    for name, channel in zip(("b", "g", "r"), channels):
+        result[name] = cv2.calcHist([channel], [0], None, [bins], [0, 256]).ravel().astype(int).tolist()
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    result["brightness"] = cv2.calcHist([gray], [0], None, [bins], [0, 256]).ravel().astype(int).tolist()
+    result["bins"] = bins
+    return result
+
+
+def build_mosaic(frames, cols=2, tile_width=320, quality=PREVIEW_QUALITY):
+    """Une las copias reducidas {cam_id: frame} en una grilla JPEG (celdas vacías en negro)."""
+    tiles = [resize_to_width(f, tile_width) for f in frames.values() if f is not None]
+    if not tiles:
+        return None
+    cols = max(1, min(int(cols), len(tiles)))
+    tile_h = max(t.shape[0] for t in tiles)
+    rows = (len(tiles) + cols - 1) // cols
+    canvas = np.zeros((rows * tile_h, cols * tile_width, 3), dtype=np.uint8)
+    for i, tile in enumerate(tiles):
+        r, c = divmod(i, cols)
+        if tile.ndim == 2:
+            tile = cv2.cvtColor(tile, cv2.COLOR_GRAY2BGR)
+        canvas[r * tile_h:r * tile_h + tile.shape[0], c * tile_width:c * tile_width + tile.shape[1]] = tile
+    ok, buf = cv2.imencode('.jpg', canvas, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return buf.tobytes() if ok else None
@@ -0,0 +1,75 @@
+import time
+
+import cv2
+import numpy as np
+
+# Ancho de la copia reducida sobre la que se calculan las métricas
+QUALITY_WIDTH = 320
+# Capturas iniciales usadas para fijar la nitidez de referencia de cada cámara
+BASELINE_SAMPLES = 5
+# Alerta cuando la nitidez cae por debajo de esta fracción de la referencia
+SHARPNESS_ALERT_RATIO = 0.6
+
+
+def capture_quality(frame, width=QUALITY_WIDTH):
+    """
+    Métricas baratas de enfoque y exposición sobre una copia reducida en grises:
+        sharpness: varianza del Laplaciano (más alto = más nítido)
+        brightness: brillo medio (0-255)
+        clipped_pct: % de píxeles saturados (0 o 255)
+    """
+    h, w = frame.shape[:2]
+    if w > width:
+        height = max(1, int(round(h * width / float(w))))
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F))
+    clipped = np.count_nonzero(gray == 0) + np.count_nonzero(gray == 255)
+    return {
+        'sharpness': round(float(std[0][0]) ** 2, 2),
+        'brightness': round(float(cv2.mean(gray)[0]), 2),
+        'clipped_pct': round(100.0 * clipped / gray.size, 3),
+    }
+
+
+class SharpnessMonitor:
+    """
+    Sigue la nitidez de una cámara durante el experimento.
+    La referencia es la mediana de las primeras BASELINE_SAMPLES capturas; update()
+    devuelve un mensaje de alerta al cruzar por debajo de la referencia * ratio
+    (una sola vez hasta que se recupere).
+    """
+
+    def __init__(self, ratio=SHARPNESS_ALERT_RATIO, samples=BASELINE_SAMPLES):
+        self.ratio = float(ratio)
+        self.samples = int(samples)
+        self.baseline = None
+        self._initial = []
+        self._alerting = False
+
+    def update(self, sharpness):
+        if self.baseline is None:
+            self._initial.append(sharpness)
+            if len(self._initial) >= self.samples:
+                self.baseline = float(np.median(self._initial))
+            return None
+
+        low = sharpness < self.baseline * self.ratio
+        if low and not self._alerting:
+            self._alerting = True
+            return (f"Nitidez {sharpness:.1f} por debajo del {int(self.ratio * 100)}% "
+                    f"de la referencia ({self.baseline:.1f}): posible desenfoque")
+        if not low:
+            self._alerting = False
+        return None
+
+    @property
+    def alerting(self):
+        return self._alerting
+
+
+def make_alert(cam_id, message, **extra):
+    alert = {'time': time.strftime("%Y-%m-%d %H:%M:%S"), 'cam_id': cam_id, 'message': message}
+    alert.update(extra)
+    return alert
@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import cv2
+
+from change_detector import frame_signature, signature_difference
+from camera_priority import PRIORITY_BACKGROUND
+
+
+class FrameRingBuffer:
+    """
+    Buffer circular de frames JPEG con límite de bytes y de antigüedad.
+    Al superar max_bytes se descartan los frames más viejos (el límite nunca se excede).
+    """
+
+    def __init__(self, max_bytes, max_seconds):
+        self.max_bytes = int(max_bytes)
+        self.max_seconds = float(max_seconds)
+        self._frames = deque()   # (timestamp, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def push(self, ts, data):
+        size = len(data)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            self._frames.append((ts, data))
+            self._bytes += size
+            while self._bytes > self.max_bytes or (ts - self._frames[0][0]) > self.max_seconds:
+                _, old = self._frames.popleft()
+                self._bytes -= len(old)
+        return True
+
+    def snapshot(self):
+        """Copia (superficial) de los frames actuales, del más viejo al más nuevo."""
+        with self._lock:
+            return list(self._frames)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._frames)
+
+
+class RingRecorder:
+    """
+    Hilo que muestrea una cámara a 'fps', comprime cada frame en JPEG y lo guarda en un
+    FrameRingBuffer. dump() escribe la ventana previa y los 'post_seconds' siguientes en
+    una carpeta de evento. Si trigger_threshold está definido, un cambio brusco entre
+    muestras consecutivas dispara dump() automáticamente (con enfriamiento).
+    Con captura en procesos guarda el JPEG de vista previa que genera el proceso de la
+    cámara (ancho y calidad de la vista en vivo; 'quality' no se aplica).
+    """
+
+    def __init__(self, camera_manager, cam_id, fps=5, seconds=10, max_bytes=8 * 1024 * 1024,
+                 quality=80, dump_dir=None, post_seconds=5, trigger_threshold=None):
+        self.camera_manager = camera_manager
+        self.cam_id = cam_id
+        self.fps = max(0.1, float(fps))
+        self.seconds = float(seconds)
+        self.quality = max(1, min(100, int(quality)))
+        self.dump_dir = dump_dir
+        self.post_seconds = float(post_seconds)
+        self.trigger_threshold = None if trigger_threshold is None else float(trigger_threshold)
+
+        self.buffer = FrameRingBuffer(max_bytes, seconds)
+        self.dumps = 0
+        self.last_dump = None     # carpeta del último evento
+        self._sinks = []          # [(deadline, folder)] volcados en curso (post-disparo)
+        self._sinks_lock = threading.Lock()
+        self._last_signature = None
+        self._last_trigger = 0.0
+
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    # ---------- Muestreo ----------
+    def _loop(self):
+        period = 1.0 / self.fps
+        next_t = time.time()
+        while self._running:
+            # Prioridad intermedia: cede el lock a las capturas de experimentos
+            frame, data = self._sample()
+            ts = time.time()
+            if frame is not None:
+                if data is not None:
+                    self.buffer.push(ts, data)
+                    self._feed_sinks(ts, data)
+                if self.trigger_threshold is not None:
+                    self._check_trigger(frame, ts)
+            next_t += period
+            delay = next_t - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_t = time.time()  # si nos atrasamos, no intentar recuperar
+
+    def _sample(self):
+        """
+        (frame, jpeg) de una muestra. Con captura en procesos se usa la vista previa que
+        el proceso de la cámara ya redujo y codificó; si no, se codifica acá.
+        """
+        cm = self.camera_manager
+        if cm.capture_processes:
+            ready = cm.grab_preview(self.cam_id, priority=PRIORITY_BACKGROUND)
+            return (ready[0], ready[1]) if ready else (None, None)
+        # El frame se codifica y se descarta en esta vuelta: basta la vista sin copiar
+        frame = cm.grab_frame(self.cam_id, priority=PRIORITY_BACKGROUND, view=True)
+        if frame is None:
+            return None, None
+        ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return frame, (buf.tobytes() if ok else None)
+
+    def _check_trigger(self, frame, ts):
+        signature = frame_signature(frame)
+        diff = signature_difference(signature, self._last_signature)
+        self._last_signature = signature
+        cooldown = self.seconds + self.post_seconds
+        if diff is not None and diff >= self.trigger_threshold and ts - self._last_trigger >= cooldown:
+            self._last_trigger = ts
+            try:
+                self.dump(reason=f"cambio {diff:.1f}")
+            except Exception as e:
+                print(f"[RingBuffer] Error en volcado automático cámara {self.cam_id}: {e}")
+
+    # ---------- Volcado ----------
+    def dump(self, out_dir=None, post_seconds=None, reason="api"):
+        """
+        Escribe los frames en memoria y los de los próximos post_seconds en
+        <out_dir>/Eventos/Microscopio<N>_<timestamp>/. Devuelve la carpeta del evento.
+        """
+        out_dir = out_dir or self.dump_dir
+        if not out_dir:
+            raise ValueError("No hay carpeta de destino para el volcado")
+        post = self.post_seconds if post_seconds is None else max(0.0, float(post_seconds))
+
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        folder = os.path.join(out_dir, "Eventos", f"Microscopio{self.cam_id}_{stamp}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, "evento.txt"), 'w') as f:
+            f.write(f"Cámara {self.cam_id} - {stamp} - motivo: {reason}\n")
+
+        frames = self.buffer.snapshot()
+        if post > 0:
+            with self._sinks_lock:
+                self._sinks.append((time.time() + post, folder))
+        # La escritura de la ventana previa no bloquea al llamador
+        threading.Thread(target=self._write_frames, args=(folder, frames), daemon=True).start()
+
+        self.dumps += 1
+        self.last_dump = folder
+        return folder
+
+    def _feed_sinks(self, ts, data):
+        with self._sinks_lock:
+            if not self._sinks:
+                return
+            active = [(deadline, folder) for deadline, folder in self._sinks if ts <= deadline]
+            self._sinks = active
+        for _, folder in active:
+            self._write_frames(folder, [(ts, data)])
+
+    @staticmethod
+    def _write_frames(folder, frames):
+        for ts, data in frames:
+            name = datetime.fromtimestamp(ts).strftime("%Y%m%d_%H%M%S_%f")[:-3] + ".jpg"
+            try:
+                with open(os.path.join(folder, name), 'wb') as f:
+                    f.write(data)
+            except Exception as e:
+                print(f"[RingBuffer] Error escribiendo {name}: {e}")
+
+    # ---------- Estado / cierre ----------
+    def status(self):
+        return {
+            'fps': self.fps,
+            'seconds': self.seconds,
+            'quality': self.quality,
+            'max_bytes': self.buffer.max_bytes,
+            'used_bytes': self.buffer.size_bytes,
+            'frames': len(self.buffer),
+            'trigger_threshold': self.trigger_threshold,
+            'post_seconds': self.post_seconds,
+            'dump_dir': self.dump_dir,
+            'dumps': self.dumps,
+            'last_dump': self.last_dump,
+        }
+
+    def stop(self):
+        self._running = False
+        self._thread.join(timeout=2.0)
+        self.buffer.clear()
@@ -0,0 +1,265 @@
+import threading
+import time
+from collections import OrderedDict
+
+from capture_timeline import CaptureTimeline
+from experiment import Experiment, resolve_camera_ids
+
+JOB_STATES = ("queued", "starting", "running", "finished", "cancelled", "error")
+# Experimentos terminados que se siguen listando en /experiments
+MAX_FINISHED_JOBS = 20
+# Período de revisión de la cola (arranques programados y cámaras liberadas)
+SCHEDULER_POLL_S = 0.5
+
+
+class ExperimentScheduler:
+    """
+    Ejecuta varios experimentos a la vez sobre cámaras distintas (o compartidas en modo
+    sólo lectura) y mantiene una cola de experimentos programados para más tarde.
+
+    - Arbitraje por cámara: una cámara pertenece a un único experimento exclusivo, o a
+      cualquier número de experimentos que pidieron compartirla (shared=True).
+    - Todos los experimentos usan la misma CaptureTimeline, así los ticks que coinciden
+      (LED + lecturas USB) se ejecutan de a uno.
+    - Experiment.start (preparar carpetas, cámaras y LED) puede tardar segundos: se corre
+      fuera del lock con las cámaras reservadas (estado 'starting'), así /status y
+      /experiments no esperan.
+    - Con un EventBus publica un evento 'experiment' en cada cambio de estado de un job
+      (y los experimentos publican sus 'tick').
+    """
+
+    def __init__(self, camera_manager, led_controller, dht_sensor, events=None):
+        self.camera_manager = camera_manager
+        self.led_controller = led_controller
+        self.dht_sensor = dht_sensor
+        self.events = events
+        self.timeline = CaptureTimeline()
+
+        self._jobs = OrderedDict()   # id -> job (dict)
+        self._lock = threading.RLock()
+        self._next_id = 1
+        # Experimento vacío para informar estado cuando todavía no se lanzó ninguno
+        self._idle = Experiment(camera_manager, led_controller, dht_sensor, timeline=self.timeline)
+
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="exp-scheduler")
+        self._thread.start()
+
+    # ================== API ==================
+    def submit(self, save_path, duration_sec, interval_sec, camera_ids=None, shared=False,
+               start_at=None, **options):
+        """
+        Crea un experimento y devuelve su job.
+        Sin start_at (epoch) arranca ya: RuntimeError si alguna cámara está ocupada y los
+        errores de Experiment.start (ValueError, InsufficientStorageError) se propagan.
+        Con start_at futuro queda en cola y arranca a esa hora en cuanto sus cámaras estén
+        libres; si entonces falla, el job queda en estado 'error'.
+        """
+        cams = resolve_camera_ids(self.camera_manager, camera_ids)
+        if not cams:
+            raise ValueError("No hay cámaras detectadas")
+        if shared and options.get('bracket'):
+            raise ValueError("El bracketing cambia el brillo del LED: no se puede compartir la cámara")
+
+        with self._lock:
+            exp = Experiment(self.camera_manager, self.led_controller, self.dht_sensor,
+                             timeline=self.timeline, events=self.events)
+            exp.experiment_id = self._next_id
+            job = {
+                'id': self._next_id,
+                'state': 'queued',
+                'experiment': exp,
+                'camera_ids': cams,
+                'shared': bool(shared),
+                'start_at': start_at,
+                'started_at': None,
+                'error': None,
+                'args': (save_path, duration_sec, interval_sec),
+                'options': options,
+            }
+            start_now = start_at is None or start_at <= time.time()
+            if start_now:
+                busy = self._conflicts(cams, shared)
+                if busy:
+                    raise RuntimeError(f"Cámaras ocupadas por otro experimento: {busy}")
+                job['state'] = "starting"   # reserva las cámaras mientras arranca
+            else:
+                self._set_state(job, "queued")
+            self._next_id += 1
+            self._jobs[job['id']] = job
+            self._prune()
+        if start_now:
+            try:
+                self._start_job(job)
+            except Exception:
+                # Arranque inmediato fallido: el job no queda registrado y se liberan las cámaras
+                with self._lock:
+                    self._jobs.pop(job['id'], None)
+                raise
+        self._wake.set()
+        return job
+
+    def stop(self, experiment_id=None):
+        """
+        Detiene un experimento (o cancela uno en cola). Sin id detiene todos los que
+        corren y vacía la cola. Devuelve los ids afectados (KeyError si el id no existe).
+        """
+        with self._lock:
+            if experiment_id is None:
+                jobs = [j for j in self._jobs.values()
+                        if j['state'] in ("queued", "starting", "running")]
+            else:
+                jobs = [self._jobs[int(experiment_id)]]
+            to_stop = []
+            for job in jobs:
+                if job['state'] == "queued":
+                    self._set_state(job, "cancelled")
+                elif job['state'] == "starting":
+                    job['stopping'] = True   # _start_job lo detiene en cuanto termine de arrancar
+                elif job['state'] == "running":
+                    job['stopping'] = True   # _step no lo da por terminado antes que stop()
+                    to_stop.append(job)
+        # Fuera del lock: stop() espera a que termine el tick en curso
+        for job in to_stop:
+            job['experiment'].stop()
+            self._set_state(job, "finished")
+        return [j['id'] for j in jobs]
+
+    def get(self, experiment_id):
+        with self._lock:
+            return self._jobs.get(int(experiment_id))
+
+    def running(self):
+        """Experimentos en ejecución."""
+        with self._lock:
+            return [j['experiment'] for j in self._jobs.values()
+                    if j['state'] == "running" and j['experiment'].running]
+
+    def current(self):
+        """Último experimento en ejecución, o el último lanzado (o uno vacío si no hubo)."""
+        with self._lock:
+            started = [j for j in self._jobs.values() if j['started_at'] is not None]
+        for job in reversed(started):
+            if job['experiment'].running:
+                return job['experiment']
+        return started[-1]['experiment'] if started else self._idle
+
+    def busy_cameras(self, camera_ids=None):
+        """Cámaras (de camera_ids o de todas) usadas por algún experimento en ejecución."""
+        cams = resolve_camera_ids(self.camera_manager, camera_ids)
+        with self._lock:
+            return self._conflicts(cams, shared=False)
+
+    def list_jobs(self):
+        with self._lock:
+            return [self.job_info(j) for j in self._jobs.values()]
+
+    def job_info(self, job):
+        info = {
+            'experiment_id': job['id'],
+            'state': job['state'],
+            'camera_ids': job['camera_ids'],
+            'shared': job['shared'],
+            'start_at': job['start_at'],
+            'started_at': job['started_at'],
+            'error': job['error'],
+            'save_path': job['args'][0],
+        }
+        if job['started_at'] is not None:
+            info.update(job['experiment'].status_info())
+        return info
+
+    # ================== Internos ==================
+    def _conflicts(self, cams, shared):
+        """Cámaras de 'cams' que no se pueden usar por estar tomadas por otro experimento."""
+        busy = set()
+        for job in self._jobs.values():
+            if job['state'] == "running" and not job['experiment'].running:
+                continue
+            if job['state'] not in ("starting", "running"):
+                continue
+            if shared and job['shared']:
+                continue  # ambos aceptan compartir
+            busy.update(set(cams) & set(job['camera_ids']))
+        return sorted(busy)
+
+    def _set_state(self, job, state, error=None):
+        job['state'] = state
+        if error is not None:
+            job['error'] = error
+        if self.events:
+            exp = job['experiment']
+            self.events.publish("experiment", {
+                'experiment_id': job['id'],
+                'state': state,
+                'camera_ids': job['camera_ids'],
+                'save_path': job['args'][0],
+                'start_at': job['start_at'],
+                'started_at': job['started_at'],
+                'error': job['error'],
+                'stop_reason': exp.stop_reason,
+                'captures_stored': exp.captures_stored,
+                'captures_failed': exp.captures_failed,
+            })
+
+    def _start_job(self, job):
+        """
+        Arranca un job ya reservado (estado 'starting'). Se llama sin el lock tomado;
+        si start() falla la excepción se propaga y quien llama libera la reserva.
+        """
+        save_path, duration_sec, interval_sec = job['args']
+        job['experiment'].start(save_path, duration_sec, interval_sec,
+                                camera_ids=job['camera_ids'], **job['options'])
+        with self._lock:
+            job['started_at'] = time.time()
+            self._set_state(job, "running")
+            stop_requested = job.get('stopping')
+        if stop_requested:
+            # Se pidió detenerlo mientras arrancaba
+            job['experiment'].stop()
+            self._set_state(job, "finished")
+
+    def _prune(self):
+        done = [i for i, j in self._jobs.items() if j['state'] in ("finished", "cancelled", "error")]
+        for job_id in done[:max(0, len(done) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _loop(self):
+        while True:
+            self._wake.wait(SCHEDULER_POLL_S)
+            self._wake.clear()
+            try:
+                self._step()
+            except Exception as e:
+                print(f"[Scheduler] Error: {e}")
+
+    def _step(self):
+        now = time.time()
+        with self._lock:
+            for job in self._jobs.values():
+                if job['state'] == "running" and not job['experiment'].running \
+                        and not job.get('stopping'):
+                    error = job['experiment'].error
+                    self._set_state(job, "error" if error else "finished", error)
+
+            # Arranca los programados que ya vencieron, en orden de hora de inicio
+            due = sorted((j for j in self._jobs.values()
+                          if j['state'] == "queued" and (j['start_at'] or 0) <= now),
+                         key=lambda j: j['start_at'] or 0)
+            to_start = []
+            for job in due:
+                if self._conflicts(job['camera_ids'], job['shared']):
+                    continue  # sigue en cola hasta que se liberen sus cámaras
+                job['state'] = "starting"
+                to_start.append(job)
+            self._prune()
+
+        # Fuera del lock: start() prepara cámaras y LED y puede tardar segundos
+        for job in to_start:
+            try:
+                self._start_job(job)
+                print(f"[Scheduler] Experimento {job['id']} iniciado")
+            except Exception as e:
+                with self._lock:
+                    self._set_state(job, "error", str(e))
+                print(f"[Scheduler] Experimento {job['id']} no pudo iniciar: {e}")
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+from utils import get_raspberry_status
+
+# Campos de cada muestra, en el orden en que se guardan en el historial
+METRIC_FIELDS = ('temperature_c', 'cpu_percent', 'cpu_freq_mhz', 'ram_used_mb',
+                 'ram_total_mb', 'disk_used_gb', 'disk_free_gb')
+HISTORY_COLUMNS = ('seq', 'timestamp') + METRIC_FIELDS
+# Máximo de muestras devueltas por consulta de historial
+HISTORY_MAX_LIMIT = 5000
+
+
+class MetricsCollector:
+    """
+    Muestrea el sistema en un hilo a intervalo fijo y guarda las últimas muestras.
+    /status devuelve latest() sin medir nada en el request. Cada muestra se guarda
+    como tupla (seq, timestamp, *METRIC_FIELDS) para que el historial ocupe poco.
+    """
+
+    def __init__(self, interval_s=5.0, history=720, disk_path='/', events=None):
+        self.interval_s = float(interval_s)
+        self.disk_path = disk_path
+        # EventBus opcional: cada muestra se publica como evento 'metrics' (el bus sólo
+        # conserva la última)
+        self.events = events
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=max(1, int(history)))
+        self.seq = 0
+        self.errors = 0
+        self.last_error = None
+        self._latest = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.sample()  # primera muestra (cpu_percent arranca su medición acá)
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="metrics")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self.sample()
+
+    def sample(self):
+        try:
+            values = get_raspberry_status(self.disk_path)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            return None
+        now = time.time()
+        with self._lock:
+            self.seq += 1
+            row = (self.seq, now) + tuple(values.get(f) for f in METRIC_FIELDS)
+            self._history.append(row)
+            self._latest = dict(values, seq=self.seq, timestamp=now)
+            sample = dict(self._latest)
+        if self.events:
+            self.events.publish("metrics", sample)
+        return sample
+
+    def latest(self):
+        """Última muestra (copia); None si todavía no se tomó ninguna."""
+        with self._lock:
+            return dict(self._latest) if self._latest else None
+
+    def history(self, since=0, limit=HISTORY_MAX_LIMIT, fields=None):
+        """
+        Muestras con seq > since, de la más vieja a la más nueva, en columnas
+        ({campo: [valores]}) para no repetir nombres en cada punto. Con 'limit' se
+        devuelven las primeras y 'more' indica que hay que volver a pedir desde 'last_seq'.
+        'gap' avisa que el historial ya descartó muestras posteriores a 'since';
+        'reset' que 'since' es de una ejecución anterior del servidor y se respondió desde 0.
+        """
+        fields = list(fields) if fields else list(METRIC_FIELDS)
+        unknown = [f for f in fields if f not in METRIC_FIELDS]
+        if unknown:
+            raise ValueError(f"Campos desconocidos: {', '.join(unknown)}")
+        limit = max(1, min(int(limit), HISTORY_MAX_LIMIT))
+        since = max(0, int(since))
+        with self._lock:
+            reset = since > self.seq
+            if reset:
+                since = 0
+            oldest = self._history[0][0] if self._history else self.seq + 1
+            # Los seq son consecutivos: la posición de la primera muestra nueva es directa
+            start = max(0, since - oldest + 1)
+            rows = list(islice(self._history, start, start + limit + 1))
+            latest_seq = self.seq
+        more = len(rows) > limit
+        rows = rows[:limit]
+        wanted = [HISTORY_COLUMNS.index(f) for f in ('seq', 'timestamp', *fields)]
+        columns = {HISTORY_COLUMNS[i]: [row[i] for row in rows] for i in wanted}
+        return {
+            'since': since,
+            'count': len(rows),
+            'last_seq': rows[-1][0] if rows else since,
+            'latest_seq': latest_seq,
+            'more': more,
+            'gap': since + 1 < oldest and since > 0,
+            'reset': reset,
+            'interval_s': self.interval_s,
+            'columns': columns,
+        }
+
+    def status(self):
+        with self._lock:
+            return {
+                'interval_s': self.interval_s,
+                'samples': len(self._history),
+                'capacity': self._history.maxlen,
+                'seq': self.seq,
+                'errors': self.errors,
+                'last_error': self.last_error,
+            }
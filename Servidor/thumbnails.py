@@ -0,0 +1,49 @@
+import os
+
+import cv2
+
+from image_storage import resize_to_width
+
+# Pirámide de miniaturas junto a las capturas de cada Microscopio<N>
+THUMB_DIR = "thumbs"      # miniatura para galerías
+MID_DIR = "previews"      # vista intermedia opcional
+THUMB_WIDTH = 160
+MID_WIDTH = 640
+THUMB_QUALITY = 75
+
+SIZES = {
+    "thumb": (THUMB_DIR, THUMB_WIDTH),
+    "mid": (MID_DIR, MID_WIDTH),
+}
+
+
+def thumbnail_path(cam_folder, timestamp, size="thumb"):
+    """Ruta de la miniatura de la captura 'timestamp' dentro de la carpeta de la cámara."""
+    folder, _ = SIZES[size]
+    return os.path.join(cam_folder, folder, f"{timestamp}.jpg")
+
+
+def thumbnail_for_image(image_path, size="thumb"):
+    """Ruta de la miniatura correspondiente a una imagen suelta (Microscopio<N>/<ts>.<ext>)."""
+    cam_folder, name = os.path.split(image_path)
+    return thumbnail_path(cam_folder, os.path.splitext(name)[0], size)
+
+
+def write_jpeg(img, path, quality=THUMB_QUALITY):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+
+
+def make_thumbnail(image_path, size="thumb"):
+    """
+    Genera (bajo demanda) la miniatura de una imagen ya guardada, p.ej. de corridas
+    anteriores a la generación automática. Devuelve la ruta o None si no se pudo.
+    """
+    img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    out_path = thumbnail_for_image(image_path, size)
+    _, width = SIZES[size]
+    if not write_jpeg(resize_to_width(img, width), out_path):
+        return None
+    return out_path
@@ -0,0 +1,85 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from frame_pack import FramePack
+from image_storage import resize_to_width
+
+# Carpeta oculta dentro de Microscopio<N> con el time-lapse reducido de la corrida
+PREVIEW_DIR = ".preview"
+TIMELAPSE_WIDTH = 320
+TIMELAPSE_QUALITY = 70
+
+
+def preview_base_path(experiment_path, cam_id):
+    return os.path.join(experiment_path, f"Microscopio{cam_id}", PREVIEW_DIR, "preview")
+
+
+class TimelapsePreview:
+    """
+    Time-lapse de baja resolución de una cámara, construido de forma incremental:
+    cada captura guardada agrega un frame reducido a un FramePack, sin reescanear nada.
+    """
+
+    def __init__(self, experiment_path, cam_id, width=TIMELAPSE_WIDTH, quality=TIMELAPSE_QUALITY):
+        self.width = int(width)
+        self.quality = int(quality)
+        # Sin fsync: la vista previa se puede regenerar, no vale la pena el costo en la SD
+        self.pack = FramePack(preview_base_path(experiment_path, cam_id), mode="a", fsync=False)
+
+    def append(self, frame, small=None):
+        """Agrega un frame (o su versión ya reducida 'small')."""
+        if small is None:
+            small = resize_to_width(frame, self.width)
+        ok, buf = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if ok:
+            self.pack.append(buf.tobytes(), time.time())
+
+    def close(self):
+        self.pack.close()
+
+
+def open_preview(experiment_path, cam_id):
+    """Abre el time-lapse de una cámara para lectura (FileNotFoundError si no existe)."""
+    return FramePack(preview_base_path(experiment_path, cam_id), mode="r")
+
+
+def mjpeg_frames(pack, fps=10, start=0):
+    """Genera el time-lapse como stream multipart MJPEG (una pasada, luego termina)."""
+    delay = 1.0 / max(0.1, float(fps))
+    for i in range(max(0, int(start)), len(pack)):
+        data, _ = pack.read(i)
+        yield (b'--frame\r\n'
+               b'Content-Type: image/jpeg\r\n\r\n' + data + b'\r\n')
+        time.sleep(delay)
+
+
+def build_strip(pack, last=20, cols=10, quality=TIMELAPSE_QUALITY):
+    """
+    Hoja de contacto JPEG con los últimos 'last' frames en una grilla de 'cols' columnas.
+    Devuelve bytes o None si no hay frames.
+    """
+    n = len(pack)
+    indices = range(max(0, n - int(last)), n)
+    tiles = []
+    for i in indices:
+        data, _ = pack.read(i)
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is not None:
+            tiles.append(img)
+    if not tiles:
+        return None
+
+    th, tw = tiles[-1].shape[:2]
+    cols = max(1, min(int(cols), len(tiles)))
+    rows = (len(tiles) + cols - 1) // cols
+    sheet = np.zeros((rows * th, cols * tw, 3), dtype=np.uint8)
+    for k, img in enumerate(tiles):
+        if img.shape[:2] != (th, tw):
+            img = cv2.resize(img, (tw, th), interpolation=cv2.INTER_AREA)
+        r, c = divmod(k, cols)
+        sheet[r * th:(r + 1) * th, c * tw:(c + 1) * tw] = img
+    ok, buf = cv2.imencode('.jpg', sheet, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return buf.tobytes() if ok else None
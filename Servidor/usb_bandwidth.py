@@ -0,0 +1,75 @@
+import math
+
+# Bytes por píxel transferidos según el formato negociado. MJPG es una estimación
+# conservadora (~1/7 de YUYV); el tamaño real depende de la escena.
+FORMAT_BYTES_PER_PIXEL = {
+    "YUYV": 2.0, "YUY2": 2.0, "UYVY": 2.0,
+    "RGB3": 3.0, "BGR3": 3.0,
+    "GREY": 1.0,
+    "NV12": 1.5, "YU12": 1.5,
+    "MJPG": 0.3,
+    "H264": 0.05,
+}
+COMPRESSED_FOURCC = "MJPG"
+
+# Valores supuestos cuando el driver no informa formato o FPS
+DEFAULT_FOURCC = "YUYV"
+DEFAULT_FPS = 30.0
+
+# FPS mínimo al que el planificador puede bajar cada perfil
+MIN_FPS = {"preview": 5, "capture": 2}
+DEFAULT_MIN_FPS = 5
+
+
+def stream_bytes_per_s(fourcc, width, height, fps):
+    bpp = FORMAT_BYTES_PER_PIXEL.get((fourcc or DEFAULT_FOURCC).upper(), 2.0)
+    return int(width * height * bpp * (fps or DEFAULT_FPS))
+
+
+def plan_bus(modes, budget_bytes_per_s, min_fps=DEFAULT_MIN_FPS):
+    """
+    Ajusta los modos de las cámaras que comparten el bus para que entren en el presupuesto.
+    modes: {cam_id: {'fourcc', 'width', 'height', 'fps'}}
+    Pasos, en orden, hasta que entre:
+      1) MJPG en las cámaras sin comprimir (de mayor a menor consumo)
+      2) bajar los FPS de todas en proporción, sin pasar de min_fps
+    Devuelve el plan con los modos elegidos, los cambios y si sigue sobresuscrito.
+    """
+    chosen = {cam_id: dict(mode) for cam_id, mode in modes.items()}
+
+    def usage(mode):
+        return stream_bytes_per_s(mode['fourcc'], mode['width'], mode['height'], mode['fps'])
+
+    def total():
+        return sum(usage(m) for m in chosen.values())
+
+    requested = total()
+    actions = []
+    for cam_id in sorted(chosen, key=lambda c: usage(chosen[c]), reverse=True):
+        if total() <= budget_bytes_per_s:
+            break
+        mode = chosen[cam_id]
+        if (mode['fourcc'] or DEFAULT_FOURCC).upper() != COMPRESSED_FOURCC:
+            actions.append({'cam_id': cam_id, 'change': 'fourcc',
+                            'from': mode['fourcc'], 'to': COMPRESSED_FOURCC})
+            mode['fourcc'] = COMPRESSED_FOURCC
+
+    current = total()
+    if current > budget_bytes_per_s:
+        factor = budget_bytes_per_s / float(current)
+        for cam_id, mode in chosen.items():
+            fps = max(min_fps, math.floor((mode['fps'] or DEFAULT_FPS) * factor))
+            if fps < (mode['fps'] or DEFAULT_FPS):
+                actions.append({'cam_id': cam_id, 'change': 'fps', 'from': mode['fps'], 'to': fps})
+                mode['fps'] = fps
+
+    final = total()
+    return {
+        'budget_bytes_per_s': int(budget_bytes_per_s),
+        'requested_bytes_per_s': requested,
+        'planned_bytes_per_s': final,
+        'utilization_pct': round(100.0 * final / budget_bytes_per_s, 1) if budget_bytes_per_s else None,
+        'oversubscribed': final > budget_bytes_per_s,
+        'cameras': {cam_id: dict(mode, bytes_per_s=usage(mode)) for cam_id, mode in chosen.items()},
+        'actions': actions,
+    }
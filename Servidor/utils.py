@@ -1,16 +1,33 @@
 import psutil
-import subprocess
 
-def get_raspberry_status():
-    # Temperatura CPU
+# Temperatura de la CPU y frecuencia actual expuestas por el kernel (sin lanzar vcgencmd)
+THERMAL_ZONE_PATH = "/sys/class/thermal/thermal_zone0/temp"
+CPU_FREQ_PATH = "/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq"
+
+
+def _read_sysfs_int(path):
     try:
-        temp_str = subprocess.check_output(['vcgencmd', 'measure_temp']).decode()
-        temp_c = float(temp_str.replace("temp=","").replace("'C\n",""))
-    except Exception:
-        temp_c = None
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def get_raspberry_status(disk_path='/'):
+    """
+    Muestra puntual del sistema. No bloquea: cpu_percent(interval=None) mide el uso
+    desde la llamada anterior (la primera devuelve 0.0), por eso conviene llamarla a
+    intervalos regulares (ver system_metrics.MetricsCollector).
+    """
+    # Temperatura CPU (miligrados en sysfs)
+    milli_c = _read_sysfs_int(THERMAL_ZONE_PATH)
+    temp_c = round(milli_c / 1000.0, 1) if milli_c is not None else None
+
+    # Frecuencia actual (kHz en sysfs): baja cuando la Pi limita por temperatura
+    freq_khz = _read_sysfs_int(CPU_FREQ_PATH)
 
     # CPU %
-    cpu_percent = psutil.cpu_percent(interval=1)
+    cpu_percent = psutil.cpu_percent(interval=None)
 
     # RAM
     mem = psutil.virtual_memory()
@@ -18,13 +35,14 @@ def get_raspberry_status():
     ram_total = mem.total / (1024 * 1024)  # MB
 
     # Disco
-    disk = psutil.disk_usage('/')
+    disk = psutil.disk_usage(disk_path)
     disk_free_gb = disk.free / (1024 * 1024 * 1024)  # GB
     disk_used_gb = disk.used / (1024 * 1024 * 1024)  # GB
 
     return {
         'temperature_c': temp_c,
         'cpu_percent': cpu_percent,
+        'cpu_freq_mhz': round(freq_khz / 1000.0) if freq_khz is not None else None,
         'ram_used_mb': round(ram_used,2),
         'ram_total_mb': round(ram_total,2),
         'disk_used_gb': round(disk_used_gb,2),